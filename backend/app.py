@@ -1,19 +1,29 @@
-from flask import Flask, redirect, request, session, jsonify # type: ignore
+from flask import Flask, Response, redirect, request, session, jsonify, stream_with_context # type: ignore
 from google_auth_oauthlib.flow import Flow # type: ignore
-from googleapiclient.discovery import build # type: ignore
 from google.oauth2.credentials import Credentials # type: ignore
 from email.mime.text import MIMEText
 from email.utils import parseaddr
 from dotenv import load_dotenv # type: ignore
 from flask_cors import CORS # type: ignore
 
-from src.email_analyzer import analyze_email
-from src.smart_reply import suggest_reply
-from utils.db import init_db, save_email, get_email_body
+from src.email_analyzer import analyze_emails, analysis_cache, SUMMARY_BATCH_SIZE
+from src.smart_reply import suggest_reply, stream_reply
+from src.key_manager import key_manager
+from src.model_registry import registry
+from src.nlp_service import nlp_service
+from src.fetch_pipeline import TokenBucket
+from src.gmail_client import GmailClient
+from src.job_queue import JobQueue
+from src.inbox_sync import sync_inbox, commit_sync
+from utils.db import (init_db, save_emails, get_email_body, get_emails_from_db, claim_pending_analysis,
+                      set_pending_emails, get_pending_analysis, release_pending_analysis)
 
 import os
+import json
 import time
 import base64
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
 load_dotenv()
 init_db()
 
@@ -90,6 +100,7 @@ def auth_callback():
         "client_secret": credentials.client_secret,
         "scopes": credentials.scopes
     }
+    session.pop("user_id", None)
     frontend_url = os.getenv("REACT_APP_FRONTEND_URL", "http://localhost:3000")
     return redirect(f"{frontend_url}/emails")
 
@@ -98,6 +109,109 @@ def auth_callback():
 # backend/app.py (only fetch_emails route updated)
 PRIORITY_ORDER = {"High": 0, "Medium": 1, "Low": 2}  # for sorting
 
+# Analysis runs on the background job queue; chunks of one inbox sync are
+# analyzed on ANALYZE_WORKERS threads and the token bucket keeps the LLM
+# request rate inside the quota.
+ANALYZE_WORKERS = int(os.getenv("ANALYZE_WORKERS", "2"))
+ANALYSIS_CHUNK = int(os.getenv("ANALYSIS_CHUNK", str(SUMMARY_BATCH_SIZE)))
+analysis_rate_limiter = TokenBucket(
+    rate=float(os.getenv("ANALYSIS_RATE_PER_SEC", "0.25")),
+    capacity=int(os.getenv("ANALYSIS_BURST", "5"))
+)
+analysis_jobs = JobQueue(label="AnalysisJobs")
+STREAM_POLL_SEC = 0.5
+STREAM_HEARTBEAT_SEC = 15
+
+
+def analyze_and_save(user_id, emails) -> list:
+    """Analyze parsed emails in one batch and write them to the local DB."""
+    analysis_results = analyze_emails([e["body"] for e in emails], rate_limiter=analysis_rate_limiter)
+    for email, analysis_result in zip(emails, analysis_results):
+        email.update({
+            "summary": analysis_result["summary"],
+            "priority": analysis_result["priority"],
+            "entities": analysis_result["entities"]
+        })
+    save_emails(user_id, emails)
+    return emails
+
+
+def run_analysis_job(job):
+    """Job body: analyze the pending emails chunk by chunk, saving each chunk as it completes."""
+    user_id, emails, history_id = job.payload["user_id"], job.payload["emails"], job.payload["history_id"]
+    chunks = [emails[i:i + ANALYSIS_CHUNK] for i in range(0, len(emails), ANALYSIS_CHUNK)]
+
+    def run_chunk(chunk):
+        try:
+            analyze_and_save(user_id, chunk)
+            job.advance(completed=len(chunk))
+            job.publish({"type": "analyzed", "emails": chunk})
+        except Exception as e:
+            print(f"[AnalysisJob] Error analyzing {len(chunk)} emails for {user_id}: {e}")
+            job.advance(failed=len(chunk))
+            job.publish({"type": "failed", "ids": [e["id"] for e in chunk]})
+        release_pending_analysis(user_id, [e["id"] for e in chunk])
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(ANALYZE_WORKERS, len(chunks)))) as pool:
+            list(pool.map(run_chunk, chunks))
+    finally:
+        release_pending_analysis(user_id, job_id=job.id)
+    # if anything failed, the historyId stays put so those messages are retried next time
+    commit_sync(user_id, job.id, history_id, ok=job.failed == 0 and job.payload["fetched_all"])
+
+
+def placeholder(email, job_id) -> dict:
+    """What the inbox shows for an email whose analysis is still running."""
+    return dict(email, summary="", priority="Pending", entities=[], status="pending", job_id=job_id)
+
+
+def start_inbox_analysis(client, user_id):
+    """
+    Sync the inbox, fetch new messages and queue their analysis.
+    Returns (placeholder rows for everything still being analyzed, active jobs as dicts).
+    Messages already claimed by a job (in any worker, see pending_analysis)
+    are not fetched or queued again.
+    """
+    # the job is created first: its id names this sync (see inbox_sync.commit_sync)
+    job = analysis_jobs.create(run_analysis_job, user_id=user_id, kind="inbox_analysis")
+    # also fails jobs of dead workers before this sync starts, so it retries their messages
+    active = [j for j in analysis_jobs.for_user(user_id, active_only=True) if j["id"] != job.id]
+    try:
+        message_ids, history_id = sync_inbox(client, user_id, job.id)
+    except Exception:
+        analysis_jobs.discard(job)
+        raise
+    queued = {mid: placeholder(email or {"id": mid}, job_id) for job_id, mid, email in get_pending_analysis(user_id)}
+    new_ids = [mid for mid in message_ids if mid not in queued]
+    # another worker may have claimed some of them since the lookup above
+    claimed = claim_pending_analysis(user_id, job.id, new_ids) if new_ids else []
+    if not claimed:
+        # nothing to analyze here; the historyId moves once the jobs in flight are done
+        analysis_jobs.discard(job)
+        commit_sync(user_id, job.id, history_id)
+        return list(queued.values()), active
+    try:
+        # one batch request per chunk; the chunks are fetched concurrently
+        emails = [parse_gmail_message(m) for m in client.fetch_messages(claimed)]
+    except Exception:
+        analysis_jobs.discard(job)
+        commit_sync(user_id, job.id, history_id, ok=False)
+        raise
+    set_pending_emails(user_id, emails)
+    job.total = len(emails)
+    job.payload = {
+        "user_id": user_id,
+        "emails": emails,
+        "history_id": history_id,
+        "fetched_all": len(emails) == len(claimed)
+    }
+    analysis_jobs.start(job)
+    active.append(job.to_dict())
+    for e in emails:
+        queued[e["id"]] = placeholder(e, job.id)
+    return list(queued.values()), active
+
 
 @app.route("/fetch_emails")
 def fetch_emails():
@@ -105,56 +219,118 @@ def fetch_emails():
     if not creds_data:
         return redirect("/login")
 
-    creds = Credentials(**creds_data)
-    service = build("gmail", "v1", credentials=creds)
+    client = GmailClient(Credentials(**creds_data))
+    user_id = get_user_id(client)
 
-    profile = service.users().getProfile(userId="me").execute()
-    user_id = profile.get("emailAddress", "unknown_user")
+    # only messages that are new since the last sync (and not analyzed yet) are
+    # fetched; their analysis runs in the background and they are returned as
+    # "Pending" placeholders until it lands in the DB
+    placeholders, jobs = start_inbox_analysis(client, user_id)
+    pending_ids = {p["id"] for p in placeholders}
+    emails = [e for e in get_emails_from_db(user_id, unread_only=True) if e["id"] not in pending_ids]
+    emails += placeholders
 
-    results = service.users().messages().list(
-        userId="me", labelIds=["UNREAD"], maxResults=5
-    ).execute()
-    messages = results.get("messages", [])
-
-    emails = []
-    for msg in messages:
-        try:
-            msg_data = service.users().messages().get(userId="me", id=msg["id"], format="full").execute()
-            headers = msg_data["payload"]["headers"]
+    # Sort emails by priority: High -> Medium -> Low -> Pending
+    emails_sorted = sorted(
+        emails, key=lambda e: PRIORITY_ORDER.get(e["priority"], 3))
 
-            subject = next((h["value"] for h in headers if h["name"] == "Subject"), "(No Subject)")
-            sender = next((h["value"] for h in headers if h["name"] == "From"), "(Unknown Sender)")
+    response = jsonify(emails_sorted)
+    if jobs:
+        response.headers["X-Analysis-Jobs"] = ",".join(j["id"] for j in jobs)
+    return response
 
-            payload = msg_data.get("payload", {})
-            body_text = extract_message_body(payload) or msg_data.get("snippet", "")
 
-            analysis_result = analyze_email(body_text)
+def sse(event, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
-            emails.append({
-                "id": msg["id"],
-                "threadId": msg_data.get("threadId"),
-                "subject": subject,
-                "from": sender,
-                "body": body_text,
-                "summary": analysis_result["summary"],
-                "priority": analysis_result["priority"],
-                "entities": analysis_result["entities"]
-            })
 
-            # Save email to local DB
-            save_email(user_id,emails[-1])
+def priority_order(emails) -> list:
+    return [e["id"] for e in sorted(emails, key=lambda e: PRIORITY_ORDER.get(e["priority"], 3))]
 
-            time.sleep(5)
 
-        except Exception as e:
-            time.sleep(5)
-            print(f"[FetchEmails] Error processing message {msg['id']}: {e}")
-
-    # Sort emails by priority: High -> Medium -> Low
-    emails_sorted = sorted(
-        emails, key=lambda e: PRIORITY_ORDER.get(e["priority"], 3))
+@app.route("/fetch_emails/stream")
+def fetch_emails_stream():
+    """
+    Streaming /fetch_emails (Server-Sent Events):
+    - `email`  one per email: cached ones right away, then each pending one
+               again as soon as its analysis lands
+    - `order`  the full id order (High -> Medium -> Low -> Pending) whenever it changes
+    - `failed` ids whose analysis failed (they stay Pending until the next sync)
+    - `done`   once nothing is left in flight
+    """
+    creds_data = session.get("credentials")
+    if not creds_data:
+        return redirect("/login")
 
-    return jsonify(emails_sorted)
+    client = GmailClient(Credentials(**creds_data))
+    user_id = get_user_id(client)
+    placeholders, jobs = start_inbox_analysis(client, user_id)
+    pending_ids = {p["id"] for p in placeholders}
+    cached = [e for e in get_emails_from_db(user_id, unread_only=True) if e["id"] not in pending_ids]
+
+    def generate():
+        rows = {}
+        for email in sorted(cached, key=lambda e: PRIORITY_ORDER.get(e["priority"], 3)) + placeholders:
+            rows[email["id"]] = email
+            yield sse("email", email)
+        order = priority_order(rows.values())
+        yield sse("order", order)
+
+        cursors = {job["id"]: 0 for job in jobs}
+        following = set(cursors)
+        last_sent = time.time()
+        while following:
+            for job_id in list(following):
+                # jobs may run in another gunicorn worker; analysis_jobs reads them from SQLite
+                events, active = analysis_jobs.wait_events(job_id, cursors[job_id],
+                                                           timeout=STREAM_POLL_SEC / len(jobs))
+                cursors[job_id] += len(events)
+                if not active:
+                    following.discard(job_id)
+                for event in events:
+                    if event["type"] == "analyzed":
+                        for email in event["emails"]:
+                            rows[email["id"]] = dict(email, status="done")
+                            yield sse("email", rows[email["id"]])
+                    else:
+                        yield sse("failed", {"ids": event["ids"], "job_id": job_id})
+                    last_sent = time.time()
+            new_order = priority_order(rows.values())
+            if new_order != order:
+                order = new_order
+                yield sse("order", order)
+            if time.time() - last_sent > STREAM_HEARTBEAT_SEC:
+                # SSE comment keeps proxies from closing an idle stream
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+        yield sse("done", {"count": len(rows), "jobs": [analysis_jobs.get(job_id) for job_id in cursors]})
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    user_id = session.get("user_id")
+    job = analysis_jobs.get(job_id, user_id=user_id) if user_id else None
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job)
+
+
+@app.route("/analysis_status")
+def analysis_status():
+    """Progress of the signed-in user's analysis jobs."""
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "not signed in"}), 401
+    jobs = analysis_jobs.for_user(user_id)
+    return jsonify({
+        "pending": sum(j["total"] - j["completed"] - j["failed"] for j in jobs if j["status"] in ("queued", "running")),
+        "jobs": sorted(jobs, key=lambda j: j["created_at"], reverse=True)
+    })
 
 # Step 4: Generate smart reply
 @app.route("/generate_reply", methods=["POST"])
@@ -163,11 +339,8 @@ def generate_reply():
     if not creds_data:
         return redirect("/login")
 
-    creds = Credentials(**creds_data)
-    service = build("gmail", "v1", credentials=creds)
-
-    profile = service.users().getProfile(userId="me").execute()
-    user_id = profile.get("emailAddress", "unknown_user")
+    client = GmailClient(Credentials(**creds_data))
+    user_id = get_user_id(client)
     data = request.get_json()
     message_id = data.get("message_id")
     if not message_id:
@@ -178,6 +351,11 @@ def generate_reply():
     if not message_body:
         return jsonify({"error": "message_body is required"}), 400
 
+    if data.get("stream") or request.args.get("stream"):
+        # tokens are relayed as they arrive (chunked transfer)
+        return Response(stream_with_context(stream_reply(message_body)),
+                        mimetype="text/plain", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
     try:
         # call your smart reply logic
         suggested = suggest_reply(message_body)
@@ -187,6 +365,44 @@ def generate_reply():
         return jsonify({"error": str(e)}), 500
 
 
+def signed_in_only(view):
+    """For the diagnostics routes: 401 unless the request has a signed-in session."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not session.get("credentials"):
+            return jsonify({"error": "not signed in"}), 401
+        return view(*args, **kwargs)
+    return wrapped
+
+
+@app.route("/key_stats")
+@signed_in_only
+def key_stats():
+    """Per-key usage, throttle and error counters (keys by position only)."""
+    return jsonify(key_manager.usage())
+
+
+@app.route("/cache_stats")
+@signed_in_only
+def cache_stats():
+    """Analysis cache hits per tier, misses and pruned entries (this worker)."""
+    return jsonify(analysis_cache.stats())
+
+
+@app.route("/model_status")
+@signed_in_only
+def model_status():
+    """Which models are loaded, how long each took, and any load errors."""
+    return jsonify(registry.report())
+
+
+@app.route("/nlp_status")
+@signed_in_only
+def nlp_status():
+    """NLP worker pool size, batches processed and in-process fallbacks."""
+    return jsonify(nlp_service.stats())
+
+
 # Step 5: Reply to an email
 @app.route("/reply_email", methods=["POST"])
 def reply_email():
@@ -198,11 +414,13 @@ def reply_email():
     if not creds_data:
         return redirect("/login")
 
-    creds = Credentials(**creds_data)
-    service = build("gmail", "v1", credentials=creds)
+    client = GmailClient(Credentials(**creds_data))
 
     # 1️⃣ Fetch the original message
-    original_msg = service.users().messages().get(userId="me", id=msg_id, format="metadata", metadataHeaders=["Subject", "From", "Message-ID"]).execute()
+    fetched = client.fetch_messages([msg_id], format="metadata", metadata_headers=["Subject", "From", "Message-ID"])
+    if not fetched:
+        return jsonify({"error": "message not found"}), 404
+    original_msg = fetched[0]
     headers = {h["name"]: h["value"] for h in original_msg["payload"]["headers"]}
 
     subject = headers.get("Subject", "(No Subject)")
@@ -224,17 +442,40 @@ def reply_email():
     raw_msg = base64.urlsafe_b64encode(reply.as_bytes()).decode()
 
     # 3️⃣ Send the message in the same thread
-    sent_msg = service.users().messages().send(
-        userId="me",
-        body={
-            "raw": raw_msg,
-            "threadId": thread_id
-        }
-    ).execute()
+    sent_msg = client.send_message(raw_msg, thread_id=thread_id)
 
     return jsonify({"status": "success", "sent_message_id": sent_msg["id"], "thread_id": thread_id})
 
 
+def get_user_id(client):
+    """Return the signed-in Gmail address, calling getProfile only once per session."""
+    user_id = session.get("user_id")
+    if not user_id:
+        profile = client.get_profile()
+        user_id = profile.get("emailAddress", "unknown_user")
+        session["user_id"] = user_id
+    return user_id
+
+
+def parse_gmail_message(msg_data):
+    """Turn a Gmail `format=full` message resource into the email dict the frontend expects."""
+    headers = msg_data["payload"]["headers"]
+
+    subject = next((h["value"] for h in headers if h["name"] == "Subject"), "(No Subject)")
+    sender = next((h["value"] for h in headers if h["name"] == "From"), "(Unknown Sender)")
+
+    payload = msg_data.get("payload", {})
+    body_text = extract_message_body(payload) or msg_data.get("snippet", "")
+
+    return {
+        "id": msg_data["id"],
+        "threadId": msg_data.get("threadId"),
+        "subject": subject,
+        "from": sender,
+        "body": body_text
+    }
+
+
 def extract_message_body(payload):
     """Recursively extract plain text content from a Gmail message payload."""
     if payload.get("mimeType") == "text/plain":
@@ -251,5 +492,23 @@ def extract_message_body(payload):
     return ""
 
 
+def create_app(prefork=False):
+    """
+    Return the app with its models warming up.
+    prefork=True is for a gunicorn master with preload_app (see wsgi.py):
+    models load before the workers fork so they share one copy, and NLP
+    runs in each worker on that copy rather than on a pool of its own.
+    Otherwise they (and the NLP worker pool) load on background threads
+    so startup stays fast.
+    """
+    if prefork:
+        registry.preload_for_fork()
+        nlp_service.prefork()
+    else:
+        registry.preload()
+        nlp_service.warm()
+    return app
+
+
 if __name__ == "__main__":
-    app.run(port=8000, debug=True)
+    create_app().run(port=8000, debug=True)
@@ -0,0 +1,103 @@
+# bench_worker_memory.py
+"""
+Per-worker memory of the gunicorn deployment, with and without pre-fork
+model loading. Linux only (reads /proc/<pid>/smaps_rollup).
+
+    python bench_worker_memory.py --workers 4
+
+"per-worker" starts gunicorn without preload_app, so every worker loads its
+own models; "prefork" uses gunicorn.conf.py. For each worker it reports RSS,
+PSS (shared pages split between the processes sharing them) and USS (pages
+only that worker holds); PSS/USS are what drop when models are shared.
+"PSS total" includes the master, which holds the shared copy in prefork mode.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import requests
+
+from src.model_registry import PRELOAD_MODELS
+
+MODES = {
+    # -c /dev/null: gunicorn would otherwise pick up ./gunicorn.conf.py
+    "per-worker": ["gunicorn", "-c", os.devnull, "app:create_app()", "--threads", "8"],
+    "prefork": ["gunicorn", "-c", "gunicorn.conf.py"]
+}
+
+
+def smaps_rollup(pid) -> dict:
+    """RSS, PSS and USS of one process in MB."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": fields.get("Rss", 0.0),
+        "pss": fields.get("Pss", 0.0),
+        "uss": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0)
+    }
+
+
+def children(pid) -> list:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(p) for p in f.read().split()]
+
+
+def wait_until_loaded(url, workers, timeout):
+    """Poll /model_status until the preloaded models are in (requests land on random workers)."""
+    deadline = time.time() + timeout
+    ready = 0
+    while time.time() < deadline and ready < workers * 3:
+        try:
+            status = requests.get(f"{url}/model_status", timeout=5).json()
+            pending = [n for n in PRELOAD_MODELS
+                       if n in status and not status[n]["loaded"] and not status[n]["error"]]
+            ready = ready + 1 if not pending else 0
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+
+
+def measure(mode, workers, port, timeout):
+    """Start gunicorn in `mode`; returns (master, [worker, ...]) memory once the models are in."""
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), PORT=str(port))
+    cmd = MODES[mode] + ["--workers", str(workers), "--bind", f"127.0.0.1:{port}"]
+    master = subprocess.Popen(cmd, env=env)
+    try:
+        wait_until_loaded(f"http://127.0.0.1:{port}", workers, timeout)
+        return smaps_rollup(master.pid), [smaps_rollup(pid) for pid in children(master.pid)]
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=int, default=180, help="seconds to wait for the models to load")
+    parser.add_argument("--mode", choices=list(MODES), action="append", help="default: both")
+    args = parser.parse_args()
+    if not sys.platform.startswith("linux"):
+        sys.exit("Needs /proc/<pid>/smaps_rollup (Linux)")
+
+    print(f"{'mode':<12}{'workers':>8}{'RSS/worker':>12}{'PSS/worker':>12}{'USS/worker':>12}{'PSS total':>11}")
+    for mode in args.mode or list(MODES):
+        master, stats = measure(mode, args.workers, args.port, args.timeout)
+        if not stats:
+            print(f"{mode:<12} no workers found")
+            continue
+        n = len(stats)
+        avg = {k: sum(s[k] for s in stats) / n for k in ("rss", "pss", "uss")}
+        total_pss = master["pss"] + sum(s["pss"] for s in stats)
+        print(f"{mode:<12}{n:>8}{avg['rss']:>10.0f}MB{avg['pss']:>10.0f}MB{avg['uss']:>10.0f}MB{total_pss:>9.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# gunicorn.conf.py
+# Usage: gunicorn -c gunicorn.conf.py
+import os
+
+wsgi_app = "wsgi:app"
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# gthread workers: a streaming response (/fetch_emails/stream) holds one thread, not the whole worker
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# Import the app (and load spaCy/VADER/NLTK) once in the master; workers
+# share those pages copy-on-write instead of each loading their own copy.
+# SQLite connections, the job queue threads and the Gemini client are all
+# created per process after the fork.
+preload_app = True
+
+# The NLP process pool is opt-in here. With NLP_WORKERS unset, every web
+# worker runs spaCy/VADER/TextRank in-process on the models shared from the
+# master, so NLP spreads over cores only as far as `workers` does. Set
+# NLP_WORKERS=N to give each web worker its own pool of N processes; those
+# start after the fork and load their own models (N extra copies per worker).
+
+
+def post_worker_init(worker):
+    # Whatever was not loaded before fork (the Gemini client) warms up per worker;
+    # so does the NLP pool when NLP_WORKERS is set (otherwise warm() does nothing)
+    from src.model_registry import registry
+    from src.nlp_service import nlp_service
+    registry.preload()
+    nlp_service.warm()
+
+
+def worker_exit(server, worker):
+    from src.nlp_service import nlp_service
+    nlp_service.shutdown()
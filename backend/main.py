@@ -1,10 +1,16 @@
 # main.py (at project root)
 from src.pre_processing import preprocess_email
-from src.thread_manager import add_to_thread, list_threads, update_thread_summary, update_thread_priority
-from src.priority_detection import detect_priority
-from src.thread_summarization import summarize_thread
+from src.thread_manager import (add_to_thread, update_thread_summary, update_thread_priority,
+                                get_thread_messages, init_threading, messages_col)
+from src.threading_engine import ensure_message_seq, messages_after
+from src.priority_detection import classify_priorities
+from src.thread_summarization import summarize_rolling
+from src.ingest import ingest, DEFAULT_BATCH_SIZE
+from src.thread_index import thread_index
+from src.thread_scheduler import NOT_READY, ThreadScheduler, ensure_scheduler_fields
 
 import os
+import argparse
 from dotenv import load_dotenv
 from pymongo import MongoClient
 from bson import ObjectId
@@ -39,36 +45,98 @@ def process_unread(limit=10):
         print("No emails with is_unread=True found. Mark 1-2 test emails as unread or insert sample emails.")
 
 
-def summarize_and_prioritize(limit=10):
-    threads = list_threads(limit=limit)
-    for t in threads:
-        messages = []
-        for m in sorted(t.get("messages", []), key=lambda x: x.get("date") or ""):
-            messages.append({
-                "sender": (m.get("from") or {}).get("name") or (m.get("from") or {}).get("email"),
-                "timestamp": str(m.get("date")),
-                "text": m.get("clean_message")
-            })
-        if not messages:
-            continue
-        print(
-            f"\n--- Summarizing thread: {t.get('subject')} (id={t.get('_id')}) ---")
-        try:
-            summary = summarize_thread(messages)
-        except Exception as e:
-            summary = f"Summarization failed: {e}"
-        update_thread_summary(t["_id"], summary)
-        try:
-            priority = detect_priority(summary)
-        except Exception as e:
-            priority = "Medium"
+def refresh_thread(t):
+    """
+    Bring one thread's summary up to date. Only the previous summary plus
+    the messages added since (the summary's high-water mark) go to the
+    model. Returns (done, new summary or None); done=False leaves the
+    thread dirty for a retry, done=NOT_READY for another look once a missing
+    message is stored. Priorities are set per drain, see prioritize_threads.
+    """
+    previous = t.get("summary")
+    hwm = (t.get("summary_hwm") or 0) if previous else 0
+    history = get_thread_messages(t["_id"])
+    # by number, not date or _id: a message stored late by another writer
+    # still comes after the mark
+    numbered = messages_after(history, hwm)
+    # messages after a gap wait for the missing one; look again until it is stored
+    complete = len(numbered) == sum(1 for m in history if (m.get("seq") or 0) > hwm)
+    done = True if complete else NOT_READY
+    if not numbered:
+        return done, None
+    new_ids = {m["_id"] for m in numbered}
+    new_messages = [m for m in history if m["_id"] in new_ids]
+    # older messages only serve to recognise quoted text; they are not resent
+    context = [{"text": m.get("clean_message")} for m in history if hwm and (m.get("seq") or 0) <= hwm]
+    messages = [{
+        "sender": (m.get("from") or {}).get("name") or (m.get("from") or {}).get("email"),
+        "timestamp": str(m.get("date")),
+        "text": m.get("clean_message")
+    } for m in new_messages]
+    print(
+        f"\n--- Summarizing thread: {t.get('subject')} (id={t.get('_id')}, "
+        f"{len(messages)} new message(s)) ---")
+    try:
+        summary = summarize_rolling(previous, messages, context=context)
+    except Exception as e:
+        # keep the previous summary and mark; the thread is retried later
+        print(f"Summarization failed: {e}")
+        return False, None
+    update_thread_summary(t["_id"], summary, as_of=t.get("last_updated"),
+                          high_water_mark=numbered[-1]["seq"])
+    print("Summary:\n", summary)
+    return done, summary
+
+
+def prioritize_threads(summarized):
+    """Classify every summary of a drain in one batch: [(thread doc, summary)]."""
+    try:
+        priorities = classify_priorities([summary for _, summary in summarized])
+    except Exception as e:
+        print(f"Priority detection failed: {e}")
+        priorities = ["Medium"] * len(summarized)
+    for (t, _), priority in zip(summarized, priorities):
         update_thread_priority(t["_id"], priority)
-        print("Summary:\n", summary)
-        print("Priority:", priority)
+        print(f"Priority for {t.get('subject')}:", priority)
 
 
-if __name__ == "__main__":
+scheduler = ThreadScheduler(threads_col, refresh_thread, prioritize_threads)
+
+
+def summarize_and_prioritize(limit=None):
+    """Refresh the threads that changed since they were last summarized, most urgent first."""
+    ensure_scheduler_fields(threads_col)
+    ensure_message_seq(threads_col, messages_col)
+    scheduler.drain(limit)
+    print("Scheduler:", scheduler.metrics())
+
+
+def run_pipeline():
     print("Starting test pipeline: process unread -> thread -> summarize -> priority")
+    init_threading()
     process_unread(limit=5)
-    summarize_and_prioritize(limit=10)
+    thread_index.save()
+    summarize_and_prioritize()
     print("\nDone.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SmartThread offline pipeline")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("pipeline", help="process unread -> thread -> summarize -> priority (default)")
+    sub.add_parser("scheduler", help="keep draining dirty threads (summary + priority) as mail arrives")
+    ingest_cmd = sub.add_parser("ingest", help="bulk-import a maildir or JSON dump")
+    ingest_cmd.add_argument("path", help="maildir root, JSON array or JSON-lines file (e.g. data/test_emails.json)")
+    ingest_cmd.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    ingest_cmd.add_argument("--workers", type=int, default=None, help="preprocessing processes (default: CPU count)")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        count = ingest(args.path, emails_col, threads_col, batch_size=args.batch_size, workers=args.workers)
+        print(f"\nImported {count} messages.")
+    elif args.command == "scheduler":
+        ensure_scheduler_fields(threads_col)
+        ensure_message_seq(threads_col, messages_col)
+        scheduler.run_forever()
+    else:
+        run_pipeline()
@@ -0,0 +1,127 @@
+# src/analysis_cache.py
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from utils.db import get_cached_analysis, save_cached_analysis, prune_cached_analysis
+
+CACHE_TTL_SEC = int(os.getenv("ANALYSIS_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "2048"))
+# Expired rows are deleted from SQLite on the first put and then every N puts
+CACHE_PRUNE_EVERY = int(os.getenv("ANALYSIS_CACHE_PRUNE_EVERY", "256"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_body(text: str) -> str:
+    """Collapse whitespace so re-fetched or re-wrapped copies hash the same."""
+    return _WHITESPACE_RE.sub(" ", text or "").strip()
+
+
+class AnalysisCache:
+    """
+    Two-tier cache for email analysis results.
+    - tier 1: in-process LRU with TTL (microsecond lookups)
+    - tier 2: the `analysis_cache` SQLite table, shared across workers and restarts
+    Keys are a SHA-256 of `version` plus the normalized body, so bumping the
+    version (new model, new rules) invalidates old entries.
+    Expired entries (including those of old versions) are pruned every
+    `prune_every` puts, so the table does not grow without bound.
+    """
+
+    def __init__(self, version: str, ttl=CACHE_TTL_SEC, max_entries=CACHE_MAX_ENTRIES,
+                 prune_every=CACHE_PRUNE_EVERY):
+        self.version = version
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prune_every = max(1, prune_every)
+        self._puts_until_prune = 1
+        self.pruned = 0
+        self._entries = OrderedDict()  # key -> (stored_at, result)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key_for(self, text: str) -> str:
+        payload = f"{self.version}\n{normalize_body(text)}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, text: str):
+        key = self.key_for(text)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        try:
+            result = get_cached_analysis(key, min_created_at=now - self.ttl)
+        except Exception as e:
+            print(f"[AnalysisCache] SQLite lookup failed: {e}")
+            result = None
+
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, result, now)
+        return result
+
+    def put(self, text: str, result: dict):
+        key = self.key_for(text)
+        now = time.time()
+        with self._lock:
+            self._remember(key, result, now)
+            self._puts_until_prune -= 1
+            due = self._puts_until_prune <= 0
+            if due:
+                self._puts_until_prune = self.prune_every
+        try:
+            save_cached_analysis(key, result, now)
+        except Exception as e:
+            print(f"[AnalysisCache] SQLite write failed: {e}")
+        if due:
+            self.prune()
+
+    def _remember(self, key, result, stored_at):
+        self._entries[key] = (stored_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def prune(self):
+        """Drop expired entries from both tiers."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for key in [k for k, (t, _) in self._entries.items() if t < cutoff]:
+                del self._entries[key]
+        try:
+            deleted = prune_cached_analysis(cutoff)
+        except Exception as e:
+            print(f"[AnalysisCache] SQLite prune failed: {e}")
+            return
+        with self._lock:
+            self.pruned += deleted
+        if deleted:
+            print(f"[AnalysisCache] Pruned {deleted} expired entries")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "pruned": self.pruned
+            }
@@ -0,0 +1,177 @@
+# src/date_resolver.py
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from dateutil.relativedelta import relativedelta  # type: ignore
+
+from src.model_registry import registry
+
+DATE_CACHE_SIZE = int(os.getenv("DATE_CACHE_SIZE", "4096"))
+# Same settings detect_priority always used; RELATIVE_BASE is added per call
+DATEPARSER_SETTINGS = {"PREFER_DATES_FROM": "future"}
+
+MONTHS = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3, "april": 4, "apr": 4,
+    "may": 5, "june": 6, "jun": 6, "july": 7, "jul": 7, "august": 8, "aug": 8,
+    "september": 9, "sept": 9, "sep": 9, "october": 10, "oct": 10, "november": 11, "nov": 11,
+    "december": 12, "dec": 12
+}
+WEEKDAYS = {
+    "monday": 0, "mon": 0, "tuesday": 1, "tue": 1, "tues": 1, "wednesday": 2, "wed": 2,
+    "thursday": 3, "thu": 3, "friday": 4, "fri": 4, "saturday": 5, "sat": 5, "sunday": 6, "sun": 6
+}
+NUMBERS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12
+}
+DAY_OFFSETS = {"today": 0, "tomorrow": 1, "yesterday": -1}
+UNITS = ("minute", "hour", "day", "week", "month", "year")
+
+_MONTH = "(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\.?"
+_DAY = r"(\d{1,2})(?:st|nd|rd|th)?"
+_YEAR = r"(?:,?\s(\d{4}))?"
+_ISO_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+_MONTH_DAY_RE = re.compile(_MONTH + r"\s" + _DAY + _YEAR)
+_DAY_MONTH_RE = re.compile(_DAY + r"\s" + _MONTH + _YEAR)
+_NUMBER = r"(\d+|" + "|".join(NUMBERS) + ")"
+_UNIT = "(" + "|".join(UNITS) + ")s?"
+_IN_RE = re.compile(r"(?:in\s)?" + _NUMBER + r"\s" + _UNIT)
+_AGO_RE = re.compile(_NUMBER + r"\s" + _UNIT + r"\sago")
+_NEXT_LAST_RE = re.compile(r"(next|last|this)\s(week|month|year)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize(text) -> str:
+    return _SPACE_RE.sub(" ", (text or "").lower()).strip().rstrip(".,;:!?")
+
+
+def _shift(base, amount, unit):
+    if unit in ("month", "year"):
+        return base + relativedelta(**{unit + "s": amount})
+    return base + timedelta(**{unit + "s": amount})
+
+
+def _calendar_date(year, month, day, base):
+    """Midnight of the date; without a year, the next one after `base` (as dateparser does)."""
+    try:
+        if year:
+            return datetime(int(year), month, int(day))
+        date = datetime(base.year, month, int(day))
+        return date if date > base else date.replace(year=base.year + 1)
+    except ValueError:
+        return None   # e.g. Jun 31 / Feb 29: leave it to dateparser
+
+
+def fast_resolve(text, base):
+    """
+    Resolve common formats without dateparser. Returns ("abs", datetime),
+    ("rel", delta from base), or None when the text is not a fast-path form.
+    Matches dateparser's PREFER_DATES_FROM=future results (see
+    tests/test_date_resolver.py).
+    """
+    if text in DAY_OFFSETS:
+        return "rel", timedelta(days=DAY_OFFSETS[text])
+    if text in WEEKDAYS:
+        # the next such day, a week ahead when it is today
+        ahead = (WEEKDAYS[text] - base.weekday()) % 7 or 7
+        return "abs", datetime(base.year, base.month, base.day) + timedelta(days=ahead)
+    m = _ISO_RE.fullmatch(text)
+    if m:
+        try:
+            return "abs", datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+        except ValueError:
+            return None
+    m = _MONTH_DAY_RE.fullmatch(text)
+    if m:
+        date = _calendar_date(m.group(3), MONTHS[m.group(1)], m.group(2), base)
+        return ("abs", date) if date else None
+    m = _DAY_MONTH_RE.fullmatch(text)
+    if m:
+        date = _calendar_date(m.group(3), MONTHS[m.group(2)], m.group(1), base)
+        return ("abs", date) if date else None
+    m = _IN_RE.fullmatch(text) or _AGO_RE.fullmatch(text)
+    if m:
+        n = NUMBERS.get(m.group(1)) or int(m.group(1))
+        if text.endswith(" ago"):
+            n = -n
+        return "rel", _shift(base, n, m.group(2)) - base
+    m = _NEXT_LAST_RE.fullmatch(text)
+    if m:
+        n = {"next": 1, "last": -1, "this": 0}[m.group(1)]
+        return "rel", _shift(base, n, m.group(2)) - base
+    return None
+
+
+class DateResolver:
+    """
+    dateparser.parse(text, RELATIVE_BASE=base, PREFER_DATES_FROM=future),
+    faster:
+    - common absolute/relative forms are handled by fast_resolve
+    - everything else goes to dateparser, cached per (normalized text, base):
+      its results may depend on the time of day too ("5pm" at 17:07 is
+      tomorrow), so they are not shared across bases
+    """
+
+    def __init__(self, maxsize=DATE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fast = 0
+
+    def _cached(self, key):
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def _store(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def _lookup(self, text, base):
+        """("abs", datetime) or ("rel", delta from base) or ("none", None)."""
+        value = fast_resolve(text, base)
+        if value is not None:
+            self.fast += 1
+            return value
+        # dateparser results are only reused for this exact base
+        key = (text, base)
+        value = self._cached(key)
+        if value is None:
+            parsed = registry.get("dateparser").parse(text, settings=dict(DATEPARSER_SETTINGS, RELATIVE_BASE=base))
+            value = ("abs", parsed) if parsed else ("none", None)
+            self._store(key, value)
+        return value
+
+    def resolve(self, text, base=None):
+        """The datetime `text` refers to, seen from `base` (default now), or None."""
+        return self.resolve_many([text], base)[0]
+
+    def resolve_many(self, texts, base=None) -> list:
+        """resolve() for every text (e.g. all DATE entities of a document), in order."""
+        base = base or datetime.now()
+        results = []
+        for text in texts:
+            norm = normalize(text)
+            kind, value = self._lookup(norm, base) if norm else ("none", None)
+            results.append(base + value if kind == "rel" else value)
+        return results
+
+    def stats(self) -> dict:
+        return {"size": len(self._cache), "hits": self.hits, "misses": self.misses, "fast_path": self.fast}
+
+
+# Create a single, shared resolver
+date_resolver = DateResolver()
+
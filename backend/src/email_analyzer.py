@@ -1,17 +1,41 @@
 import os
-import requests # type: ignore
+import re
 import json
-import time
+import threading
 from dotenv import load_dotenv # type: ignore
 
-from src.key_manager import key_manager
-from src.priority_detection_flask import detect_priority
-from src.text_rank_summarization import textrank_summary
-import google.generativeai as genai # type: ignore
+from src.nlp_service import nlp_service
+from src.analysis_cache import AnalysisCache
+from src.model_registry import registry
 
 # Load environment variables
 load_dotenv()
 
+SUMMARY_MODEL = "gemini-2.0-flash"
+# Bump when the summary prompt or the priority rules change, to invalidate cached results
+ANALYZER_VERSION = "2"
+
+analysis_cache = AnalysisCache(version=f"{ANALYZER_VERSION}:{SUMMARY_MODEL}")
+
+# Micro-batching: up to SUMMARY_BATCH_SIZE emails (and SUMMARY_BATCH_MAX_CHARS
+# of body text) share one Gemini request. Longer emails go on their own.
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "10"))
+SUMMARY_BATCH_MAX_CHARS = int(os.getenv("SUMMARY_BATCH_MAX_CHARS", "12000"))
+
+_JSON_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def _get_model():
+    """Configure the Gemini client and build the model once per process."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = registry.get("gemini").GenerativeModel(SUMMARY_MODEL)
+    return _model
 
 
 def analyze_email(text: str) -> dict:
@@ -19,19 +43,35 @@ def analyze_email(text: str) -> dict:
     Perform email analysis combining:
     1. LLM-based summarization
     2. NLP-based manual priority detection
+    Results are cached by normalized body, so duplicates skip both steps.
     """
-    # ---- Step 1: Summarize using LLM ----
-    summary = summarize_email(text)
+    return analyze_emails([text])[0]
 
-    # ---- Step 2: Manual Priority Detection (NER + Rules) ----
-    priority = detect_priority(text)
 
-    # ---- Step 3: Return unified output ----
-    return {
-        "summary": summary,
-        "priority": priority["priority"],
-        "entities": priority["entities"]
-    }
+def analyze_emails(texts, rate_limiter=None) -> list:
+    """
+    Batch version of analyze_email. Cached bodies are returned as-is; the rest
+    are summarized a few per Gemini request (taking a `rate_limiter` token per
+    request) and prioritized in batches on the NLP worker processes.
+    """
+    texts = list(texts)
+    results = [analysis_cache.get(t) for t in texts]
+    pending = [i for i, r in enumerate(results) if r is None]
+    if not pending:
+        return results
+
+    summaries = summarize_emails([texts[i] for i in pending], rate_limiter)
+    priorities = nlp_service.prioritize([texts[i] for i in pending])
+
+    for i, (summary, from_llm), priority in zip(pending, summaries, priorities):
+        results[i] = {
+            "summary": summary,
+            "priority": priority["priority"],
+            "entities": priority["entities"]
+        }
+        if from_llm:
+            analysis_cache.put(texts[i], results[i])
+    return results
 
 
 def summarize_email(text: str) -> str:
@@ -39,9 +79,94 @@ def summarize_email(text: str) -> str:
     Generate a short summary using Google Gemini API.
     Fallback gracefully to local TextRank summarization if API fails.
     """
+    return _summarize(text)[0]
+
+
+def summarize_emails(texts, rate_limiter=None) -> list:
+    """
+    Summarize many emails with as few Gemini requests as possible.
+    Returns [(summary, True if it came from the LLM)] in input order; only
+    the items Gemini did not answer fall back to TextRank.
+    """
+    results = []
+    for batch in _pack(texts):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        if len(batch) == 1:
+            results.append(_summarize(batch[0]))
+        else:
+            results.extend(_summarize_batch(batch))
+    return results
+
+
+def _pack(texts):
+    """Split texts (in order) into batches bounded by count and total size."""
+    batch, size = [], 0
+    for text in texts:
+        if batch and (len(batch) >= SUMMARY_BATCH_SIZE or size + len(text) > SUMMARY_BATCH_MAX_CHARS):
+            yield batch
+            batch, size = [], 0
+        batch.append(text)
+        size += len(text)
+    if batch:
+        yield batch
+
+
+def _batch_prompt(texts) -> str:
+    items = "\n\n".join(f'<email id="{i}">\n{text}\n</email>' for i, text in enumerate(texts))
+    return (
+        "You are an assistant that summarizes emails clearly and concisely. "
+        "For EACH email below, provide the key points and tone of the email in 2 sentences.\n"
+        'Return ONLY a JSON array with one object per email: [{"id": <email id>, "summary": "<summary>"}]\n\n'
+        f"{items}"
+    )
+
+
+def _parse_batch(text: str, count: int) -> dict:
+    """Map email index -> summary from the model's JSON; malformed items are skipped."""
+    try:
+        items = json.loads(_JSON_FENCE_RE.sub("", text.strip()))
+    except ValueError:
+        return {}
+    if isinstance(items, dict):
+        items = items.get("summaries") or items.get("items") or []
+    parsed = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            idx = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        summary = item.get("summary")
+        if 0 <= idx < count and isinstance(summary, str) and summary.strip():
+            parsed[idx] = summary.strip()
+    return parsed
+
+
+def _summarize_batch(texts) -> list:
+    parsed = {}
+    try:
+        response = _get_model().generate_content(
+            _batch_prompt(texts),
+            generation_config={"response_mime_type": "application/json"}
+        )
+        if response and hasattr(response, "text"):
+            parsed = _parse_batch(response.text, len(texts))
+    except Exception as e:
+        print(f"Gemini batch summarization failed: {e}. Falling back to TextRank.")
+    missing = len(texts) - len(parsed)
+    if parsed and missing:
+        print(f"Gemini batch answered {len(parsed)}/{len(texts)} emails; TextRank for the rest.")
+    fallback = iter(nlp_service.summarize([t for i, t in enumerate(texts) if i not in parsed]))
+    return [(parsed[i], True) if i in parsed else (next(fallback), False)
+            for i in range(len(texts))]
+
+
+def _summarize(text: str) -> tuple:
+    """Returns (summary, True if it came from the LLM)."""
     try:
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        model = genai.GenerativeModel("gemini-2.0-flash")
+        model = _get_model()
         prompt = (
             "You are an assistant that summarizes emails clearly and concisely."
             "Provide the key points and tone of the email in 2 sentences. \n\n"
@@ -50,10 +175,10 @@ def summarize_email(text: str) -> str:
         response = model.generate_content(prompt)
         
         if response and hasattr(response, "text"):
-            return response.text.strip()
+            return response.text.strip(), True
 
         print("Gemini response empty, failing back to TextRank.")
-        return textrank_summary(text)
+        return nlp_service.summarize([text])[0], False
     except Exception as e:
         print(f"Gemini API summarization failed: {e}. Falling back to TextRank.")
-        return textrank_summary(text)
+        return nlp_service.summarize([text])[0], False
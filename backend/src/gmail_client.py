@@ -0,0 +1,141 @@
+# src/gmail_client.py
+import copy
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from googleapiclient.discovery import build_from_document  # type: ignore
+from googleapiclient.discovery_cache import get_static_doc  # type: ignore
+from googleapiclient.errors import HttpError  # type: ignore
+
+# Gmail accepts up to 100 calls per batch but starts throttling parts above ~50
+BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+BATCH_WORKERS = int(os.getenv("GMAIL_BATCH_WORKERS", "4"))
+# Point at a local fake Gmail server for testing, e.g. http://127.0.0.1:8089/
+ROOT_URL = os.getenv("GMAIL_API_ROOT_URL")
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_discovery_doc = None
+_discovery_lock = threading.Lock()
+
+
+def get_discovery_document(root_url=None) -> str:
+    """
+    Return the Gmail v1 discovery document, loaded once per process.
+    If `root_url` is set the API (and batch endpoint) is rebased onto it.
+    """
+    global _discovery_doc
+    if _discovery_doc is None:
+        with _discovery_lock:
+            if _discovery_doc is None:
+                _discovery_doc = get_static_doc("gmail", "v1")
+    if not root_url:
+        return _discovery_doc
+    doc = copy.deepcopy(json.loads(_discovery_doc))
+    doc["rootUrl"] = root_url if root_url.endswith("/") else root_url + "/"
+    return json.dumps(doc)
+
+
+class GmailClient:
+    """
+    Thin Gmail access layer shared by the Flask routes.
+    - services are built from the cached discovery document (no network)
+    - one service per thread, since googleapiclient/httplib2 is not thread-safe
+    - messages are pulled through the batch endpoint, BATCH_SIZE per request
+    """
+
+    def __init__(self, credentials, root_url=ROOT_URL):
+        self.credentials = credentials
+        self.root_url = root_url
+        self._local = threading.local()
+
+    @property
+    def service(self):
+        if not hasattr(self._local, "service"):
+            self._local.service = build_from_document(
+                get_discovery_document(self.root_url),
+                credentials=self.credentials
+            )
+        return self._local.service
+
+    def get_profile(self) -> dict:
+        return self.service.users().getProfile(userId="me").execute()
+
+    def list_message_ids(self, label_ids=None, max_results=5) -> list:
+        results = self.service.users().messages().list(
+            userId="me", labelIds=label_ids or [], maxResults=max_results
+        ).execute()
+        return [m["id"] for m in results.get("messages", [])]
+
+    def list_history(self, start_history_id, history_types=None) -> tuple:
+        """
+        Page through users.history.list from `start_history_id`.
+        Returns (history records, latest mailbox historyId).
+        Raises HttpError 404 when the start id is too old to replay.
+        """
+        records = []
+        page_token = None
+        latest = start_history_id
+        while True:
+            kwargs = {"userId": "me", "startHistoryId": start_history_id}
+            if history_types:
+                kwargs["historyTypes"] = history_types
+            if page_token:
+                kwargs["pageToken"] = page_token
+            resp = self.service.users().history().list(**kwargs).execute()
+            records.extend(resp.get("history", []))
+            latest = resp.get("historyId", latest)
+            page_token = resp.get("nextPageToken")
+            if not page_token:
+                return records, latest
+
+    def fetch_messages(self, ids, format="full", metadata_headers=None) -> list:
+        """
+        Fetch messages by id using batch HTTP requests.
+        Returns message resources in the order of `ids`; messages that still
+        fail after one retry are logged and left out.
+        """
+        ids = list(ids)
+        if not ids:
+            return []
+        chunks = [ids[i:i + BATCH_SIZE] for i in range(0, len(ids), BATCH_SIZE)]
+        if len(chunks) == 1:
+            fetched = self._fetch_batch(chunks[0], format, metadata_headers)
+        else:
+            fetched = {}
+            with ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(chunks))) as pool:
+                for part in pool.map(lambda c: self._fetch_batch(c, format, metadata_headers), chunks):
+                    fetched.update(part)
+        return [fetched[i] for i in ids if i in fetched]
+
+    def _fetch_batch(self, ids, format, metadata_headers, retry=True) -> dict:
+        fetched = {}
+        retry_ids = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                fetched[request_id] = response
+            elif retry and isinstance(exception, HttpError) and exception.resp.status in RETRYABLE_STATUS:
+                retry_ids.append(request_id)
+            else:
+                print(f"[GmailClient] Error fetching message {request_id}: {exception}")
+
+        messages = self.service.users().messages()
+        batch = self.service.new_batch_http_request(callback=callback)
+        for msg_id in ids:
+            kwargs = {"userId": "me", "id": msg_id, "format": format}
+            if metadata_headers:
+                kwargs["metadataHeaders"] = metadata_headers
+            batch.add(messages.get(**kwargs), request_id=msg_id)
+        batch.execute()
+
+        if retry_ids:
+            fetched.update(self._fetch_batch(retry_ids, format, metadata_headers, retry=False))
+        return fetched
+
+    def send_message(self, raw_msg, thread_id=None) -> dict:
+        body = {"raw": raw_msg}
+        if thread_id:
+            body["threadId"] = thread_id
+        return self.service.users().messages().send(userId="me", body=body).execute()
@@ -0,0 +1,96 @@
+# src/inbox_sync.py
+import os
+
+from googleapiclient.errors import HttpError  # type: ignore
+
+from utils.db import (
+    get_history_id, get_cached_ids, set_unread, replace_unread_set, delete_emails,
+    begin_sync_checkpoint, finish_sync_checkpoint, delete_sync_checkpoint, advance_history_id
+)
+
+UNREAD = "UNREAD"
+# how many unread messages a full (re)sync pulls
+FULL_SYNC_LIMIT = int(os.getenv("FULL_SYNC_LIMIT", "5"))
+HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+
+
+def apply_history(records) -> dict:
+    """
+    Collapse history records into the final state of each touched message:
+    {message_id: "unread" | "read" | "deleted"}. Later records win.
+    """
+    state = {}
+    for record in records:
+        for added in record.get("messagesAdded", []):
+            msg = added.get("message", {})
+            state[msg["id"]] = "unread" if UNREAD in msg.get("labelIds", []) else "read"
+        for change in record.get("labelsAdded", []):
+            if UNREAD in change.get("labelIds", []):
+                state[change["message"]["id"]] = "unread"
+        for change in record.get("labelsRemoved", []):
+            if UNREAD in change.get("labelIds", []):
+                state[change["message"]["id"]] = "read"
+        for deleted in record.get("messagesDeleted", []):
+            state[deleted["message"]["id"]] = "deleted"
+    return state
+
+
+def full_sync(client, user_id) -> tuple:
+    """List the newest unread messages and make them the cached unread set."""
+    # read the historyId before listing so changes made meanwhile are replayed next time
+    history_id = client.get_profile().get("historyId")
+    unread_ids = client.list_message_ids(label_ids=[UNREAD], max_results=FULL_SYNC_LIMIT)
+    replace_unread_set(user_id, unread_ids)
+    return unread_ids, history_id
+
+
+def sync_inbox(client, user_id, sync_id) -> tuple:
+    """
+    Bring the local cache up to date with Gmail.
+    Returns (ids of unread messages that still need fetching and analysis,
+    historyId to store with `commit_sync` once they have been saved).
+    `sync_id` (the id of the job that analyzes them) names this sync until
+    commit_sync.
+
+    With a stored historyId only the deltas since the last sync are applied
+    (one history.list call when nothing changed); otherwise, or when Gmail
+    no longer has that history, falls back to a full unread listing.
+    Replaying the same deltas is harmless, so a failed run simply retries.
+    """
+    # registered before the stored historyId is read, so no other sync can
+    # move it past the messages this one is about to take on
+    begin_sync_checkpoint(user_id, sync_id)
+    try:
+        history_id = get_history_id(user_id)
+        if not history_id:
+            unread_ids, latest = full_sync(client, user_id)
+        else:
+            try:
+                records, latest = client.list_history(history_id, history_types=HISTORY_TYPES)
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                print(f"[InboxSync] historyId {history_id} expired for {user_id}, doing a full sync.")
+                unread_ids, latest = full_sync(client, user_id)
+            else:
+                state = apply_history(records)
+                unread_ids = [mid for mid, s in state.items() if s == "unread"]
+                delete_emails(user_id, [mid for mid, s in state.items() if s == "deleted"])
+                set_unread(user_id, [mid for mid, s in state.items() if s == "read"], False)
+                set_unread(user_id, unread_ids, True)
+        cached = get_cached_ids(user_id, unread_ids)
+    except Exception:
+        delete_sync_checkpoint(sync_id)
+        raise
+    return [mid for mid in unread_ids if mid not in cached], latest
+
+
+def commit_sync(user_id, sync_id, history_id, ok=True):
+    """
+    Finish sync `sync_id`; ok=False when some of its messages were not
+    saved. The stored historyId, where the next incremental sync starts,
+    only moves once every sync of the user up to then has succeeded, so a
+    failed job's messages are always fetched again.
+    """
+    finish_sync_checkpoint(sync_id, history_id, ok)
+    return advance_history_id(user_id)
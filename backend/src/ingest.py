@@ -0,0 +1,229 @@
+# src/ingest.py
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from src.pre_processing import preprocess_email
+from src.thread_index import ThreadIndex, ensure_indexes, participants_from_processed
+from src.threading_engine import (ThreadingEngine, allocate_seq, ensure_message_indexes, load_related,
+                                  mark_dirty, merge_threads, message_doc, new_thread_doc)
+
+DEFAULT_BATCH_SIZE = 2000
+READ_CHUNK = 1 << 20
+
+
+# ---------- Sources ----------
+def iter_json_dump(path):
+    """
+    Stream email docs from a JSON array (like data/test_emails.json) or a
+    JSON-lines file without loading the whole file into memory.
+    Each doc needs a raw RFC822 "message" field.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(READ_CHUNK)
+        pos = 0
+        # skip whitespace and the opening bracket of an array
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,[":
+                pos += 1
+            if pos >= len(buf):
+                more = f.read(READ_CHUNK)
+                if not more:
+                    return
+                buf, pos = buf[pos:] + more, 0
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                doc, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                more = f.read(READ_CHUNK)
+                if not more:
+                    raise
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield doc
+            pos = end
+
+
+def iter_maildir(root):
+    """Stream raw messages from an Enron-style maildir (one file per message)."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            file_path = os.path.join(dirpath, name)
+            try:
+                with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+                    raw = f.read()
+            except OSError as e:
+                print(f"[Ingest] Skipping {file_path}: {e}")
+                continue
+            yield {"file": os.path.relpath(file_path, root), "message": raw}
+
+
+def iter_source(path):
+    if os.path.isdir(path):
+        return iter_maildir(path)
+    return iter_json_dump(path)
+
+
+def _batches(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+# ---------- In-memory thread resolution ----------
+class ThreadResolver:
+    """
+    Threads messages in memory with the same JWZ engine as add_to_thread().
+    Stored messages and threads a batch could link to are loaded once per
+    batch (two queries) instead of being looked up per message.
+    """
+
+    def __init__(self, threads_col, messages_col):
+        self.threads_col = threads_col
+        self.messages_col = messages_col
+        # a private index for this run; it holds only the threads the batches touch,
+        # so it never overwrites the shared snapshot
+        self.engine = ThreadingEngine(ThreadIndex(path=None))
+        self.loaded_subjects = set()
+
+    def preload(self, processed_batch) -> list:
+        """
+        Pull existing threads that any message in this batch could join.
+        Returns the (merged, surviving) pairs of stored threads it linked.
+        """
+        merges = load_related(self.engine, self.messages_col, processed_batch)[1]
+        subjects = {p["normalized_subject"] for p in processed_batch if p.get("normalized_subject")}
+        subjects -= self.loaded_subjects
+        if subjects:
+            self.engine.index.warm(self.threads_col, {"subject_norm": {"$in": list(subjects)}})
+            self.loaded_subjects |= subjects
+        return merges
+
+    def seen(self, processed) -> bool:
+        """Already stored (see preload) or earlier in this run, by Message-ID."""
+        message_id = processed.get("message_id")
+        return bool(message_id) and not self.engine.missing([message_id])
+
+    def resolve(self, processed):
+        """Return (thread_id, is_new, merges) and record the message."""
+        return self.engine.add(
+            processed.get("message_id"),
+            processed.get("in_reply_to"),
+            processed.get("references", []),
+            processed.get("normalized_subject", ""),
+            participants_from_processed(processed))
+
+
+def _preprocess_doc(doc):
+    try:
+        return preprocess_email(doc)
+    except Exception as e:
+        print(f"[Ingest] Failed to preprocess {doc.get('file') or doc.get('subject')}: {e}")
+        return None
+
+
+# ---------- Driver ----------
+def ingest(path, emails_col, threads_col, batch_size=DEFAULT_BATCH_SIZE, workers=None, messages_col=None):
+    """
+    Stream a maildir or JSON dump into Mongo.
+    Each batch is preprocessed on a process pool, threaded in memory, then
+    written with unordered bulk writes (emails, thread messages, threads).
+    Messages whose Message-ID is already stored are skipped, so importing the
+    same source again adds nothing. Returns the number of messages stored.
+    """
+    if messages_col is None:
+        messages_col = threads_col.database["thread_messages"]
+    ensure_indexes(threads_col)
+    ensure_message_indexes(messages_col)
+    resolver = ThreadResolver(threads_col, messages_col)
+    total = skipped = 0
+    started = time.time()
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, batch_size // (workers * 4))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in _batches(iter_source(path), batch_size):
+            processed = list(pool.map(_preprocess_doc, batch, chunksize=chunksize))
+            pairs = [(doc, p) for doc, p in zip(batch, processed) if p is not None]
+            loaded_merges = resolver.preload([p for _, p in pairs])
+
+            email_docs = []
+            message_docs = []
+            new_threads = {}   # thread _id -> (first processed email, created in this batch)
+            merged = {m for m, _ in loaded_merges}   # threads that got folded into another one
+            now = datetime.now()
+            for doc, p in pairs:
+                if resolver.seen(p):
+                    skipped += 1
+                    continue
+                email_id = ObjectId()
+                email_doc = {k: v for k, v in doc.items() if k != "_id"}
+                email_doc.update(p)
+                email_doc["_id"] = email_id
+                email_doc.setdefault("is_unread", False)
+
+                thread_id, is_new, merges = resolver.resolve(p)
+                if is_new:
+                    new_threads[thread_id] = p
+                merged.update(m for m, _ in merges)
+                email_doc["thread_id"] = thread_id
+                email_docs.append(email_doc)
+                message_docs.append((message_doc(p, email_id, thread_id), participants_from_processed(p)))
+
+            # a late parent may have merged threads seen earlier in the batch
+            canonical = resolver.engine.canonical
+            touched = {}       # surviving thread _id -> [message count, participants]
+            for email_doc in email_docs:
+                email_doc["thread_id"] = canonical(email_doc["thread_id"])
+            for msg, participants in message_docs:
+                msg["thread_id"] = canonical(msg["thread_id"])
+                stats = touched.setdefault(msg["thread_id"], [0, set()])
+                stats[0] += 1
+                stats[1] |= participants
+            # number the messages: new threads from 1, stored ones after their last number
+            next_seq = {tid: 1 if tid in new_threads else allocate_seq(threads_col, tid, count)
+                        for tid, (count, _) in touched.items()}
+            for msg, _ in message_docs:
+                msg["seq"] = next_seq[msg["thread_id"]]
+                next_seq[msg["thread_id"]] += 1
+
+            # new threads are stored with their counters before their messages (so
+            # another writer numbers after them) and marked dirty once those are in
+            created = [new_thread_doc(tid, new_threads[tid], participants, now, count)
+                       for tid, (count, participants) in touched.items() if tid in new_threads]
+            if created:
+                threads_col.insert_many(created, ordered=False)
+            thread_ops = []
+            for tid, (count, participants) in touched.items():
+                update = {} if tid in new_threads else {
+                    "$inc": {"message_count": count},
+                    "$addToSet": {"participants": {"$each": sorted(participants)}}}
+                thread_ops.append(UpdateOne({"_id": tid}, mark_dirty(update, now)))
+            if email_docs:
+                emails_col.insert_many(email_docs, ordered=False)
+                messages_col.insert_many([m for m, _ in message_docs], ordered=False)
+            if thread_ops:
+                threads_col.bulk_write(thread_ops, ordered=False)
+            # threads stored by earlier batches that are now part of another thread
+            for tid in merged - new_threads.keys():
+                merge_threads(threads_col, messages_col, tid, canonical(tid), emails_col, resolver.engine.index)
+
+            total += len(email_docs)
+            rate = total / max(time.time() - started, 1e-6)
+            print(f"[Ingest] {total} messages ({len(new_threads)} new threads, {len(merged)} merges in batch, "
+                  f"{skipped} already stored, {rate:.0f} msg/s)")
+
+    return total
@@ -0,0 +1,234 @@
+# src/job_queue.py
+import os
+import queue
+import threading
+import time
+import uuid
+
+from utils.db import (insert_job, update_job, advance_job, delete_job, get_job, get_user_jobs,
+                      get_active_job_pids, prune_jobs, add_job_event, get_job_events)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# finished jobs stay queryable for this long
+JOB_RETENTION_SEC = int(os.getenv("JOB_RETENTION_SEC", "3600"))
+# how often a reader in another web worker checks SQLite for new events
+JOB_EVENT_POLL_SEC = 0.25
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def _alive(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, TypeError):
+        return pid is not None
+    return True
+
+
+class Job:
+    """
+    One unit of background work plus its progress counters.
+    The job body can publish() events (e.g. each analyzed chunk); readers
+    follow them with wait_events(), which also replays earlier ones.
+    Status, counters and events are written through to SQLite so every
+    web worker can report on the job; the body runs where it was queued.
+    """
+
+    def __init__(self, fn, user_id=None, kind="job", total=0, payload=None):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.user_id = user_id
+        self.kind = kind
+        self.total = total
+        self.payload = payload
+        self.completed = 0
+        self.failed = 0
+        self.status = QUEUED
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._cond = threading.Condition()
+
+    def advance(self, completed=0, failed=0):
+        with self._lock:
+            self.completed += completed
+            self.failed += failed
+        advance_job(self.id, completed, failed)
+
+    def publish(self, event):
+        add_job_event(self.id, event)
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def wait_events(self, cursor=0, timeout=None) -> list:
+        """Events after position `cursor`, waiting up to `timeout` for new ones while the job runs."""
+        with self._cond:
+            if len(self.events) <= cursor and self.active:
+                self._cond.wait(timeout)
+            return self.events[cursor:]
+
+    def _start(self):
+        self.status = RUNNING
+        self.started_at = time.time()
+        update_job(self.id, status=RUNNING, started_at=self.started_at)
+
+    def _finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        update_job(self.id, status=status, error=error, finished_at=self.finished_at)
+        self._done.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def wait(self, timeout=None) -> bool:
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "total": self.total,
+                "completed": self.completed,
+                "failed": self.failed,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at
+            }
+
+
+class JobQueue:
+    """
+    Job queue drained by `workers` daemon threads per process, with job
+    state in the SQLite DB (utils.db) so that every gunicorn worker sees
+    every job: get(), for_user() and wait_events() work for jobs queued in
+    another process. Jobs whose process died are marked failed; an
+    interrupted inbox analysis is simply picked up again by the next sync.
+    Threads are started lazily and restarted after a fork, so the queue can
+    be created at import time under gunicorn.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, retention=JOB_RETENTION_SEC, label="JobQueue"):
+        self.workers = max(1, workers)
+        self.retention = retention
+        self.label = label
+        self.jobs = {}   # jobs of this process, by id
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.jobs = {}
+            for i in range(self.workers):
+                threading.Thread(target=self._run, name=f"{self.label}-{i}", daemon=True).start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job._start()
+                job.fn(job)
+                job._finish(DONE)
+            except Exception as e:
+                print(f"[{self.label}] Job {job.id} ({job.kind}) failed: {e}")
+                job._finish(FAILED, str(e))
+            finally:
+                self._queue.task_done()
+
+    def create(self, fn, user_id=None, kind="job", total=0, payload=None) -> Job:
+        """
+        Record a queued job without starting it, e.g. to claim work under
+        its id first; then start() or discard() it.
+        """
+        self._ensure_workers()
+        job = Job(fn, user_id=user_id, kind=kind, total=total, payload=payload)
+        self._prune()
+        insert_job(job.to_dict(), user_id, os.getpid())
+        with self._lock:
+            self.jobs[job.id] = job
+        return job
+
+    def start(self, job):
+        update_job(job.id, total=job.total)
+        self._queue.put(job)
+
+    def discard(self, job):
+        with self._lock:
+            self.jobs.pop(job.id, None)
+        delete_job(job.id)
+
+    def submit(self, fn, user_id=None, kind="job", total=0, payload=None) -> Job:
+        """Queue `fn(job)`; it may call job.advance() to report progress."""
+        job = self.create(fn, user_id=user_id, kind=kind, total=total, payload=payload)
+        self.start(job)
+        return job
+
+    def _reap(self):
+        """Fail jobs whose worker process is gone (restarted or killed)."""
+        me = os.getpid()
+        for job_id, pid in get_active_job_pids():
+            if pid != me and not _alive(pid):
+                update_job(job_id, status=FAILED, error="worker process exited", finished_at=time.time())
+
+    def get(self, job_id, user_id=None):
+        """The job's state as a dict (see Job.to_dict), from any worker."""
+        self._reap()
+        return get_job(job_id, user_id)
+
+    def for_user(self, user_id, active_only=False) -> list:
+        self._reap()
+        return get_user_jobs(user_id, active_only)
+
+    def wait_events(self, job_id, cursor=0, timeout=None):
+        """
+        (events after position `cursor`, whether the job was still active
+        before they were read). Waits up to `timeout` for new events.
+        """
+        job = self.jobs.get(job_id)
+        if job is not None:
+            active = job.active
+            return job.wait_events(cursor, timeout), active
+        # queued by another worker: poll SQLite
+        deadline = time.time() + (timeout or 0)
+        while True:
+            state = self.get(job_id)
+            active = state is not None and state["status"] in (QUEUED, RUNNING)
+            events = get_job_events(job_id, cursor)
+            if events or not active or time.time() >= deadline:
+                return events, active
+            time.sleep(min(JOB_EVENT_POLL_SEC, max(0.0, deadline - time.time())))
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        with self._lock:
+            for job_id in [j.id for j in self.jobs.values() if j.finished_at and j.finished_at < cutoff]:
+                del self.jobs[job_id]
+        prune_jobs(cutoff)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {}
+            for j in self.jobs.values():
+                counts[j.status] = counts.get(j.status, 0) + 1
+        return {"workers": self.workers, "backlog": self._queue.qsize(), "jobs": counts}
@@ -1,37 +1,115 @@
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Cooldown for a 429 without a Retry-After header; doubles on each
+# consecutive 429 from the same key, up to MAX_COOLDOWN_SEC.
+DEFAULT_COOLDOWN_SEC = float(os.getenv("KEY_COOLDOWN_SEC", "10"))
+MAX_COOLDOWN_SEC = float(os.getenv("KEY_MAX_COOLDOWN_SEC", "300"))
+# How long a throttle keeps counting against a key once its cooldown is over
+THROTTLE_MEMORY_SEC = float(os.getenv("KEY_THROTTLE_MEMORY_SEC", "60"))
+
+
+class KeyStats:
+    __slots__ = ("uses", "successes", "throttles", "errors", "consecutive_throttles",
+                 "cooldown_until", "last_throttled", "last_used")
+
+    def __init__(self):
+        self.uses = 0
+        self.successes = 0
+        self.throttles = 0
+        self.errors = 0
+        self.consecutive_throttles = 0
+        self.cooldown_until = 0.0
+        self.last_throttled = 0.0
+        self.last_used = 0.0
+
+
 class KeyManager:
     def __init__(self):
         """
         Loads all OPENROUTER_API_KEY_* from the environment
-        and prepares them for round-robin rotation.
+        and schedules them by health instead of blind round-robin.
         """
         self.api_keys = []
         # Dynamically load all keys that match the pattern
-        for key, value in os.environ.items():
+        for key, value in sorted(os.environ.items()):
             if key.startswith("OPENROUTER_API_KEY_"):
                 self.api_keys.append(value)
-        
+
         if not self.api_keys:
             raise ValueError("No OPENROUTER_API_KEY_* found in your .env file.")
-            
-        self.current_index = 0
+
+        self._lock = threading.Lock()
+        self.stats = {key: KeyStats() for key in self.api_keys}
         print(f"[KeyManager] Loaded {len(self.api_keys)} API keys successfully.")
 
     def get_key(self) -> str:
         """
-        Returns the next API key in the rotation. 🔄
+        Returns the healthiest key:
+        - keys cooling down after a 429 are skipped while any other is free
+        - among free keys, the least recently throttled wins (throttles older
+          than THROTTLE_MEMORY_SEC are forgotten), then the least recently
+          used, which is plain rotation when nothing is being throttled
+        - if every key is cooling down, the one that frees up first
         """
-        # Get the key at the current index
-        key = self.api_keys[self.current_index]
-        
-        # Move to the next index, wrapping around if necessary
-        self.current_index = (self.current_index + 1) % len(self.api_keys)
-        
-        return key
+        with self._lock:
+            now = time.time()
+            free = [k for k in self.api_keys if self.stats[k].cooldown_until <= now]
+            if free:
+                forget_before = now - THROTTLE_MEMORY_SEC
+                key = min(free, key=lambda k: (
+                    self.stats[k].last_throttled if self.stats[k].last_throttled > forget_before else 0.0,
+                    self.stats[k].last_used))
+            else:
+                key = min(self.api_keys, key=lambda k: self.stats[k].cooldown_until)
+            s = self.stats[key]
+            s.uses += 1
+            s.last_used = now
+            return key
+
+    def cooldown_remaining(self, key) -> float:
+        """Seconds until `key` may be used again (0 if it is free)."""
+        return max(0.0, self.stats[key].cooldown_until - time.time())
+
+    def report_success(self, key):
+        with self._lock:
+            s = self.stats[key]
+            s.successes += 1
+            s.consecutive_throttles = 0
+
+    def report_throttled(self, key, retry_after=None):
+        """Record a 429; the key rests for Retry-After, or a growing default."""
+        with self._lock:
+            s = self.stats[key]
+            now = time.time()
+            if retry_after is None:
+                retry_after = min(MAX_COOLDOWN_SEC, DEFAULT_COOLDOWN_SEC * 2 ** s.consecutive_throttles)
+            s.throttles += 1
+            s.consecutive_throttles += 1
+            s.last_throttled = now
+            s.cooldown_until = max(s.cooldown_until, now + retry_after)
+
+    def report_error(self, key):
+        with self._lock:
+            self.stats[key].errors += 1
+
+    def usage(self) -> list:
+        """Per-key counters; keys are identified by position only, never by any part of the key."""
+        now = time.time()
+        with self._lock:
+            return [{
+                "key": f"#{i + 1}",
+                "uses": s.uses,
+                "successes": s.successes,
+                "throttles": s.throttles,
+                "errors": s.errors,
+                "cooldown_sec": round(max(0.0, s.cooldown_until - now), 1)
+            } for i, (key, s) in enumerate((k, self.stats[k]) for k in self.api_keys)]
+
 
 # Create a single, shared instance of the manager
-key_manager = KeyManager()
\ No newline at end of file
+key_manager = KeyManager()
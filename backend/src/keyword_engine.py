@@ -0,0 +1,84 @@
+# src/keyword_engine.py
+import json
+import os
+from collections import deque
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LEXICONS_PATH = os.getenv("PRIORITY_LEXICONS_PATH", os.path.join(BASE_DIR, "data", "priority_lexicons.json"))
+
+
+def load_lexicons(path=None) -> dict:
+    """{lexicon name: [phrase, ...]} from the JSON config (PRIORITY_LEXICONS_PATH)."""
+    with open(path or LEXICONS_PATH, encoding="utf-8") as f:
+        lexicons = json.load(f)
+    return {name: [p.strip().lower() for p in phrases if p.strip()] for name, phrases in lexicons.items()}
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over token (or character) sequences: every phrase of every
+    lexicon is found in one left-to-right pass over a document's tokens,
+    overlapping matches included ("due" and "due by" both hit).
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]   # (label, phrase length in tokens) per state
+        self._built = False
+
+    def add(self, tokens, label):
+        state = 0
+        for tok in tokens:
+            nxt = self._goto[state].get(tok)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][tok] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        if tokens and (label, len(tokens)) not in self._out[state]:
+            self._out[state].append((label, len(tokens)))
+        self._built = False
+
+    def build(self):
+        """Breadth-first failure links; each state also reports its suffixes' matches."""
+        queue = deque(self._goto[0].values())
+        for s in queue:
+            self._fail[s] = 0
+        while queue:
+            state = queue.popleft()
+            for tok, nxt in self._goto[state].items():
+                f = self._fail[state]
+                while f and tok not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(tok, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+                queue.append(nxt)
+        self._built = True
+
+    def find(self, tokens) -> list:
+        """[(label, start, end)] token spans, ordered by end position."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = []
+        state = 0
+        for i, tok in enumerate(tokens):
+            while state and tok not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(tok, 0)
+            for label, length in out[state]:
+                hits.append((label, i + 1 - length, i + 1))
+        return hits
+
+
+def compile_lexicons(lexicons, tokenize) -> KeywordAutomaton:
+    """Build one automaton for all lexicons; `tokenize(phrases)` yields each phrase's token keys."""
+    automaton = KeywordAutomaton()
+    for name, phrases in lexicons.items():
+        for phrase, tokens in zip(phrases, tokenize(phrases)):
+            automaton.add(tuple(tokens), name)
+    automaton.build()
+    return automaton
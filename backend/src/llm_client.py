@@ -0,0 +1,213 @@
+# src/llm_client.py
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from src.key_manager import key_manager
+
+load_dotenv()
+
+# Point at a local mock server for testing, e.g. http://127.0.0.1:8090/api/v1
+BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+TIMEOUT_SEC = float(os.getenv("LLM_TIMEOUT_SEC", "30"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE_SEC = 1.0
+BACKOFF_MAX_SEC = 30.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+DEFAULT_HEADERS = {
+    "Content-Type": "application/json",
+    "HTTP-Referer": "http://localhost:3000",
+    "X-Title": "SmartMail Backend"
+}
+
+
+class LLMError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def retry_after_seconds(value):
+    """Parse a Retry-After header (delta-seconds or HTTP-date); None if absent or invalid."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None) -> float:
+    """Honour Retry-After when the server sends it, else full-jitter exponential backoff."""
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX_SEC)
+    return random.uniform(0, min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2 ** attempt))
+
+
+class LLMClient:
+    """
+    Shared OpenRouter chat-completions client.
+    - one keep-alive requests.Session, pooled for MAX_CONCURRENCY connections
+    - at most MAX_CONCURRENCY requests in flight across all callers
+    - a fresh key from key_manager per attempt, with every outcome reported
+      back so throttled keys rest while the others keep serving
+    - retries 429/5xx/network errors with jittered backoff
+    """
+
+    def __init__(self, base_url=BASE_URL, max_concurrency=MAX_CONCURRENCY, timeout=TIMEOUT_SEC,
+                 max_retries=MAX_RETRIES, keys=key_manager):
+        self.url = f"{base_url}/chat/completions"
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.keys = keys
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _post(self, payload: dict, timeout=None, stream=False):
+        """POST with key rotation and retries; returns the 200 response."""
+        last_error = None
+        for attempt in range(self.max_retries):
+            key = self.keys.get_key()
+            # every key is cooling down: wait for the first one to free up
+            wait = self.keys.cooldown_remaining(key)
+            if wait:
+                time.sleep(min(wait, BACKOFF_MAX_SEC))
+            headers = dict(DEFAULT_HEADERS, Authorization=f"Bearer {key}")
+            delay = None
+            try:
+                with self._slots:
+                    r = self.session.post(self.url, headers=headers, json=payload,
+                                          timeout=timeout or self.timeout, stream=stream)
+                if r.status_code == 200:
+                    self.keys.report_success(key)
+                    return r
+                last_error = LLMError(f"OpenRouter error: {r.status_code} {r.text[:200]}", r.status_code)
+                r.close()
+                if r.status_code == 429:
+                    # the key rests; the next attempt picks another one straight away
+                    self.keys.report_throttled(key, retry_after_seconds(r.headers.get("Retry-After")))
+                    delay = 0
+                else:
+                    self.keys.report_error(key)
+                    if r.status_code not in RETRYABLE_STATUS:
+                        raise last_error
+                    delay = backoff_delay(attempt, retry_after_seconds(r.headers.get("Retry-After")))
+            except requests.RequestException as e:
+                self.keys.report_error(key)
+                last_error = LLMError(f"OpenRouter request failed: {e}")
+                delay = backoff_delay(attempt)
+            if attempt < self.max_retries - 1:
+                print(f"[LLMClient] {last_error} - retrying in {delay:.1f}s")
+                time.sleep(delay)
+        raise last_error
+
+    def complete(self, payload: dict, timeout=None) -> dict:
+        """POST a chat-completions payload; returns the decoded JSON response."""
+        r = self._post(payload, timeout=timeout)
+        try:
+            return r.json()
+        except ValueError:
+            raise LLMError(f"OpenRouter returned invalid JSON: {r.text[:200]}", r.status_code)
+
+    def stream_chat(self, messages, model, temperature=None, max_tokens=None, timeout=None, **extra):
+        """
+        Yield reply text pieces as they arrive (`stream: true`, server-sent events).
+        Connection errors and 429/5xx are retried before the first token only;
+        a stream that breaks later raises LLMError.
+        """
+        payload = {"model": model, "messages": messages, "stream": True, **extra}
+        if temperature is not None:
+            payload["temperature"] = temperature
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        r = self._post(payload, timeout=timeout, stream=True)
+        try:
+            for line in r.iter_lines(decode_unicode=True):
+                # blank lines separate events; ":" lines are keep-alive comments
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                if chunk.get("error"):
+                    raise LLMError(f"OpenRouter stream error: {chunk['error']}")
+                for choice in chunk.get("choices") or []:
+                    piece = (choice.get("delta") or {}).get("content")
+                    if piece:
+                        yield piece
+        except requests.RequestException as e:
+            raise LLMError(f"OpenRouter stream interrupted: {e}")
+        finally:
+            r.close()
+
+    def chat(self, messages, model, temperature=None, max_tokens=None, timeout=None, **extra) -> str:
+        """Run one chat completion and return the stripped reply text."""
+        payload = {"model": model, "messages": messages, **extra}
+        if temperature is not None:
+            payload["temperature"] = temperature
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        resp = self.complete(payload, timeout=timeout)
+        try:
+            return resp["choices"][0]["message"]["content"].strip()
+        except (KeyError, IndexError, TypeError, AttributeError):
+            raise LLMError(f"Unexpected OpenRouter response: {str(resp)[:200]}")
+
+    def chat_many(self, conversations, model, **kwargs) -> list:
+        """
+        Run many chats in parallel (bounded by MAX_CONCURRENCY).
+        Returns replies in input order, None for the ones that failed.
+        """
+        def run(messages):
+            try:
+                return self.chat(messages, model, **kwargs)
+            except LLMError as e:
+                print(f"[LLMClient] {e}")
+                return None
+
+        conversations = list(conversations)
+        if not conversations:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(conversations))) as pool:
+            return list(pool.map(run, conversations))
+
+    # ---------- asyncio entry points ----------
+    async def achat(self, messages, model, **kwargs) -> str:
+        return await asyncio.to_thread(self.chat, messages, model, **kwargs)
+
+    async def achat_many(self, conversations, model, **kwargs) -> list:
+        """asyncio version of chat_many; failures come back as None."""
+        async def run(messages):
+            try:
+                return await self.achat(messages, model, **kwargs)
+            except LLMError as e:
+                print(f"[LLMClient] {e}")
+                return None
+        return await asyncio.gather(*(run(m) for m in conversations))
+
+
+# Create a single, shared client
+llm_client = LLMClient()
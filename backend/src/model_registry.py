@@ -0,0 +1,141 @@
+# src/model_registry.py
+import gc
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+SPACY_MODEL = "en_core_web_sm"
+# Models warmed by preload(); override with a comma-separated list, or "" to skip
+PRELOAD_MODELS = [m for m in os.getenv("MODEL_PRELOAD", "spacy,vader,nltk,dateparser,gemini").split(",") if m]
+# Safe to load in a gunicorn master before fork; Gemini's gRPC channel is not,
+# so each worker still creates that one itself
+FORK_SAFE_MODELS = ("spacy", "vader", "nltk", "dateparser")
+
+
+# ---------- Loaders (heavy imports happen here, not at module import) ----------
+def _load_spacy():
+    import spacy  # type: ignore
+    try:
+        nlp = spacy.load(SPACY_MODEL, disable=["parser"])
+    except OSError:
+        from spacy.cli import download  # type: ignore
+        print(f"[INFO] spaCy model '{SPACY_MODEL}' not found. Downloading...")
+        download(SPACY_MODEL)
+        nlp = spacy.load(SPACY_MODEL, disable=["parser"])
+    if "sentencizer" not in nlp.pipe_names and "senter" not in nlp.pipe_names:
+        nlp.add_pipe("sentencizer")
+    return nlp
+
+
+def _load_vader():
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer  # type: ignore
+    return SentimentIntensityAnalyzer()
+
+
+def _load_nltk():
+    from src.nltk_downloader import ensure_nltk_data
+    ensure_nltk_data()
+    from nltk.tokenize import sent_tokenize, word_tokenize  # type: ignore
+    from nltk.corpus import stopwords  # type: ignore
+    return SimpleNamespace(
+        sent_tokenize=sent_tokenize,
+        word_tokenize=word_tokenize,
+        stop_words=frozenset(stopwords.words('english'))
+    )
+
+
+def _load_dateparser():
+    import dateparser  # type: ignore
+    return dateparser
+
+
+def _load_gemini():
+    import google.generativeai as genai  # type: ignore
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai
+
+
+class ModelRegistry:
+    """
+    Lazily loaded, process-wide models.
+    - get() is lock-free once a model is loaded (double-checked locking)
+    - each model has its own lock, so a slow spaCy load does not block VADER
+    - preload() warms models on a background thread at worker boot
+    - load times are kept in `timings` for /model_status
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._locks = {}
+        self.timings = {}
+        self.errors = {}
+
+    def register(self, name, loader):
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._locks[name]:
+            model = self._models.get(name)
+            if model is None:
+                started = time.perf_counter()
+                try:
+                    model = self._loaders[name]()
+                except Exception as e:
+                    self.errors[name] = str(e)
+                    raise
+                self.timings[name] = round(time.perf_counter() - started, 3)
+                self.errors.pop(name, None)
+                self._models[name] = model
+                print(f"[ModelRegistry] Loaded {name} in {self.timings[name]:.2f}s")
+        return model
+
+    def is_loaded(self, name) -> bool:
+        return name in self._models
+
+    def preload(self, names=None, background=True):
+        """Load `names` (default PRELOAD_MODELS); returns the thread when run in the background."""
+        names = [n for n in (PRELOAD_MODELS if names is None else names) if n in self._loaders]
+
+        def run():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"[ModelRegistry] Preloading {name} failed: {e}")
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="ModelPreload", daemon=True)
+        thread.start()
+        return thread
+
+    def preload_for_fork(self):
+        """
+        Load the fork-safe models synchronously in the master, then freeze the
+        heap: workers forked afterwards share those pages copy-on-write, and
+        gc.freeze() keeps the collector from writing to (and so copying) them.
+        """
+        self.preload([n for n in PRELOAD_MODELS if n in FORK_SAFE_MODELS], background=False)
+        gc.collect()
+        gc.freeze()
+        print(f"[ModelRegistry] Froze {gc.get_freeze_count()} objects before fork")
+
+    def report(self) -> dict:
+        return {name: {"loaded": name in self._models,
+                       "load_sec": self.timings.get(name),
+                       "error": self.errors.get(name)} for name in self._loaders}
+
+
+registry = ModelRegistry()
+registry.register("spacy", _load_spacy)
+registry.register("vader", _load_vader)
+registry.register("nltk", _load_nltk)
+registry.register("dateparser", _load_dateparser)
+registry.register("gemini", _load_gemini)
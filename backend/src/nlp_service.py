@@ -0,0 +1,146 @@
+# src/nlp_service.py
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from src.priority_detection_flask import detect_priority_batch
+from src.text_rank_summarization import textrank_summary
+
+# Worker processes per web process (0 runs everything in-process, as before).
+# Unset: min(4, CPUs) for the dev server. Under gunicorn prefork the pool is
+# opt-in: unset means 0 there, see prefork() and gunicorn.conf.py
+NLP_WORKERS_SETTING = os.getenv("NLP_WORKERS")
+NLP_WORKERS = int(NLP_WORKERS_SETTING) if NLP_WORKERS_SETTING else min(4, os.cpu_count() or 1)
+# Texts per IPC round-trip; one batch is one nlp.pipe call in a worker
+NLP_BATCH_SIZE = int(os.getenv("NLP_BATCH_SIZE", "32"))
+# Models each worker loads before taking work
+WORKER_MODELS = ("spacy", "vader", "nltk", "dateparser")
+
+
+# ---------- Worker side (module-level so they pickle by reference) ----------
+def _init_worker():
+    from src.model_registry import registry
+    registry.preload(WORKER_MODELS, background=False)
+
+
+def _prioritize(texts):
+    return detect_priority_batch(texts)
+
+
+def _summarize(texts):
+    return [textrank_summary(t) for t in texts]
+
+
+def _ready(_):
+    return os.getpid()
+
+
+def _context():
+    # forkserver children come from a clean single-threaded process, which is
+    # safe even though the web process runs many threads; spawn elsewhere
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+class NLPService:
+    """
+    spaCy/VADER/TextRank work off the web process's GIL.
+    - a pool of worker processes, each with its own loaded models
+    - texts travel in batches of NLP_BATCH_SIZE (one pickle round-trip and
+      one nlp.pipe call each), spread over all workers, results in order
+    - the pool starts on first use (or warm()) and again after a fork, like JobQueue
+    - a broken pool (a worker died) falls back to in-process for that call
+      and is rebuilt on the next one
+    Under gunicorn prefork every web worker would get its own pool, each
+    loading the models again; prefork() runs in-process there instead, on
+    the models the master loaded, unless NLP_WORKERS is set explicitly.
+    """
+
+    def __init__(self, workers=NLP_WORKERS, batch_size=NLP_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = max(1, batch_size)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.fallbacks = 0
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_context(),
+                                                     initializer=_init_worker)
+                self._pid = os.getpid()
+                print(f"[NLPService] Started {self.workers} worker processes")
+            return self._executor
+
+    def _run(self, fn, texts) -> list:
+        texts = list(texts)
+        if not texts:
+            return []
+        if self.workers <= 0:
+            return fn(texts)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        try:
+            pool = self._pool()
+            futures = [pool.submit(fn, batch) for batch in batches]
+            results = []
+            for f in futures:
+                results.extend(f.result())
+            self.batches += len(batches)
+            return results
+        except BrokenProcessPool as e:
+            print(f"[NLPService] Worker pool broke ({e}); running in-process")
+            with self._lock:
+                self._executor = None
+            self.fallbacks += 1
+            return fn(texts)
+
+    def prioritize(self, texts) -> list:
+        """detect_priority_batch in the pool: [{"priority", "entities", "score"}] per text."""
+        return self._run(_prioritize, texts)
+
+    def summarize(self, texts) -> list:
+        """TextRank summary per text."""
+        return self._run(_summarize, texts)
+
+    def prefork(self):
+        """Called in a gunicorn master before forking: no per-worker pools unless configured."""
+        if not NLP_WORKERS_SETTING:
+            self.workers = 0
+            print("[NLPService] NLP runs in-process in each web worker; set NLP_WORKERS for per-worker pools")
+
+    def warm(self, background=True):
+        """Start the pool and let every worker load its models now, not on the first request."""
+        if self.workers <= 0:
+            return
+
+        def run():
+            try:
+                pool = self._pool()
+                list(pool.map(_ready, range(self.workers)))
+                print(f"[NLPService] {self.workers} worker processes ready")
+            except Exception as e:
+                print(f"[NLPService] Warming the worker pool failed: {e}")
+
+        if background:
+            threading.Thread(target=run, name="nlp-warm", daemon=True).start()
+        else:
+            run()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "batch_size": self.batch_size,
+                "running": self._executor is not None and self._pid == os.getpid(),
+                "batches": self.batches, "fallbacks": self.fallbacks}
+
+
+# Create a single, shared service
+nlp_service = NLPService()
@@ -12,31 +12,217 @@ emails_col = db["mails"]
 threads_col = db["threads"]
 
 
+# ---------- Body cleaning ----------
+# All patterns are compiled once at import.
+_HEADER_SPLIT_RE = re.compile(r"\n\s*\n")
+_QUOTED_LINE_RE = re.compile(r"(?m)^\s*>.*\n?")
+_ORIGINAL_MSG_RE = re.compile(r"-{2,}\s*Original Message\s*-{2,}", re.I)
+_ORIGINAL_MSG_WORDS_RE = re.compile(r"Original Message", re.I)
+# under re.I these also match "i"/"s"; without them str.lower() finds the same spans
+_CASEFOLD_EXTRAS = ("\u0130", "\u0131", "\u017f")
+_SIG_DASHES_RE = re.compile(r"(?m)(--\s*\n.*$)")
+_SIGNOFF_CUT_RE = re.compile(r"(?mi)(^\s*(thanks|regards|sincerely|cheers)[\.,]?\s*$).*", re.S)
+_SIGNOFF_LINE_RE = re.compile(r"\s*(?:thanks|regards|sincerely|cheers)[\.,]?\s*", re.I)
+_SIGNOFF_MAX_LEN = len("sincerely,")
+_URL_RE = re.compile(r"http\S+|www\S+")
+_PHONE_RE = re.compile(r"\+?\d[\d\s\-\(\)\.]{6,}\d")
+# Replacing disallowed characters with spaces and then collapsing whitespace is
+# the same as joining the runs of allowed characters with single spaces.
+_TEXT_RUN_RE = re.compile(r"[a-zA-Z0-9.,!?']+")
+# a phone number can only continue across a line break after one of these
+_PHONE_TAIL_CHARS = "-()."
+
+STREAM_CHUNK_CHARS = 64 * 1024
+
+
+def _split_body(text: str) -> str:
+    # If the message contains headers+body, try to split by blank line
+    parts = _HEADER_SPLIT_RE.split(text, maxsplit=1)
+    return parts[1] if len(parts) > 1 else parts[0]
+
+
+def _has_multiline_marker(body: str) -> bool:
+    """
+    True if an "Original Message" marker could span lines, i.e. the words sit
+    at the start or end of a line with the dashes on a neighbouring line.
+    """
+    if "--" not in body:
+        return False
+    if any(c in body for c in _CASEFOLD_EXTRAS):
+        spans = [m.span() for m in _ORIGINAL_MSG_WORDS_RE.finditer(body)]
+    else:
+        lowered = body.lower()
+        spans = []
+        i = lowered.find("original message")
+        while i != -1:
+            spans.append((i, i + 16))
+            i = lowered.find("original message", i + 16)
+    for start, end in spans:
+        line_start = body.rfind("\n", 0, start) + 1
+        if not body[line_start:start].strip():
+            return True
+        line_end = body.find("\n", end)
+        if not body[end:line_end if line_end != -1 else len(body)].strip():
+            return True
+    return False
+
+
+def _iter_body_lines(body: str):
+    """
+    Line-oriented pass that
+    - drops quoted (">") lines and the blank lines right before them,
+    - removes "-----Original Message-----" markers,
+    - drops a trailing "--" plus the next non-blank line (signature),
+    - stops at a bare "Thanks"/"Regards"/... line and the blank lines before it.
+    "\n".join() of the result is exactly what the old chain of whole-text
+    re.sub calls produced (see _strip_quotes_and_signature for the one case
+    that still needs them).
+    """
+    # first sweep: quotes and markers
+    kept = []
+    blank_from = None
+    dropped_last = False
+    for line in body.split("\n"):
+        stripped = line.lstrip()
+        if not stripped:
+            if blank_from is None:
+                blank_from = len(kept)
+            kept.append(line)
+            dropped_last = False
+        elif stripped[0] == ">":
+            if blank_from is not None:
+                del kept[blank_from:]
+                blank_from = None
+            dropped_last = True
+        else:
+            blank_from = None
+            dropped_last = False
+            kept.append(_ORIGINAL_MSG_RE.sub("", line) if "-" in line else line)
+    if dropped_last:
+        # the newline before a trailing quoted block survives
+        kept.append("")
+
+    # second sweep: signatures; a "--" only counts when a newline follows it
+    last = len(kept) - 1
+    eating = False
+    blank = []
+    seen_text = False
+    for i, line in enumerate(kept):
+        stripped = line.strip()
+        if eating:
+            if stripped:
+                eating = False
+            continue
+        if i < last and stripped.endswith("--"):
+            line = line.rstrip()[:-2]
+            stripped = line.strip()
+            eating = True
+        if not stripped:
+            blank.append(line)
+            continue
+        if len(stripped) <= _SIGNOFF_MAX_LEN and _SIGNOFF_LINE_RE.fullmatch(line):
+            if seen_text:
+                yield ""
+            return
+        if blank:
+            yield from blank
+            blank = []
+        seen_text = True
+        yield line
+    yield from blank
+
+
+def _strip_quotes_and_signature(body: str) -> str:
+    if _has_multiline_marker(body):
+        # rare marker split over lines: fall back to the whole-text passes
+        body = _QUOTED_LINE_RE.sub("", body)
+        body = _ORIGINAL_MSG_RE.sub("", body)
+        body = _SIG_DASHES_RE.sub("", body)
+        return _SIGNOFF_CUT_RE.sub("", body)
+    return "\n".join(_iter_body_lines(body))
+
+
+def _strip_emails(body: str) -> str:
+    """
+    Same result as re.sub(r"\S+@\S+", "", body). That pattern always takes a whole
+    whitespace-delimited token (one with an "@" that is not its first or last
+    character), so only the tokens around each "@" need looking at.
+    """
+    parts = []
+    last = 0
+    n = len(body)
+    i = body.find("@")
+    while i != -1:
+        start = i
+        while start > 0 and not body[start - 1].isspace():
+            start -= 1
+        end = i + 1
+        while end < n and not body[end].isspace():
+            end += 1
+        if "@" in body[start + 1:end - 1]:
+            parts.append(body[last:start])
+            last = end
+        i = body.find("@", end)
+    parts.append(body[last:])
+    return "".join(parts)
+
+
+def _strip_contacts(body: str) -> str:
+    # Remove URLs/emails/phones, in this order: a single merged alternation is
+    # not equivalent, since each removal can expose a match for the next one
+    if "http" in body or "www" in body:
+        body = _URL_RE.sub("", body)
+    if "@" in body:
+        body = _strip_emails(body)
+    return _PHONE_RE.sub("", body)
+
+
+def _finish(body: str) -> str:
+    # Keep basic punctuation and letters/digits
+    return " ".join(_TEXT_RUN_RE.findall(body))
+
+
 def clean_email_body(text: str) -> str:
     if not isinstance(text, str):
         return ""
-    # If the message contains headers+body, try to split by blank line
-    parts = re.split(r"\n\s*\n", text, maxsplit=1)
-    body = parts[1] if len(parts) > 1 else parts[0]
-
-    # Remove quoted replies (lines starting with >)
-    body = re.sub(r"(?m)^\s*>.*\n?", "", body)
-    # Remove common forwarded/original markers
-    body = re.sub(r"-{2,}\s*Original Message\s*-{2,}", "", body, flags=re.I)
-    # Remove signature start (simple heuristic)
-    body = re.sub(r"(?m)(--\s*\n.*$)", "", body)
-    body = re.sub(
-        r"(?mi)(^\s*(thanks|regards|sincerely|cheers)[\.,]?\s*$).*", "", body, flags=re.S)
-
-    # Remove URLs/emails/phones
-    body = re.sub(r"http\S+|www\S+", "", body)
-    body = re.sub(r"\S+@\S+", "", body)
-    body = re.sub(r"\+?\d[\d\s\-\(\)\.]{6,}\d", "", body)
+    body = _strip_quotes_and_signature(_split_body(text))
+    return _finish(_strip_contacts(body))
 
-    # Keep basic punctuation and letters/digits
-    body = re.sub(r"[^a-zA-Z0-9.,!?'\n\s]", " ", body)
-    body = re.sub(r"\s+", " ", body)
-    return body.strip()
+
+def iter_clean_email_body(text: str, chunk_chars: int = STREAM_CHUNK_CHARS):
+    """
+    Streaming variant of clean_email_body for very large bodies.
+    Yields cleaned chunks; " ".join(chunks) == clean_email_body(text).
+    """
+    if not isinstance(text, str):
+        return
+    body = _split_body(text)
+    if _has_multiline_marker(body):
+        cleaned = clean_email_body(text)
+        if cleaned:
+            yield cleaned
+        return
+
+    buffer, size = [], 0
+    for line in _iter_body_lines(body):
+        buffer.append(line)
+        size += len(line) + 1
+        if size < chunk_chars:
+            continue
+        chunk = _URL_RE.sub("", "\n".join(buffer))
+        chunk = _strip_emails(chunk)
+        tail = chunk.rstrip()[-1:]
+        # only cut where a phone number cannot run on into the next line
+        if tail and (tail.isdecimal() or tail in _PHONE_TAIL_CHARS):
+            continue
+        cleaned = _finish(_PHONE_RE.sub("", chunk))
+        if cleaned:
+            yield cleaned
+        buffer, size = [], 0
+    if buffer:
+        cleaned = _finish(_strip_contacts("\n".join(buffer)))
+        if cleaned:
+            yield cleaned
 
 
 def clean_name(name: str) -> str:
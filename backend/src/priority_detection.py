@@ -1,19 +1,15 @@
 # src/priority_detection.py
-import os
-import requests
 from dotenv import load_dotenv
 
+from src.llm_client import llm_client
+
 load_dotenv()
-API_KEY = os.getenv("OPENROUTER_API_KEY_1")
-if not API_KEY:
-    raise ValueError("Please set OPENROUTER_API_KEY_1 in your .env file.")
 
-API_URL = "https://openrouter.ai/api/v1/chat/completions"
 MODEL = "meta-llama/llama-3.3-8b-instruct:free"
 PRIORITY_LABELS = ["High", "Medium", "Low"]
 
 
-def classify_priority(text: str) -> str:
+def _conversation(text: str) -> list:
     prompt = f"""
 You are an assistant that classifies the importance/urgency of a short email or a thread summary.
 Return ONLY one of: High, Medium, Low.
@@ -23,19 +19,22 @@ Text:
 
 Consider deadlines, explicit urgent words (ASAP, urgent), manager instructions, and actionable items.
 """
-    headers = {"Authorization": f"Bearer {API_KEY}",
-               "Content-Type": "application/json"}
-    data = {"model": MODEL, "messages": [
-        {"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": prompt}]}
-    r = requests.post(API_URL, headers=headers, json=data)
-    if r.status_code != 200:
-        raise Exception(f"OpenRouter error: {r.status_code} {r.text}")
-    label = r.json()["choices"][0]["message"]["content"].strip()
+    return [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": prompt}]
+
+
+def classify_priority(text: str) -> str:
+    label = llm_client.chat(_conversation(text), MODEL)
     if label not in PRIORITY_LABELS:
         return "Medium"
     return label
 
 
+def classify_priorities(texts) -> list:
+    """classify_priority for many texts, requests in parallel; failed ones are Medium."""
+    labels = llm_client.chat_many([_conversation(t) for t in texts], MODEL)
+    return [label if label in PRIORITY_LABELS else "Medium" for label in labels]
+
+
 def classify_thread_priority(thread_summary: str) -> str:
     return classify_priority(thread_summary)
 
@@ -1,33 +1,57 @@
-import spacy  # type: ignore
-import threading
+import os
 import re
-import dateparser  # type: ignore
-from spacy.cli import download  # type: ignore
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer  # type: ignore
+from bisect import bisect_left, bisect_right
+from collections import Counter
 from datetime import datetime
 
-# ---------- Cached spaCy loader ----------
-_nlp = None
-_vader = SentimentIntensityAnalyzer()  # Initialize VADER sentiment analyzer
-_load_lock = threading.Lock()
+from src.date_resolver import date_resolver
+from src.keyword_engine import compile_lexicons, load_lexicons
+from src.model_registry import registry
 
 
 def get_nlp():
-    """Load and cache spaCy model once."""
-    global _nlp
-    with _load_lock:
-        if _nlp is None:
-            model_name = "en_core_web_sm"
-            try:
-                _nlp = spacy.load(model_name, disable=["parser"])
-            except OSError:
-                print(
-                    f"[INFO] spaCy model '{model_name}' not found. Downloading...")
-                download(model_name)
-                _nlp = spacy.load(model_name, disable=["parser"])
-        if "sentencizer" not in _nlp.pipe_names and "senter" not in _nlp.pipe_names:
-            _nlp.add_pipe("sentencizer")
-    return _nlp
+    """The cached spaCy pipeline (loaded on first use or by the background preload)."""
+    return registry.get("spacy")
+
+
+# ---------- Keyword lexicons (data/priority_lexicons.json, or PRIORITY_LEXICONS_PATH) ----------
+LEXICONS = load_lexicons()
+HIGH_KW = frozenset(LEXICONS["high"])
+MED_KW = frozenset(LEXICONS["medium"])
+LOW_KW = frozenset(LEXICONS["low"])
+MODAL_WORDS = tuple(LEXICONS["modal"])
+IMPERATIVE_EXCEPTIONS = tuple(LEXICONS["imperative_exceptions"])
+DEADLINE_LEMMAS = frozenset(LEXICONS["deadline"])
+KEYWORD_LEXICONS = ("high", "medium", "low")
+# a deadline word this many tokens from a date counts as a deadline
+DEADLINE_WINDOW = 6
+
+# Built once at import. Same rules as scanning each set separately:
+# - a single-word entry matches a token whose lowercased lemma is the entry as written
+# - a multi-word entry counts once if it occurs anywhere in the lowercased text
+# - a sentence counts for the modal score if its lowercased text contains a modal
+_lexicon_words = {name: [p for p in LEXICONS[name] if " " not in p] for name in KEYWORD_LEXICONS}
+_lexicon_phrases = {name: [p for p in LEXICONS[name] if " " in p] for name in KEYWORD_LEXICONS}
+LEMMA_MATCHER = compile_lexicons(_lexicon_words, lambda words: ([w] for w in words))
+PHRASE_MATCHER = compile_lexicons(_lexicon_phrases, lambda phrases: (list(p) for p in phrases))
+MODAL_MATCHER = compile_lexicons({"modal": MODAL_WORDS}, lambda phrases: (list(p) for p in phrases))
+
+
+def _keyword_counts(lemmas, lower) -> Counter:
+    """Hits per lexicon: every matching lemma, plus each distinct phrase found in `lower`."""
+    counts = Counter(label for label, _, _ in LEMMA_MATCHER.find(lemmas))
+    found = {(label, lower[start:end]) for label, start, end in PHRASE_MATCHER.find(lower)}
+    counts.update(label for label, _ in found)
+    return counts
+
+
+def _has_modal(sent_lower) -> bool:
+    return bool(MODAL_MATCHER.find(sent_lower))
+
+
+ENTITY_LABELS = frozenset({"DATE", "MONEY", "ORG", "PERSON", "TIME"})
+
+DEBUG = bool(os.getenv("PRIORITY_DEBUG"))
 
 
 # ---------- Manual NLP-based priority detection ----------
@@ -44,51 +68,48 @@ def detect_priority(email_text: str) -> dict:
         "entities": [list of extracted entities]
     }
     """
-    nlp = get_nlp()
-    text = email_text.strip()
-    doc = nlp(text)
+    return detect_priority_batch([email_text])[0]
 
-    # --- Keyword-based heuristic rules ---
 
-    HIGH_KW = {"urgent", "asap", "immediately", "critical", "important", "deadline", "due", "submit", "due by", "action required"}
-    MED_KW = {"update", "review", "schedule", "meeting", "reminder", "follow up", "follow-up"}
-    LOW_KW = {"newsletter", "thanks", "thank you", "invitation", "fyi"}
-
-    lower = text.lower()
+def detect_priority_batch(texts, batch_size: int = 32, n_process: int = 1) -> list:
+    """
+    Batched version of detect_priority: runs all texts through `nlp.pipe`
+    and returns one result dict per text, in order.
+    """
+    nlp = get_nlp()
+    texts = [t.strip() for t in texts]
+    docs = nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
+    # one reference time per batch, so repeated dates hit the resolver's cache
+    now = datetime.now()
+    return [_score_doc(doc, text, now) for doc, text in zip(docs, texts)]
 
-    def count_kw_set(kwset):
-        count = 0
-        for token in doc:
-            if token.lemma_ and token.lemma_.lower() in kwset:
-                count += 1
-        for phrase in [p for p in kwset if " " in p]:
-            if phrase in lower:
-                count += 1
-        return count
 
-    high_count = count_kw_set(HIGH_KW)
-    medium_count = count_kw_set(MED_KW)
-    low_count = count_kw_set(LOW_KW)
+def _score_doc(doc, text: str, now=None) -> dict:
+    # --- Keyword-based heuristic rules: one pass per matcher ---
+    lower = text.lower()
+    counts = _keyword_counts([t.lemma_.lower() for t in doc if t.lemma_], lower)
+    high_count = counts["high"]
+    medium_count = counts["medium"]
+    low_count = counts["low"]
 
     # entity extraction
-    entities = [{"text": ent.text, "label": ent.label_} for ent in doc.ents if ent.label_ in {"DATE", "MONEY", "ORG", "PERSON", "TIME"}]
+    entities = [{"text": ent.text, "label": ent.label_} for ent in doc.ents if ent.label_ in ENTITY_LABELS]
 
     # imperative & modal detection
     imperative_score = 0
     modal_score = 0
-    modal_words = {"must", "should", "need to", "have to","required to", "ought to", "please", "kindly"}
     for sent in doc.sents:
         first = sent[0]
-        if first.pos_ == "VB" and not sent.text.lower().startswith(("please", "just", "kindly")):
-            imperative_score += 2
-            print(f"[DEBUG] Imperative detected: '{sent.text}'")
         sent_lower = sent.text.lower()
-        if any(m in sent_lower for m in modal_words):
+        if first.pos_ == "VB" and not sent_lower.startswith(IMPERATIVE_EXCEPTIONS):
+            imperative_score += 2
+            if DEBUG:
+                print(f"[DEBUG] Imperative detected: '{sent.text}'")
+        if _has_modal(sent_lower):
             modal_score += 1
 
     # sentiment analysis (VADER)
-    vader_res = _vader.polarity_scores(text)
-    neg = vader_res['neg']
+    vader_res = registry.get("vader").polarity_scores(text)
     compound = vader_res['compound']
     sentiment_boost = 0
     if compound <= -0.45:
@@ -96,47 +117,28 @@ def detect_priority(email_text: str) -> dict:
     elif compound <= -0.2:
         sentiment_boost += 1  # moderately negative
 
-    # date proximity boosting
+    # date proximity boosting (fast path + cache, see date_resolver)
     date_boost = 0
+    now = now or datetime.now()
+    date_ents = [ent for ent in doc.ents if ent.label_ == "DATE"]
     parsed_dates = []
-    now = datetime.now()
-    for ent in doc.ents:
-        if ent.label_ == "DATE":
-            parsed_date = dateparser.parse(
-                ent.text,
-                settings={
-                    'RELATIVE_BASE': now,
-                    'PREFER_DATES_FROM': 'future'
-                }
-            )
-            if parsed_date:
-                delta_days = (parsed_date - now).days
-                print(delta_days)
-                if 0 <= delta_days <= 30:
-                    parsed_dates.append(parsed_date)
-
-    for d in parsed_dates:
-        if d:
-            delta_days = (d - now).days
-            if delta_days <= 7:
-                date_boost += 3
-            elif 7 < delta_days <= 21:
-                date_boost += 1
-            else:
-                continue
+    for parsed_date in date_resolver.resolve_many([ent.text for ent in date_ents], now):
+        if parsed_date:
+            delta_days = (parsed_date - now).days
+            if 0 <= delta_days <= 30:
+                parsed_dates.append(parsed_date)
+                if delta_days <= 7:
+                    date_boost += 3
+                elif delta_days <= 21:
+                    date_boost += 1
 
     if parsed_dates:
-        date_token_idxs = set()
-        for ent in doc.ents:
-            if ent.label_ == "DATE":
-                for token in ent:
-                    date_token_idxs.add(token.i)
-        deadline_idxs = [token.i for token in doc if token.lemma_ in {
-            "deadline", "due", "submit"}]
-        for di in deadline_idxs:
-            for ti in date_token_idxs:
-                if abs(di - ti) <= 6:
-                    date_boost += 2
+        # sorted date positions: each deadline counts the dates within the window by bisection
+        date_token_idxs = sorted(token.i for ent in date_ents for token in ent)
+        for di in (token.i for token in doc if token.lemma_ in DEADLINE_LEMMAS):
+            near = (bisect_right(date_token_idxs, di + DEADLINE_WINDOW)
+                    - bisect_left(date_token_idxs, di - DEADLINE_WINDOW))
+            date_boost += 2 * near
 
     # final score calculation
     score = high_count * 4 + medium_count * 2 - low_count
@@ -144,7 +146,8 @@ def detect_priority(email_text: str) -> dict:
     score += modal_score
     score += sentiment_boost
     score += date_boost
-    print(f"[DEBUG] score breakdown: high={high_count*4}, medium={medium_count*2}, low={-low_count}, imperative={imperative_score*2}, modal={modal_score}, sentiment={sentiment_boost}, date={date_boost}")
+    if DEBUG:
+        print(f"[DEBUG] score breakdown: high={high_count*4}, medium={medium_count*2}, low={-low_count}, imperative={imperative_score*2}, modal={modal_score}, sentiment={sentiment_boost}, date={date_boost}")
 
     if score >= 7:
         priority = "High"
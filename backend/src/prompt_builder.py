@@ -0,0 +1,185 @@
+# src/prompt_builder.py
+import os
+import re
+
+from src.text_rank_summarization import rank_sentences
+
+# Rough token budget for the thread text in one prompt (instructions excluded)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+# Share of the budget reserved for the newest messages, kept verbatim
+RECENT_SHARE = float(os.getenv("PROMPT_RECENT_SHARE", "0.5"))
+# Words per shingle; quoted text is recognised as runs of SHINGLE_WORDS words already seen
+SHINGLE_WORDS = 8
+CHARS_PER_TOKEN = 4
+OMITTED = "[...]"
+
+_WORD_RE = re.compile(r"\w+")
+_SPACE_RUN_RE = re.compile(r"[ \t]{2,}")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+_BLANK_RUN_RE = re.compile(r"\n{3,}")
+
+_HASH_BASE = 1000003
+_HASH_MOD = (1 << 61) - 1
+_HASH_TOP = pow(_HASH_BASE, SHINGLE_WORDS - 1, _HASH_MOD)
+
+
+def estimate_tokens(text) -> int:
+    """~4 characters per token, close enough for English prose and cheap."""
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _shingles(word_ids):
+    """Rolling (Rabin-Karp) hash of every SHINGLE_WORDS-word window, by start position."""
+    if len(word_ids) < SHINGLE_WORDS:
+        return []
+    h = 0
+    for w in word_ids[:SHINGLE_WORDS]:
+        h = (h * _HASH_BASE + w) % _HASH_MOD
+    hashes = [h]
+    for i in range(SHINGLE_WORDS, len(word_ids)):
+        h = ((h - word_ids[i - SHINGLE_WORDS] * _HASH_TOP) * _HASH_BASE + word_ids[i]) % _HASH_MOD
+        hashes.append(h)
+    return hashes
+
+
+class QuoteFilter:
+    """
+    Drops text a thread has already shown: each message is checked against
+    the shingles of every earlier one, then its own shingles are added.
+    Only the words inside a repeated SHINGLE_WORDS-word window go; the rest
+    of the message is kept as written. This works the same on raw bodies and
+    on clean_message, where line breaks and ":" are already gone.
+    """
+
+    def __init__(self):
+        self.seen = set()
+        self._vocab = {}
+
+    def _word_ids(self, words):
+        return [self._vocab.setdefault(w, len(self._vocab) + 1) for w in words]
+
+    def add(self, text):
+        words = [w.lower() for w in _WORD_RE.findall(text or "")]
+        self.seen.update(_shingles(self._word_ids(words)))
+
+    def filter(self, text) -> str:
+        """`text` without the passages earlier messages already contained; remembers `text`."""
+        text = text or ""
+        spans = [m.span() for m in _WORD_RE.finditer(text)]
+        hashes = _shingles(self._word_ids([text[a:b].lower() for a, b in spans]))
+        covered = [False] * len(spans)
+        for start, h in enumerate(hashes):
+            if h in self.seen:
+                covered[start:start + SHINGLE_WORDS] = [True] * SHINGLE_WORDS
+        self.seen.update(hashes)
+        if not any(covered):
+            return text.strip()
+
+        # cut each run of covered words up to the next kept word
+        kept, pos, i = [], 0, 0
+        while i < len(spans):
+            if not covered[i]:
+                i += 1
+                continue
+            j = i
+            while j < len(spans) and covered[j]:
+                j += 1
+            kept.append(text[pos:spans[i][0]])
+            pos = spans[j][0] if j < len(spans) else len(text)
+            i = j
+        kept.append(text[pos:])
+        out = _SPACE_RUN_RE.sub(" ", "".join(kept))
+        return _BLANK_RUN_RE.sub("\n\n", out).strip()
+
+
+def _text_key(m):
+    return "text" if "text" in m else "clean_message"
+
+
+def dedupe_messages(thread_messages, context=()):
+    """
+    Copies of the messages (oldest first) with quoted earlier text removed.
+    `context` are earlier messages of the thread that are not part of the
+    prompt themselves (e.g. already summarized) but may be quoted.
+    """
+    quotes = QuoteFilter()
+    for m in context:
+        quotes.add(m.get("text") or m.get("clean_message"))
+    out = []
+    for m in thread_messages:
+        key = _text_key(m)
+        out.append(dict(m, **{key: quotes.filter(m.get(key))}))
+    return out
+
+
+def _sentences(text):
+    return [s.strip() for s in _SENTENCE_RE.split(text or "") if s.strip()]
+
+
+def _top_sentences(texts, token_budget):
+    """
+    Keep the highest-TextRank sentences of `texts` that fit token_budget,
+    in their original order; returns one shortened text per input.
+    """
+    sentences = [(i, s) for i, t in enumerate(texts) for s in _sentences(t)]
+    if not sentences:
+        return list(texts)
+    try:
+        scores = rank_sentences([s for _, s in sentences])
+    except Exception as e:
+        # no NLTK data: prefer the later sentences instead
+        print(f"[PromptBuilder] TextRank unavailable ({e}); keeping the latest sentences")
+        scores = list(range(len(sentences)))
+    chosen, used = set(), 0
+    for k in sorted(range(len(sentences)), key=lambda k: scores[k], reverse=True):
+        cost = estimate_tokens(sentences[k][1]) + 1
+        if used + cost <= token_budget:
+            chosen.add(k)
+            used += cost
+    out = [[] for _ in texts]
+    for k, (i, s) in enumerate(sentences):
+        if k in chosen:
+            out[i].append(s)
+        elif not out[i] or out[i][-1] != OMITTED:
+            out[i].append(OMITTED)
+    return [" ".join(parts) for parts in out]
+
+
+def fit_to_budget(thread_messages, token_budget=None, overhead=lambda m: 0):
+    """
+    Shorten messages (oldest first) so their text fits token_budget:
+    the newest ones are kept verbatim up to RECENT_SHARE of the budget,
+    the older ones are cut down to their highest-TextRank sentences.
+    `overhead(m)` is the per-message formatting cost (sender line etc.).
+    """
+    token_budget = token_budget or PROMPT_TOKEN_BUDGET
+    messages = list(thread_messages)
+    costs = [estimate_tokens(m.get(_text_key(m))) + overhead(m) for m in messages]
+    if sum(costs) <= token_budget:
+        return messages
+
+    recent_budget = int(token_budget * RECENT_SHARE)
+    split, used = len(messages), 0
+    while split > 0 and used + costs[split - 1] <= recent_budget:
+        split -= 1
+        used += costs[split]
+    if split == len(messages):
+        # the newest message alone is over the recent share: keep its start
+        # (all of the budget when there is nothing older to make room for)
+        if len(messages) == 1:
+            recent_budget = token_budget
+        m = messages[-1]
+        key = _text_key(m)
+        limit = max(0, recent_budget - overhead(m)) * CHARS_PER_TOKEN
+        messages[-1] = dict(m, **{key: (m.get(key) or "")[:limit].rstrip() + f" {OMITTED}"})
+        used = recent_budget
+        split -= 1
+
+    older = messages[:split]
+    remaining = token_budget - used - sum(overhead(m) for m in older)
+    if remaining <= 0:
+        return messages[split:]
+    shortened = _top_sentences([m.get(_text_key(m)) or "" for m in older], remaining)
+    older = [dict(m, **{_text_key(m): text}) for m, text in zip(older, shortened)]
+    return older + messages[split:]
+
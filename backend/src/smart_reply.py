@@ -1,24 +1,15 @@
-import os
-import requests
-import json
-import time
 from dotenv import load_dotenv
 
-from src.key_manager import key_manager
+from src.llm_client import llm_client, LLMError
 
 # --- Load environment variables ---
 load_dotenv()
 
-API_URL = "https://openrouter.ai/api/v1/chat/completions"
 MODEL = "google/gemma-2-9b-it:free"  # same as analyze_email()
+FALLBACK_REPLY = "Thanks for the update! I’ve noted your points and will follow up shortly."
 
-def suggest_reply(summary_data_or_text, model=MODEL):
-    """
-    Generates a smart email reply based on either:
-    - a dict containing summary info (Decisions, Action Items, etc.)
-    - OR a plain message body string (if summary not available).
-    """
 
+def build_reply_prompt(summary_data_or_text) -> str:
     # --- Determine if we got structured summary data or raw text ---
     if isinstance(summary_data_or_text, dict):
         summary_data = summary_data_or_text
@@ -54,45 +45,58 @@ def suggest_reply(summary_data_or_text, model=MODEL):
         ---
         Return ONLY the reply text (no JSON or markdown).
         """
+    return prompt
 
-    # --- Build headers and request payload ---
-    current_api_key = key_manager.get_key()
-    headers = {
-        "Authorization": f"Bearer {current_api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "http://localhost:3000",
-        "X-Title": "SmartMail Backend"
-    }
-
-    data = {
-        "model": model,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.7,  # slightly creative for natural tone
-    }
-
-    # --- Exponential Backoff Logic ---
-    max_retries = 4
-    for attempt in range(max_retries):
-        try:
-            r = requests.post(API_URL, headers=headers, json=data, timeout=20)
-            r.raise_for_status()
-
-            response_text = r.json()["choices"][0]["message"]["content"].strip()
-            if response_text:
-                return response_text
-
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 429 and attempt < max_retries - 1:
-                delay = 2 ** attempt
-                print(f"[SuggestReply] Rate limit exceeded. Retrying in {delay}s...")
-                time.sleep(delay)
-            else:
-                print(f"[SuggestReply] HTTP Error: {e}")
-                break
-        except Exception as e:
-            print(f"[SuggestReply] Unexpected error: {e}")
-            break
+
+def suggest_reply(summary_data_or_text, model=MODEL):
+    """
+    Generates a smart email reply based on either:
+    - a dict containing summary info (Decisions, Action Items, etc.)
+    - OR a plain message body string (if summary not available).
+    """
+    prompt = build_reply_prompt(summary_data_or_text)
+
+    # --- Shared client: pooled connection, key rotation, backoff on 429/5xx ---
+    try:
+        response_text = llm_client.chat(
+            [{"role": "user", "content": prompt}],
+            model,
+            temperature=0.7,  # slightly creative for natural tone
+            timeout=20
+        )
+        if response_text:
+            return response_text
+    except LLMError as e:
+        print(f"[SuggestReply] LLM error: {e}")
 
     # --- Fallback reply if model fails ---
-    return "Thanks for the update! I’ve noted your points and will follow up shortly."
+    return FALLBACK_REPLY
+
+
+def stream_reply(summary_data_or_text, model=MODEL):
+    """
+    Streaming suggest_reply: yields the reply piece by piece as the model
+    produces it. If the upstream fails before the first token the canned
+    reply is yielded instead; a stream that breaks midway just ends.
+    """
+    prompt = build_reply_prompt(summary_data_or_text)
+    sent = False
+    try:
+        for piece in llm_client.stream_chat(
+            [{"role": "user", "content": prompt}],
+            model,
+            temperature=0.7,
+            timeout=20
+        ):
+            if not sent:
+                # match suggest_reply(), which strips the finished reply
+                piece = piece.lstrip()
+                if not piece:
+                    continue
+            sent = True
+            yield piece
+    except LLMError as e:
+        print(f"[SuggestReply] LLM stream error: {e}")
+    if not sent:
+        yield FALLBACK_REPLY
 
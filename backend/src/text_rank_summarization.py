@@ -1,13 +1,79 @@
 import numpy as np
-import networkx as nx
+from scipy import sparse
 
-from src.nltk_downloader import ensure_nltk_data
-ensure_nltk_data()
-
-from nltk.tokenize import sent_tokenize, word_tokenize
-from nltk.corpus import stopwords
 import re
 
+from src.model_registry import registry
+
+# PageRank settings (same defaults as networkx.pagerank)
+DAMPING = 0.85
+MAX_ITER = 100
+TOL = 1.0e-6
+
+_PUNCT_RE = re.compile(r'[^\w\s]')
+
+
+def _incidence_matrix(clean_sentences):
+    """Sparse binary sentence x term matrix (1 where the term occurs in the sentence)."""
+    vocab = {}
+    rows, cols = [], []
+    for i, words in enumerate(clean_sentences):
+        for w in set(words):
+            rows.append(i)
+            cols.append(vocab.setdefault(w, len(vocab)))
+    data = np.ones(len(rows), dtype=np.float64)
+    return sparse.csr_matrix((data, (rows, cols)), shape=(len(clean_sentences), max(1, len(vocab))))
+
+
+def jaccard_matrix(clean_sentences):
+    """
+    All pairwise Jaccard similarities as a sparse matrix with a zero diagonal.
+    |A ∩ B| comes from one sparse product; |A ∪ B| = |A| + |B| - |A ∩ B|.
+    """
+    incidence = _incidence_matrix(clean_sentences)
+    sizes = np.asarray(incidence.sum(axis=1)).ravel()
+    overlap = (incidence @ incidence.T).tocoo()
+    mask = overlap.row != overlap.col
+    rows, cols, inter = overlap.row[mask], overlap.col[mask], overlap.data[mask]
+    union = sizes[rows] + sizes[cols] - inter
+    n = len(clean_sentences)
+    return sparse.csr_matrix((inter / union, (rows, cols)), shape=(n, n))
+
+
+def pagerank(weights, damping=DAMPING, max_iter=MAX_ITER, tol=TOL):
+    """
+    Weighted PageRank by power iteration on the row-normalized matrix.
+    Rows with no edges (dangling sentences) spread their rank uniformly,
+    matching networkx.pagerank.
+    """
+    n = weights.shape[0]
+    out_weight = np.asarray(weights.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    inv = np.zeros(n)
+    inv[~dangling] = 1.0 / out_weight[~dangling]
+    transition = sparse.diags(inv) @ weights
+
+    x = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        prev = x
+        x = damping * (prev @ transition + prev[dangling].sum() / n) + (1.0 - damping) / n
+        if np.abs(x - prev).sum() < n * tol:
+            break
+    return x
+
+
+def rank_sentences(sentences):
+    """TextRank score for each sentence, in input order."""
+    nltk = registry.get("nltk")
+    stop_words = nltk.stop_words
+    clean_sentences = []
+    for sentence in sentences:
+        # Remove punctuation and convert to lower case
+        clean = _PUNCT_RE.sub('', sentence).lower()
+        clean_sentences.append([word for word in nltk.word_tokenize(clean) if word not in stop_words])
+    return pagerank(jaccard_matrix(clean_sentences))
+
+
 def textrank_summary(raw_text, num_sentences=3):
     """
     Performs extractive summarization using the TextRank algorithm.
@@ -20,55 +86,18 @@ def textrank_summary(raw_text, num_sentences=3):
         str: The generated summary.
     """
     # 1. Tokenize text into sentences
-    sentences = sent_tokenize(raw_text)
+    sentences = registry.get("nltk").sent_tokenize(raw_text)
     if len(sentences) <= num_sentences:
         return raw_text # Return original text if it's short
 
-    # 2. Pre-process sentences: clean and tokenize into words
-    stop_words = set(stopwords.words('english'))
-    clean_sentences = []
-    for sentence in sentences:
-        # Remove punctuation and convert to lower case
-        clean = re.sub(r'[^\w\s]', '', sentence).lower()
-        words = [word for word in word_tokenize(clean) if word not in stop_words]
-        clean_sentences.append(words)
-
-    # 3. Create the similarity matrix
-    num_sents = len(sentences)
-    similarity_matrix = np.zeros((num_sents, num_sents))
-
-    for i in range(num_sents):
-        for j in range(num_sents):
-            if i == j:  # Sentences can't be similar to themselves in this context
-                continue
-            
-            # Calculate similarity based on common words
-            words_i = set(clean_sentences[i])
-            words_j = set(clean_sentences[j])
-            
-            if len(words_i) == 0 or len(words_j) == 0:
-                similarity_matrix[i][j] = 0
-            else:
-                # Jaccard similarity
-                similarity = len(words_i.intersection(words_j)) / len(words_i.union(words_j))
-                similarity_matrix[i][j] = similarity
-
-    # 4. Create a graph from the similarity matrix
-    graph = nx.from_numpy_array(similarity_matrix)
-
-    # 5. Apply the PageRank algorithm to the graph
-    # This gives a score to each sentence (node)
-    scores = nx.pagerank(graph)
-
-    # 6. Rank sentences by their score
-    ranked_sentences = sorted(((scores[i], s) for i, s in enumerate(sentences)), reverse=True)
-
-    # 7. Extract the top N sentences
-    top_sentences = []
-    for i in range(min(num_sentences, len(ranked_sentences))):
-        top_sentences.append(ranked_sentences[i][1])
-        
-    # 8. Re-order sentences to their original sequence and join
-    summary = ' '.join(sorted(top_sentences, key=lambda s: raw_text.find(s)))
+    # 2. Score sentences (sparse Jaccard graph + PageRank)
+    scores = rank_sentences(sentences)
+
+    # 3. Take the top N (ties broken by sentence text, as before)
+    ranked = sorted(range(len(sentences)), key=lambda i: (scores[i], sentences[i]), reverse=True)
+    top = ranked[:num_sentences]
+
+    # 4. Re-order sentences to their original sequence and join
+    summary = ' '.join(sentences[i] for i in sorted(top))
 
     return summary
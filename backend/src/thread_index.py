@@ -0,0 +1,147 @@
+# src/thread_index.py
+import os
+import pickle
+import threading
+
+from pymongo import ASCENDING
+
+# Set to a file path to keep a snapshot of the index between runs
+THREAD_INDEX_PATH = os.getenv("THREAD_INDEX_PATH")
+
+
+def participants_from_processed(proc) -> set:
+    """Sender and all recipients of a preprocessed email."""
+    parts = set()
+    if proc.get("from", {}).get("email"):
+        parts.add(proc["from"]["email"])
+    for p in proc.get("to", []) + proc.get("cc", []) + proc.get("bcc", []):
+        if p.get("email"):
+            parts.add(p["email"])
+    return parts
+
+
+def thread_participants(thread) -> set:
+    """Participants of a stored thread doc (senders and To recipients)."""
+    if thread.get("participants"):
+        return set(thread["participants"])
+    parts = set()
+    for m in thread.get("messages", []):
+        f = m.get("from") or {}
+        if f.get("email"):
+            parts.add(f["email"])
+        for r in m.get("to") or []:
+            if r.get("email"):
+                parts.add(r["email"])
+    return parts
+
+
+class ThreadIndex:
+    """
+    In-process subject index: (normalized subject, participant) -> thread id
+    (first thread wins, like the old subject scan which returned the oldest
+    match). Lookups are O(1) per participant; message-id lookups are the
+    ThreadingEngine's. Merged threads are repointed to the surviving one.
+    """
+
+    def __init__(self, path=THREAD_INDEX_PATH):
+        self._lock = threading.Lock()
+        self.path = path
+        self.by_subject_participant = {}
+        self._keys_by_thread = {}   # thread id -> its keys, for repoint()
+
+    def _set(self, key, thread_id):
+        self.by_subject_participant[key] = thread_id
+        self._keys_by_thread.setdefault(thread_id, []).append(key)
+
+    def add(self, thread_id, subject_norm="", participants=()):
+        if not subject_norm:
+            return
+        with self._lock:
+            for p in participants:
+                if (subject_norm, p) not in self.by_subject_participant:
+                    self._set((subject_norm, p), thread_id)
+
+    def add_thread(self, thread):
+        self.add(thread["_id"], thread.get("subject_norm") or "", thread_participants(thread))
+
+    def find_by_subject(self, subject_norm, participants):
+        if not subject_norm:
+            return None
+        for p in participants:
+            thread_id = self.by_subject_participant.get((subject_norm, p))
+            if thread_id is not None:
+                return thread_id
+        return None
+
+    def repoint(self, merged_id, surviving_id) -> int:
+        """Entries of a thread merged into another now name the surviving thread."""
+        with self._lock:
+            keys = self._keys_by_thread.pop(merged_id, [])
+            for key in keys:
+                self._set(key, surviving_id)
+        return len(keys)
+
+    def warm(self, threads_col, query=None):
+        """Load (a subset of) the thread collection into the index."""
+        projection = {"subject_norm": 1, "participants": 1, "messages.from.email": 1, "messages.to.email": 1}
+        count = 0
+        for t in threads_col.find(query or {}, projection):
+            self.add_thread(t)
+            count += 1
+        return count
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            with open(path, "wb") as f:
+                pickle.dump(self.by_subject_participant, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path=None, threads_col=None) -> bool:
+        """
+        Merge a snapshot into the index. With `threads_col`, entries naming
+        threads that no longer exist (merged by another process) are skipped.
+        """
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return False
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if isinstance(state, tuple):
+            state = state[-1]   # older snapshots also held a message-id map
+        if threads_col is not None:
+            live = {t["_id"] for t in threads_col.find({"_id": {"$in": list(set(state.values()))}}, {"_id": 1})}
+            state = {key: tid for key, tid in state.items() if tid in live}
+        with self._lock:
+            for key, tid in state.items():
+                if key not in self.by_subject_participant:
+                    self._set(key, tid)
+        return True
+
+    def stats(self) -> dict:
+        return {"subject_participants": len(self.by_subject_participant), "threads": len(self._keys_by_thread)}
+
+
+def ensure_indexes(threads_col):
+    """Create the Mongo indexes the threading lookups rely on (idempotent)."""
+    threads_col.create_index([("subject_norm", ASCENDING), ("participants", ASCENDING)])
+    threads_col.create_index([("last_updated", ASCENDING)])
+
+
+# Shared instance used by thread_manager and the ingest command
+thread_index = ThreadIndex()
+
+
+def init_thread_index(threads_col, warm=True):
+    """
+    Startup hook: make sure the Mongo indexes exist, then fill the in-process
+    index from the snapshot file (if configured) or from the collection.
+    """
+    ensure_indexes(threads_col)
+    if thread_index.load(threads_col=threads_col):
+        print(f"[ThreadIndex] Loaded snapshot {THREAD_INDEX_PATH}: {thread_index.stats()}")
+    elif warm:
+        count = thread_index.warm(threads_col)
+        print(f"[ThreadIndex] Indexed {count} threads: {thread_index.stats()}")
+    return thread_index
@@ -2,124 +2,134 @@
 from pymongo import MongoClient
 from datetime import datetime
 from bson import ObjectId
+import os
+
+from src.thread_index import thread_index, init_thread_index, participants_from_processed
+from src.threading_engine import (ThreadingEngine, MESSAGE_KEY_PROJECTION, allocate_seq, ensure_message_indexes,
+                                  ensure_message_seq, load_related, mark_dirty, merge_threads, message_doc,
+                                  migrate_embedded_messages, new_thread_doc)
+
+# Set when this process is the only writer and init_threading() ran at
+# startup: threading then never has to look anything up in Mongo.
+THREAD_INDEX_AUTHORITATIVE = bool(os.getenv("THREAD_INDEX_AUTHORITATIVE"))
 
 client = MongoClient("mongodb://localhost:27017/")
 db = client["enron_email"]
 emails_col = db["mails"]
 threads_col = db["threads"]
+messages_col = db["thread_messages"]
 
+engine = ThreadingEngine(thread_index)
 
-def _participants_from_processed(proc):
-    parts = set()
-    if proc.get("from", {}).get("email"):
-        parts.add(proc["from"]["email"])
-    for p in proc.get("to", []) + proc.get("cc", []) + proc.get("bcc", []):
-        if p.get("email"):
-            parts.add(p["email"])
-    return parts
 
-
-def find_thread_by_in_reply(in_reply_to):
-    if not in_reply_to:
-        return None
-    # try exact match in thread messages
-    return threads_col.find_one({"messages.message_id": in_reply_to})
-
-
-def find_thread_by_references(references):
-    if not references:
-        return None
-    return threads_col.find_one({"messages.message_id": {"$in": references}})
+def init_threading(threads=None, messages=None):
+    """
+    Startup hook: create indexes, move any old embedded message arrays out of
+    the thread docs, then rebuild the subject index and the thread trees.
+    """
+    threads = threads if threads is not None else threads_col
+    messages = messages if messages is not None else messages_col
+    init_thread_index(threads)
+    ensure_message_indexes(messages)
+    moved = migrate_embedded_messages(threads, messages)
+    if moved:
+        print(f"[Threading] Moved {moved} embedded messages to {messages.name}")
+    numbered = ensure_message_seq(threads, messages)
+    if numbered:
+        print(f"[Threading] Numbered the messages of {numbered} threads")
+    count, merges = engine.load(messages.find({}, MESSAGE_KEY_PROJECTION))
+    # stored threads whose messages turn out to be linked become one
+    for merged_id, _ in merges:
+        merge_threads(threads, messages, merged_id, engine.canonical(merged_id))
+    print(f"[Threading] Loaded {count} messages: {engine.stats()}")
 
 
 def find_thread_by_subject_and_participants(subject_norm, participants):
     if not subject_norm:
         return None
-    candidates = threads_col.find({"subject_norm": subject_norm})
-    for t in candidates:
-        # gather participants in thread
-        thread_parts = set()
-        for m in t.get("messages", []):
-            # m['from'] might be dict
-            f = m.get("from", {})
-            if f and f.get("email"):
-                thread_parts.add(f["email"])
-            for r in m.get("to", []):
-                if r.get("email"):
-                    thread_parts.add(r["email"])
-        if participants & thread_parts:
-            return t
-    return None
+    # served by the (subject_norm, participants) index
+    return threads_col.find_one({"subject_norm": subject_norm, "participants": {"$in": list(participants)}},
+                                {"subject_norm": 1, "participants": 1})
 
 
 def add_to_thread(processed_email: dict, email_id):
     """
     processed_email: result of preprocess_email()
     email_id: the original _id or a generated id (string/ObjectId)
+    Replies that arrived before their parent are merged into the parent's
+    thread once the link shows up.
     """
-    message_id = processed_email.get("message_id")
-    in_reply_to = processed_email.get("in_reply_to")
-    references = processed_email.get("references", [])
     subj_norm = processed_email.get("normalized_subject", "")
-    participants = _participants_from_processed(processed_email)
-
-    # 1. Try in_reply_to
-    thread = find_thread_by_in_reply(in_reply_to) if in_reply_to else None
-
-    # 2. Try references
-    if not thread and references:
-        thread = find_thread_by_references(references)
-
-    # 3. Fallback to subject + participants overlap
-    if not thread and subj_norm:
-        thread = find_thread_by_subject_and_participants(
-            subj_norm, participants)
-
-    # 4. Insert or update
-    message_obj = {
-        "email_id": str(email_id),
-        "message_id": message_id,
-        "from": processed_email.get("from"),
-        "to": processed_email.get("to"),
-        "cc": processed_email.get("cc"),
-        "date": processed_email.get("date"),
-        "clean_message": processed_email.get("clean_message")
-    }
-
-    if thread:
-        threads_col.update_one(
-            {"_id": thread["_id"]},
-            {"$push": {"messages": message_obj}, "$set": {
-                "last_updated": datetime.now()}}
-        )
-        return thread["_id"]
+    participants = participants_from_processed(processed_email)
+
+    merges = []
+    if not THREAD_INDEX_AUTHORITATIVE:
+        # another writer may have threaded related messages since startup
+        merges = load_related(engine, messages_col, [processed_email])[1]
+        if thread_index.find_by_subject(subj_norm, participants) is None:
+            thread = find_thread_by_subject_and_participants(subj_norm, participants)
+            if thread:
+                thread_index.add_thread(thread)
+
+    thread_id, is_new, added_merges = engine.add(
+        processed_email.get("message_id"),
+        processed_email.get("in_reply_to"),
+        processed_email.get("references", []),
+        subj_norm, participants)
+    merges += added_merges
+
+    # a new thread is stored with its counter before its first message, so
+    # another writer never numbers a message 1 as well; the message is stored
+    # before its thread is marked dirty, so a refresh that finds the thread
+    # dirty also finds the message
+    now = datetime.now()
+    if is_new:
+        threads_col.insert_one(new_thread_doc(thread_id, processed_email, participants, now))
+        seq = 1
     else:
-        new_thread = {
-            "subject": processed_email.get("subject", ""),
-            "subject_norm": subj_norm,
-            "created_at": datetime.now(),
-            "last_updated": datetime.now(),
-            "messages": [message_obj],
-            "summary": None,
-            "priority": None
-        }
-        res = threads_col.insert_one(new_thread)
-        return res.inserted_id
+        seq = allocate_seq(threads_col, thread_id)
+    messages_col.insert_one(message_doc(processed_email, email_id, thread_id, seq))
+    update = {} if is_new else {"$inc": {"message_count": 1},
+                                "$addToSet": {"participants": {"$each": sorted(participants)}}}
+    threads_col.update_one({"_id": thread_id}, mark_dirty(update, now))
+    for merged_id, _ in merges:
+        merge_threads(threads_col, messages_col, merged_id, engine.canonical(merged_id))
+    return thread_id
 
 
 def get_thread_by_message_id(message_id):
-    return threads_col.find_one({"messages.message_id": message_id})
+    thread_id = engine.thread_of(message_id)
+    if thread_id is None:
+        doc = messages_col.find_one({"message_id": message_id}, {"thread_id": 1})
+        thread_id = doc and doc["thread_id"]
+    return threads_col.find_one({"_id": thread_id}) if thread_id is not None else None
+
+
+def get_thread_messages(thread_id, after_seq=None):
+    """Messages of a thread, oldest first; only those numbered after `after_seq` if given."""
+    query = {"thread_id": thread_id}
+    if after_seq is not None:
+        query["seq"] = {"$gt": after_seq}
+    return list(messages_col.find(query).sort([("date", 1), ("_id", 1)]))
 
 
 def list_threads(limit=10):
     return list(threads_col.find().sort("last_updated", -1).limit(limit))
 
 
-def update_thread_summary(thread_id, summary_text):
+# last_updated means "a message was added": summaries and priorities leave it
+# alone, so an unchanged thread can be recognised and skipped next time.
+def update_thread_summary(thread_id, summary_text, as_of=None, high_water_mark=None):
+    """
+    Store a thread summary. `as_of` is the thread's last_updated the summary
+    covers and `high_water_mark` the number (`seq`) of the last message it
+    includes; the next run only feeds messages after that mark to the model.
+    """
     threads_col.update_one({"_id": ObjectId(thread_id)}, {
-                           "$set": {"summary": summary_text, "last_updated": datetime.now()}})
+                           "$set": {"summary": summary_text, "summary_as_of": as_of,
+                                    "summary_hwm": high_water_mark}})
 
 
 def update_thread_priority(thread_id, priority_level):
     threads_col.update_one({"_id": ObjectId(thread_id)}, {
-                           "$set": {"priority": priority_level, "last_updated": datetime.now()}})
+                           "$set": {"priority": priority_level}})
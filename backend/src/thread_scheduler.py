@@ -0,0 +1,185 @@
+# src/thread_scheduler.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+
+# Threads refreshed at once (each one is an LLM call plus a priority pass)
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", "4"))
+# A claimed thread is left to its worker this long before another may take it
+SCHEDULER_LEASE_SEC = int(os.getenv("SCHEDULER_LEASE_SEC", "300"))
+SCHEDULER_POLL_SEC = float(os.getenv("SCHEDULER_POLL_SEC", "10"))
+# A failed refresh is retried after RETRY_BASE_SEC, doubling per failure up to RETRY_MAX_SEC
+SCHEDULER_RETRY_BASE_SEC = int(os.getenv("SCHEDULER_RETRY_BASE_SEC", "30"))
+SCHEDULER_RETRY_MAX_SEC = int(os.getenv("SCHEDULER_RETRY_MAX_SEC", "3600"))
+# A thread that is not ready yet (see NOT_READY) is looked at again after this long
+SCHEDULER_WAIT_SEC = int(os.getenv("SCHEDULER_WAIT_SEC", "15"))
+
+# refresh() outcome for a thread that cannot be finished yet without anything
+# being wrong, e.g. a message number another writer has not stored yet
+NOT_READY = "not_ready"
+
+# Drain order: threads already known to be urgent first, then unrated ones
+# (None also stands for any unknown label), then Medium and Low
+PRIORITY_ORDER = ("High", None, "Medium", "Low")
+PRIORITY_LABELS = [p for p in PRIORITY_ORDER if p]
+DIRTY_PROJECTION = {"priority": 1, "dirty_since": 1, "version": 1}
+
+
+def retry_delay(failures) -> timedelta:
+    return timedelta(seconds=min(SCHEDULER_RETRY_MAX_SEC, SCHEDULER_RETRY_BASE_SEC * 2 ** max(0, failures - 1)))
+
+
+def _due(now):
+    """Not waiting out a retry delay."""
+    return {"$or": [{"retry_at": {"$exists": False}}, {"retry_at": {"$lte": now}}]}
+
+
+def ensure_scheduler_fields(threads_col):
+    """Index the dirty set and give threads stored before change tracking a version."""
+    threads_col.create_index([("dirty", ASCENDING), ("dirty_since", ASCENDING)])
+    # pending(): one index range per priority, already in dirty_since order
+    threads_col.create_index([("dirty", ASCENDING), ("priority", ASCENDING), ("dirty_since", ASCENDING)])
+    now = datetime.now()
+    # never summarized -> dirty; already summarized -> clean until the next message
+    threads_col.update_many({"version": {"$exists": False}, "summary": None},
+                            {"$set": {"version": 1, "processed_version": 0, "dirty": True, "dirty_since": now}})
+    threads_col.update_many({"version": {"$exists": False}},
+                            {"$set": {"version": 1, "processed_version": 1, "dirty": False}})
+
+
+class ThreadScheduler:
+    """
+    Drains dirty threads (see threading_engine.mark_dirty) through
+    `refresh(thread_doc)`, which recomputes the summary. It returns
+    (done, summary): done=False or NOT_READY leaves the thread dirty, and a
+    new summary goes to `prioritize([(thread_doc, summary), ...])`, called
+    once per drain.
+    - High-priority threads go first, then by how long they have been dirty
+    - at most `concurrency` refreshes run at once
+    - a thread is claimed with a lease, so several schedulers can share the set
+    - on success the thread is marked clean only if no message arrived
+      meanwhile (its version is unchanged); otherwise it stays dirty
+    - a failed thread waits retry_delay(failures) before it is tried again;
+      a thread that is not ready waits SCHEDULER_WAIT_SEC and is not a failure
+    """
+
+    def __init__(self, threads_col, refresh, prioritize=None, concurrency=SCHEDULER_CONCURRENCY,
+                 lease_sec=SCHEDULER_LEASE_SEC):
+        self.threads_col = threads_col
+        self.refresh = refresh
+        self.prioritize = prioritize
+        self.concurrency = max(1, concurrency)
+        self.lease = timedelta(seconds=lease_sec)
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.waiting = 0
+        self.last_drain = None
+
+    def pending(self, limit=None) -> list:
+        """Dirty threads that are due, in drain order (indexed queries, no client-side sort)."""
+        now = datetime.now()
+        docs = []
+        for priority in PRIORITY_ORDER:
+            if limit and len(docs) >= limit:
+                break
+            match = priority if priority else {"$nin": PRIORITY_LABELS}
+            cursor = self.threads_col.find({"dirty": True, "priority": match, **_due(now)}, DIRTY_PROJECTION)
+            cursor = cursor.sort("dirty_since", ASCENDING)
+            if limit:
+                cursor = cursor.limit(limit - len(docs))
+            docs.extend(cursor)
+        return docs
+
+    def _claim(self, thread_id):
+        now = datetime.now()
+        return self.threads_col.find_one_and_update(
+            {"_id": thread_id, "dirty": True,
+             "$and": [{"$or": [{"claimed_until": {"$exists": False}}, {"claimed_until": {"$lt": now}}]},
+                      _due(now)]},
+            {"$set": {"claimed_until": now + self.lease}})
+
+    def _run_one(self, thread_id):
+        """Refresh one thread; returns (ok, thread doc, new summary or None)."""
+        thread = self._claim(thread_id)
+        if thread is None:
+            return False, None, None   # another worker has it, or it is clean now
+        summary = None
+        try:
+            result = self.refresh(thread)
+            ok, summary = result if isinstance(result, tuple) else (result is not False, None)
+        except Exception as e:
+            print(f"[Scheduler] Refreshing thread {thread_id} failed: {e}")
+            ok = False
+        waiting = ok == NOT_READY
+        ok = bool(ok) and not waiting
+        if waiting:
+            # nothing went wrong: release the claim and look again shortly, without backing off
+            self.threads_col.update_one({"_id": thread_id}, {
+                "$set": {"retry_at": datetime.now() + timedelta(seconds=SCHEDULER_WAIT_SEC)},
+                "$unset": {"claimed_until": ""}})
+        elif ok:
+            self.threads_col.update_one(
+                {"_id": thread_id, "version": thread.get("version")},
+                {"$set": {"dirty": False, "processed_version": thread.get("version")},
+                 "$unset": {"dirty_since": "", "claimed_until": "", "failures": "", "retry_at": ""}})
+            self.threads_col.update_one({"_id": thread_id}, {"$unset": {"claimed_until": "", "failures": "", "retry_at": ""}})
+        else:
+            # release the claim; the thread stays dirty and is retried after a delay
+            failures = (thread.get("failures") or 0) + 1
+            self.threads_col.update_one({"_id": thread_id}, {
+                "$set": {"failures": failures, "retry_at": datetime.now() + retry_delay(failures)},
+                "$unset": {"claimed_until": ""}})
+        with self._lock:
+            if waiting:
+                self.waiting += 1
+            elif ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+        return ok, thread, summary
+
+    def drain(self, limit=None) -> int:
+        """Refresh the current dirty threads (up to `limit`); returns how many succeeded."""
+        started = time.time()
+        ids = [t["_id"] for t in self.pending(limit)]
+        if not ids:
+            return 0
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(ids))) as pool:
+            results = list(pool.map(self._run_one, ids))
+        done = sum(1 for ok, _, _ in results if ok)
+        summarized = [(thread, summary) for _, thread, summary in results if summary]
+        if summarized and self.prioritize is not None:
+            # one batched priority pass for every summary of this drain
+            try:
+                self.prioritize(summarized)
+            except Exception as e:
+                print(f"[Scheduler] Prioritizing {len(summarized)} threads failed: {e}")
+        self.last_drain = {"threads": len(ids), "refreshed": done,
+                           "seconds": round(time.time() - started, 2), "at": datetime.now()}
+        print(f"[Scheduler] Refreshed {done}/{len(ids)} dirty threads in {self.last_drain['seconds']}s")
+        return done
+
+    def run_forever(self, poll_sec=SCHEDULER_POLL_SEC):
+        while True:
+            if not self.drain():
+                time.sleep(poll_sec)
+
+    def metrics(self) -> dict:
+        """Backlog size and age plus lifetime counters."""
+        oldest = self.threads_col.find_one({"dirty": True}, {"dirty_since": 1}, sort=[("dirty_since", ASCENDING)])
+        since = oldest and oldest.get("dirty_since")
+        return {
+            "backlog": self.threads_col.count_documents({"dirty": True}),
+            "retrying": self.threads_col.count_documents({"dirty": True, "retry_at": {"$gt": datetime.now()}}),
+            "oldest_dirty_age_sec": round((datetime.now() - since).total_seconds(), 1) if since else 0.0,
+            "processed": self.processed,
+            "failed": self.failed,
+            "waiting": self.waiting,
+            "concurrency": self.concurrency,
+            "last_drain": self.last_drain
+        }
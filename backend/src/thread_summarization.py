@@ -1,27 +1,53 @@
 # src/thread_summarization.py
 import os
-import requests
+
 from dotenv import load_dotenv
 
-load_dotenv()
-API_KEY = os.getenv("OPENROUTER_API_KEY_1")
+from src.llm_client import llm_client, LLMError
+from src.prompt_builder import PROMPT_TOKEN_BUDGET, dedupe_messages, estimate_tokens, fit_to_budget
 
-if not API_KEY:
-    raise ValueError("Please set OPENROUTER_API_KEY_1 in your .env file.")
+load_dotenv()
 
-API_URL = "https://openrouter.ai/api/v1/chat/completions"
 # choose a free OpenRouter-hosted model you tested
 DEFAULT_MODEL = "deepseek/deepseek-r1-0528-qwen3-8b:free"  # change if needed
+# Thread text up to this many prompt budgets is cut down to one prompt
+# (recent + highest-TextRank text); longer threads are summarized map-reduce
+MAP_REDUCE_RATIO = float(os.getenv("SUMMARY_MAP_REDUCE_RATIO", "3"))
 
+SYSTEM_MESSAGE = {"role": "system", "content": "You are a helpful assistant specialized in summarization."}
+OUTPUT_FORMAT = """Output in this exact natural-language format:
+
+Summary:
+- Decisions: ...
+- Action Items: ...
+- Deadlines: ...
+- Urgency: ...
+- Open Questions: ...
+"""
+
+
+def format_message(m) -> str:
+    sender = m.get("sender") or m.get("from", "")
+    ts = m.get("timestamp") or m.get("date", "")
+    text = m.get("text") or m.get("clean_message", "")
+    return f"[{sender} | {ts}]\n{text}\n"
 
-def build_prompt(thread_messages):
-    formatted = []
-    for m in thread_messages:
-        sender = m.get("sender") or m.get("from", "")
-        ts = m.get("timestamp") or m.get("date", "")
-        text = m.get("text") or m.get("clean_message", "")
-        formatted.append(f"[{sender} | {ts}]\n{text}\n")
-    formatted_thread = "\n".join(formatted)
+
+def format_messages(thread_messages) -> str:
+    return "\n".join(format_message(m) for m in thread_messages)
+
+
+def _format_overhead(m) -> int:
+    return estimate_tokens(format_message(dict(m, text="", clean_message=""))) + 1
+
+
+def thread_tokens(thread_messages) -> int:
+    return sum(estimate_tokens(format_message(m)) + 1 for m in thread_messages)
+
+
+def build_prompt(thread_messages, token_budget=None):
+    """Thread text is cut to token_budget (see prompt_builder.fit_to_budget)."""
+    formatted_thread = format_messages(fit_to_budget(thread_messages, token_budget, _format_overhead))
 
     prompt = f"""
 You are an assistant that summarizes email conversation threads.
@@ -39,34 +65,121 @@ Thread:
 {formatted_thread}
 >>>
 
-Output in this exact natural-language format:
-
-Summary:
-- Decisions: ...
-- Action Items: ...
-- Deadlines: ...
-- Urgency: ...
-- Open Questions: ...
-"""
+{OUTPUT_FORMAT}"""
     return prompt
 
 
-def summarize_thread(thread_messages, model=DEFAULT_MODEL):
-    headers = {"Authorization": f"Bearer {API_KEY}",
-               "Content-Type": "application/json"}
-
-    data = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": "You are a helpful assistant specialized in summarization."},
-            {"role": "user", "content": build_prompt(thread_messages)}
-        ],
-        "max_tokens": 512,
-        "temperature": 0.0
-    }
-
-    r = requests.post(API_URL, headers=headers, json=data)
-    if r.status_code != 200:
-        raise Exception(f"OpenRouter error: {r.status_code} {r.text}")
-    resp = r.json()
-    return resp["choices"][0]["message"]["content"].strip()
+def build_update_prompt(previous_summary, new_messages, token_budget=None):
+    """Prompt that folds new replies into an existing summary."""
+    token_budget = max(1, (token_budget or PROMPT_TOKEN_BUDGET) - estimate_tokens(previous_summary))
+    new_messages = fit_to_budget(new_messages, token_budget, _format_overhead)
+    return f"""
+You are an assistant that keeps a running summary of an email conversation thread.
+Below is the current summary of the thread, followed by the messages that arrived since.
+Update the summary so it reflects the whole conversation: keep what is still true,
+revise decisions, action items and deadlines that changed, and drop open questions
+that have been answered.
+
+Current summary:
+<<<
+{previous_summary}
+>>>
+
+New messages:
+<<<
+{format_messages(new_messages)}
+>>>
+
+{OUTPUT_FORMAT}"""
+
+
+def build_reduce_prompt(partial_summaries):
+    """Prompt that merges summaries of consecutive parts of one long thread."""
+    parts = "\n\n".join(f"Part {i + 1}:\n{s}" for i, s in enumerate(partial_summaries))
+    return f"""
+You are an assistant that summarizes email conversation threads.
+A long thread was summarized in consecutive parts (oldest first). Merge the part
+summaries into one summary of the whole thread; later parts override earlier ones
+where they conflict.
+
+{parts}
+
+{OUTPUT_FORMAT}"""
+
+
+def _ask(prompt, model):
+    return llm_client.chat([SYSTEM_MESSAGE, {"role": "user", "content": prompt}],
+                           model, max_tokens=512, temperature=0.0)
+
+
+def summarize_thread(thread_messages, model=DEFAULT_MODEL, token_budget=None):
+    """
+    Quoted text is removed and the thread cut to the token budget first.
+    Raises LLMError if OpenRouter still fails after the client's retries.
+    """
+    return _ask(build_prompt(dedupe_messages(thread_messages), token_budget), model)
+
+
+def chunk_messages(thread_messages, token_budget=None) -> list:
+    """Split messages (in order) into runs whose formatted text fits token_budget."""
+    token_budget = token_budget or PROMPT_TOKEN_BUDGET
+    chunks, chunk, size = [], [], 0
+    for m in thread_messages:
+        tokens = estimate_tokens(format_message(m)) + 1
+        if chunk and size + tokens > token_budget:
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(m)
+        size += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def summarize_map_reduce(thread_messages, model=DEFAULT_MODEL, token_budget=None):
+    """
+    Summarize a thread too long for one prompt: summarize each chunk in
+    parallel (map), then merge the partial summaries (reduce), recursing
+    while the partials themselves are too long to merge at once.
+    """
+    return _map_reduce(dedupe_messages(thread_messages), model, token_budget or PROMPT_TOKEN_BUDGET)
+
+
+def _map_reduce(thread_messages, model, token_budget):
+    chunks = chunk_messages(thread_messages, token_budget)
+    if len(chunks) == 1:
+        return _ask(build_prompt(chunks[0], token_budget), model)
+    partials = llm_client.chat_many(
+        [[SYSTEM_MESSAGE, {"role": "user", "content": build_prompt(c, token_budget)}] for c in chunks],
+        model, max_tokens=512, temperature=0.0)
+    if any(p is None for p in partials):
+        raise LLMError(f"{partials.count(None)} of {len(chunks)} thread parts failed to summarize")
+    while sum(estimate_tokens(p) for p in partials) > token_budget and len(partials) > 1:
+        # merge neighbouring pairs until everything fits in one reduce prompt
+        pairs = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+        partials = [p[0] if len(p) == 1 else _ask(build_reduce_prompt(p), model) for p in pairs]
+    return _ask(build_reduce_prompt(partials), model) if len(partials) > 1 else partials[0]
+
+
+def summarize_rolling(previous_summary, new_messages, model=DEFAULT_MODEL, token_budget=None, context=()):
+    """
+    Bring a thread summary up to date from only the messages added since it
+    was written. `context` are the thread's earlier messages: they are not
+    sent, but text the new ones quote from them is dropped.
+    Without a previous summary the whole thread is summarized; either way,
+    text up to MAP_REDUCE_RATIO budgets is cut down to one prompt and
+    anything longer goes map-reduce (or is folded in a chunk at a time).
+    """
+    token_budget = token_budget or PROMPT_TOKEN_BUDGET
+    new_messages = dedupe_messages(new_messages, context)
+    oversized = thread_tokens(new_messages) > token_budget * MAP_REDUCE_RATIO
+    if not previous_summary:
+        if oversized:
+            return _map_reduce(new_messages, model, token_budget)
+        return _ask(build_prompt(new_messages, token_budget), model)
+    if not oversized:
+        return _ask(build_update_prompt(previous_summary, new_messages, token_budget), model)
+    summary = previous_summary
+    for chunk in chunk_messages(new_messages, max(1, token_budget - estimate_tokens(previous_summary))):
+        summary = _ask(build_update_prompt(summary, chunk, token_budget), model)
+    return summary
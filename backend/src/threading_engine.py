@@ -0,0 +1,382 @@
+# src/threading_engine.py
+import os
+import threading
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+
+from src.thread_index import thread_index
+
+
+def reference_chain(message_id, in_reply_to=None, references=()) -> list:
+    """
+    Ancestor message-ids from oldest to direct parent: References, then
+    In-Reply-To if it is not already the last reference (as in JWZ threading).
+    """
+    chain = []
+    seen = {message_id}
+    for ref in list(references or []) + [in_reply_to]:
+        if ref and ref not in seen:
+            seen.add(ref)
+            chain.append(ref)
+    if in_reply_to and in_reply_to in chain and chain[-1] != in_reply_to:
+        chain.remove(in_reply_to)
+        chain.append(in_reply_to)
+    return chain
+
+
+class Container:
+    """A node in the thread tree; placeholders stand in for messages not seen yet."""
+    __slots__ = ("message_id", "has_message", "parent", "children", "thread_id")
+
+    def __init__(self, message_id=None):
+        self.message_id = message_id
+        self.has_message = False
+        self.parent = None
+        self.children = []
+        self.thread_id = None   # only meaningful on a root
+
+    def root(self):
+        c = self
+        while c.parent is not None:
+            c = c.parent
+        return c
+
+    def is_ancestor_of(self, other) -> bool:
+        c = other
+        while c is not None:
+            if c is self:
+                return True
+            c = c.parent
+        return False
+
+
+class ThreadingEngine:
+    """
+    JWZ-style threading (https://www.jwz.org/doc/threading.html) kept
+    incrementally in memory:
+    - every message-id seen (as a message or in someone's References) gets a
+      Container; unknown parents become placeholders
+    - each tree root carries a thread id; when a late message links two trees
+      the child tree's thread is merged into the parent tree's thread
+    - messages with no usable references fall back to subject + participants
+    Merged thread ids are kept as aliases so stale ids still resolve.
+    """
+
+    def __init__(self, index=None, new_thread_id=ObjectId):
+        self._lock = threading.RLock()
+        self.id_table = {}
+        self.aliases = {}   # merged thread id -> surviving thread id
+        self.looked_up = set()   # message-ids already searched for in storage
+        self.index = index if index is not None else thread_index
+        self.new_thread_id = new_thread_id
+
+    def canonical(self, thread_id):
+        """Follow merge aliases to the surviving thread id."""
+        path = []
+        while thread_id in self.aliases:
+            path.append(thread_id)
+            thread_id = self.aliases[thread_id]
+        for t in path[:-1]:
+            self.aliases[t] = thread_id
+        return thread_id
+
+    def _container(self, message_id):
+        c = self.id_table.get(message_id)
+        if c is None:
+            c = self.id_table[message_id] = Container(message_id)
+        return c
+
+    def _link(self, parent, child, merges):
+        # keep the first parent we learn about and never create a loop
+        if child.parent is not None or child.is_ancestor_of(parent):
+            return
+        parent_root = parent.root()
+        parent_tid = self.canonical(parent_root.thread_id)
+        child_tid = self.canonical(child.thread_id)
+        child.parent = parent
+        child.thread_id = None
+        parent.children.append(child)
+        if parent_tid is None:
+            parent_root.thread_id = child_tid
+        elif child_tid is not None and child_tid != parent_tid:
+            self.aliases[child_tid] = parent_tid
+            merges.append((child_tid, parent_tid))
+
+    def add(self, message_id, in_reply_to=None, references=(), subject_norm="", participants=(), thread_id=None):
+        """
+        Thread one message. `thread_id` pins the thread when reloading stored
+        messages; if the message's tree already has another thread, the pinned
+        one is merged into it. Returns (thread_id, is_new, merges) where merges
+        lists the (merged, surviving) thread id pairs this message caused.
+        """
+        merges = []
+        with self._lock:
+            container = self._container(message_id) if message_id else Container()
+            container.has_message = True
+            prev = None
+            for ref in reference_chain(message_id, in_reply_to, references):
+                c = self._container(ref)
+                if prev is not None:
+                    self._link(prev, c, merges)
+                prev = c
+            if prev is not None:
+                self._link(prev, container, merges)
+
+            root = container.root()
+            tid = self.canonical(root.thread_id)
+            is_new = False
+            if tid is None:
+                tid = thread_id
+                if tid is None:
+                    tid = self.canonical(self.index.find_by_subject(subject_norm, participants))
+                if tid is None:
+                    tid = self.new_thread_id()
+                    is_new = True
+                root.thread_id = tid
+            elif thread_id is not None and self.canonical(thread_id) != tid:
+                # a stored message filed under another thread: that thread joins this one
+                merged = self.canonical(thread_id)
+                self.aliases[merged] = tid
+                merges.append((merged, tid))
+            self.index.add(tid, subject_norm, participants)
+        return tid, is_new, merges
+
+    def thread_of(self, message_id):
+        with self._lock:
+            c = self.id_table.get(message_id)
+            return self.canonical(c.root().thread_id) if c is not None else None
+
+    def missing(self, message_ids) -> list:
+        """Ids not threaded as real messages yet (unknown or only placeholders)."""
+        return [m for m in message_ids if m and not getattr(self.id_table.get(m), "has_message", False)]
+
+    def load(self, message_docs) -> tuple:
+        """
+        Rebuild the trees from stored thread_messages docs. Returns (count,
+        merges): merges lists the stored threads the loaded messages linked
+        together, as in add(); the caller folds them with merge_threads().
+        """
+        count, merges = 0, []
+        for m in message_docs:
+            merges.extend(self.add(m.get("message_id"), references=m.get("references"), thread_id=m["thread_id"])[2])
+            count += 1
+        return count, merges
+
+    def stats(self) -> dict:
+        placeholders = sum(1 for c in self.id_table.values() if not c.has_message)
+        return {"containers": len(self.id_table), "placeholders": placeholders, "merged": len(self.aliases)}
+
+
+# ---------- Mongo storage ----------
+# threads:         one small doc per thread (subject, participants, counts, summary)
+# thread_messages: one doc per message, keyed by thread_id and numbered per
+#                  thread (`seq`, from the thread's `message_seq` counter)
+MESSAGE_KEY_PROJECTION = {"message_id": 1, "references": 1, "thread_id": 1}
+# A message number still missing after this long is taken as lost (its writer died)
+SEQ_GAP_GRACE_SEC = int(os.getenv("SEQ_GAP_GRACE_SEC", "300"))
+
+
+def ensure_message_indexes(messages_col):
+    messages_col.create_index([("thread_id", ASCENDING), ("date", ASCENDING)])
+    messages_col.create_index([("thread_id", ASCENDING), ("seq", ASCENDING)])
+    messages_col.create_index([("message_id", ASCENDING)])
+    # multikey: finds stored replies that point at a message arriving late
+    messages_col.create_index([("references", ASCENDING)])
+
+
+def message_doc(processed, email_id, thread_id, seq=None) -> dict:
+    return {
+        "thread_id": thread_id,
+        "seq": seq,
+        "email_id": str(email_id),
+        "message_id": processed.get("message_id"),
+        "references": reference_chain(processed.get("message_id"), processed.get("in_reply_to"),
+                                      processed.get("references")),
+        "from": processed.get("from"),
+        "to": processed.get("to"),
+        "cc": processed.get("cc"),
+        "date": processed.get("date"),
+        "clean_message": processed.get("clean_message")
+    }
+
+
+def allocate_seq(threads_col, thread_id, count=1) -> int:
+    """
+    Reserve `count` message numbers on a stored thread; returns the first.
+    A thread is stored with its counter before its first message (see
+    new_thread_doc), so a missing doc means it was merged away meanwhile.
+    """
+    doc = threads_col.find_one_and_update({"_id": thread_id}, {"$inc": {"message_seq": count}},
+                                          projection={"message_seq": 1}, return_document=ReturnDocument.AFTER)
+    if doc is None:
+        raise LookupError(f"Thread {thread_id} is not stored; cannot number its messages")
+    return doc["message_seq"] - count + 1
+
+
+def _waited_out(message) -> bool:
+    oid = message.get("_id")
+    return isinstance(oid, ObjectId) and \
+        (datetime.now(timezone.utc) - oid.generation_time).total_seconds() > SEQ_GAP_GRACE_SEC
+
+
+def messages_after(messages, seq) -> list:
+    """
+    The messages numbered after `seq`, in number order, up to the first gap:
+    a number already handed out to a message another writer has not stored
+    yet. A watermark taken from the result never passes such a message.
+    A gap the next message has waited out SEQ_GAP_GRACE_SEC for is skipped.
+    """
+    out = []
+    expected = (seq or 0) + 1
+    for m in sorted((m for m in messages if (m.get("seq") or 0) > (seq or 0)), key=lambda m: m["seq"]):
+        if m["seq"] != expected and not _waited_out(m):
+            break
+        out.append(m)
+        expected = m["seq"] + 1
+    return out
+
+
+def mark_dirty(update, now) -> dict:
+    """
+    Add change tracking to a thread update: bump `version` and flag the
+    thread dirty so the scheduler re-summarizes it. Only message changes
+    call this; summary/priority writes do not.
+    """
+    update.setdefault("$inc", {})["version"] = 1
+    update.setdefault("$set", {}).update({"dirty": True, "last_updated": now})
+    update.setdefault("$min", {})["dirty_since"] = now
+    # new content is worth a try right away, even if the last refresh failed
+    update.setdefault("$unset", {})["retry_at"] = ""
+    return update
+
+
+def new_thread_doc(thread_id, processed, participants, now, message_count=1) -> dict:
+    """
+    A thread doc for `message_count` messages, numbered 1..message_count.
+    It is stored before those messages, so another writer that finds the
+    thread numbers its own message after them, and stays clean until they
+    are in: mark_dirty() then flags it (version 1).
+    """
+    return {
+        "_id": thread_id,
+        "subject": processed.get("subject", ""),
+        "subject_norm": processed.get("normalized_subject", ""),
+        "created_at": now,
+        "last_updated": now,
+        "message_count": message_count,
+        "message_seq": message_count,
+        "participants": sorted(participants),
+        "summary": None,
+        "summary_as_of": None,
+        "summary_hwm": None,
+        "priority": None,
+        "version": 0,
+        "processed_version": 0,
+        "dirty": False
+    }
+
+
+def load_related(engine, messages_col, processed_batch) -> tuple:
+    """
+    Pull stored messages the batch could link to: its ancestors, earlier
+    replies that reference a message arriving only now, and stored copies of
+    the batch's own messages. Returns (count, merges) like ThreadingEngine.load().
+    """
+    wanted, own = set(), set()
+    for p in processed_batch:
+        chain = reference_chain(p.get("message_id"), p.get("in_reply_to"), p.get("references"))
+        wanted.update(engine.missing(chain))
+        if p.get("message_id"):
+            own.add(p["message_id"])
+    wanted -= engine.looked_up
+    own -= engine.looked_up
+    engine.looked_up |= wanted | own
+    query = []
+    if wanted or own:
+        query.append({"message_id": {"$in": list(wanted | own)}})
+    if own:
+        query.append({"references": {"$in": list(own)}})
+    if not query:
+        return 0, []
+    return engine.load(messages_col.find({"$or": query}, MESSAGE_KEY_PROJECTION))
+
+
+def merge_threads(threads_col, messages_col, merged_id, surviving_id, emails_col=None, index=None):
+    """
+    Fold a stored thread into another: move its messages, drop its doc, and
+    repoint the subject index (saving its snapshot, if configured) so new
+    messages never go to the dropped id.
+    """
+    index = index if index is not None else thread_index
+    if index.repoint(merged_id, surviving_id):
+        index.save()
+    doc = threads_col.find_one_and_delete({"_id": merged_id})
+    # moved messages are renumbered after the surviving thread's own
+    moved = list(messages_col.find({"thread_id": merged_id}, {"_id": 1}).sort([("date", 1), ("_id", 1)]))
+    if moved:
+        first = allocate_seq(threads_col, surviving_id, len(moved))
+        messages_col.bulk_write([UpdateOne({"_id": m["_id"]}, {"$set": {"thread_id": surviving_id, "seq": first + i}})
+                                 for i, m in enumerate(moved)], ordered=False)
+    if emails_col is not None:
+        emails_col.update_many({"thread_id": merged_id}, {"$set": {"thread_id": surviving_id}})
+    if doc is None:
+        return
+    threads_col.update_one({"_id": surviving_id}, mark_dirty({
+        "$inc": {"message_count": doc.get("message_count", 0)},
+        "$addToSet": {"participants": {"$each": doc.get("participants", [])}},
+        "$min": {"created_at": doc.get("created_at") or datetime.now()},
+        # the merged conversation needs a fresh summary
+        "$set": {"summary": None, "summary_as_of": None, "summary_hwm": None, "priority": None}
+    }, datetime.now()))
+    print(f"[Threading] Merged thread {merged_id} into {surviving_id}")
+
+
+def ensure_message_seq(threads_col, messages_col) -> int:
+    """
+    Number the messages of threads stored before message numbering (oldest
+    first) and turn their summary mark, a message _id then, into a number.
+    """
+    count = 0
+    for t in threads_col.find({"message_seq": {"$exists": False}}, {"summary_hwm": 1}):
+        msgs = list(messages_col.find({"thread_id": t["_id"]}, {"_id": 1}).sort([("date", 1), ("_id", 1)]))
+        if msgs:
+            messages_col.bulk_write([UpdateOne({"_id": m["_id"]}, {"$set": {"seq": i}})
+                                     for i, m in enumerate(msgs, 1)], ordered=False)
+        # the summary covers the leading messages up to the old mark
+        old_mark, hwm = t.get("summary_hwm"), None
+        if isinstance(old_mark, ObjectId):
+            hwm = 0
+            while hwm < len(msgs) and msgs[hwm]["_id"] <= old_mark:
+                hwm += 1
+        threads_col.update_one({"_id": t["_id"]}, {"$set": {"message_seq": len(msgs), "summary_hwm": hwm}})
+        count += 1
+    return count
+
+
+def migrate_embedded_messages(threads_col, messages_col) -> int:
+    """Move messages from the old embedded `messages` arrays into thread_messages."""
+    moved = 0
+    for t in threads_col.find({"messages": {"$exists": True}}):
+        docs = []
+        for m in t["messages"]:
+            doc = dict(m)
+            doc["thread_id"] = t["_id"]
+            doc.setdefault("references", [])
+            docs.append(doc)
+        if docs:
+            messages_col.insert_many(docs)
+        parts = set(t.get("participants") or [])
+        for m in t["messages"]:
+            if (m.get("from") or {}).get("email"):
+                parts.add(m["from"]["email"])
+            for r in m.get("to") or []:
+                if r.get("email"):
+                    parts.add(r["email"])
+        threads_col.update_one({"_id": t["_id"]}, {
+            "$unset": {"messages": ""},
+            "$set": {"message_count": len(docs), "participants": sorted(parts)}
+        })
+        moved += len(docs)
+    return moved
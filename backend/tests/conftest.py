@@ -0,0 +1,90 @@
+# tests/conftest.py
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+# src.key_manager refuses to load without at least one key
+os.environ.setdefault("OPENROUTER_API_KEY_1", "test-key")
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """utils.db on a fresh database file of its own."""
+    from utils import db
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "emails_cache.db"))
+    db.init_db()
+    yield db
+    db.close_connection()
+
+
+class FakeOpenRouter(ThreadingHTTPServer):
+    """
+    Local stand-in for OpenRouter's /chat/completions. Answers come from
+    `script`, one per request, then a plain "ok" reply:
+    {"status": 200, "headers": {...}, "reply": "text"} or, for `stream: true`
+    requests, {"stream": ["piece", ...]} sent as server-sent events.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeOpenRouterHandler)
+        self.script = []
+        self.requests = []   # (API key, payload)
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/api/v1"
+
+    def next_answer(self, key, payload):
+        with self._lock:
+            self.requests.append((key, payload))
+            return self.script.pop(0) if self.script else {}
+
+
+class FakeOpenRouterHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        key = self.headers.get("Authorization", "").removeprefix("Bearer ")
+        answer = self.server.next_answer(key, payload)
+        status = answer.get("status", 200)
+        if status == 200 and payload.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+            for piece in answer.get("stream", ["ok"]):
+                chunk = {"choices": [{"delta": {"content": piece}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+        if status == 200:
+            body = {"choices": [{"message": {"role": "assistant", "content": answer.get("reply", "ok")}}]}
+        else:
+            body = {"error": {"code": status, "message": "fake error"}}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in answer.get("headers", {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def fake_openrouter():
+    server = FakeOpenRouter()
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,71 @@
+# tests/test_date_resolver.py
+import os
+import re
+from datetime import datetime
+
+import pytest
+
+from src.date_resolver import DATEPARSER_SETTINGS, UNITS, WEEKDAYS, DateResolver, fast_resolve, normalize
+
+dateparser = pytest.importorskip("dateparser")
+
+
+def _pinned_version(package):
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "requirements.txt")
+    with open(path, encoding="utf-8") as f:
+        m = re.search(rf"^{package}==(\S+)", f.read(), re.M)
+    return m.group(1) if m else None
+
+
+# the fast path mirrors one dateparser release; compare against that one only
+pytestmark = pytest.mark.skipif(dateparser.__version__ != _pinned_version("dateparser"),
+                                reason="dateparser differs from the version pinned in requirements.txt")
+
+CORPUS = (["today", "tomorrow", "yesterday", "next week", "last week", "this week", "next month",
+           "last month", "this month", "next year", "2025-10-27", "2024-02-29", "2025-02-30",
+           "Oct 27th", "Oct. 27", "October 27", "27 Oct", "27th October", "Oct 27th, 2025",
+           "October 27, 2024", "27 October 2025", "Oct 27 2025", "Jan 1", "Dec 31", "Sept 3",
+           "Sep 3", "May 5th", "Jun 31", "Feb 29", "Oct 27th, 2025.", "Oct 22", "22 October"]
+          + list(WEEKDAYS)
+          + [f"{p}{n} {u}{s}" for p in ("", "in ") for n in ("1", "2", "a", "two", "ten")
+             for u in UNITS for s in ("", "s")]
+          + [f"{n} {u}s ago" for n in ("2", "three") for u in UNITS]
+          + ["5 days from now", "3 weeks from now"])
+BASES = [datetime(2025, 10, 22, 14, 35, 12, 123456), datetime(2025, 10, 24, 9, 0),
+         datetime(2025, 12, 30, 8, 0), datetime(2024, 1, 31, 23, 59), datetime(2024, 2, 29, 0, 0, 1),
+         datetime(2026, 3, 1, 12, 0), datetime(2025, 10, 22), datetime(2025, 10, 27)]
+
+
+def _parse(text, base):
+    return dateparser.parse(text, settings=dict(DATEPARSER_SETTINGS, RELATIVE_BASE=base))
+
+
+@pytest.mark.parametrize("base", BASES, ids=str)
+def test_fast_path_matches_dateparser(base):
+    checked = 0
+    for text in CORPUS:
+        fast = fast_resolve(normalize(text), base)
+        if fast is None:
+            continue
+        mine = base + fast[1] if fast[0] == "rel" else fast[1]
+        assert mine == _parse(text, base), text
+        checked += 1
+    assert checked > 100
+
+
+def test_from_now_is_left_to_dateparser():
+    base = BASES[0]
+    assert fast_resolve(normalize("5 days from now"), base) is None
+    assert DateResolver().resolve("5 days from now", base) == _parse("5 days from now", base)
+
+
+def test_month_day_on_that_day_at_midnight():
+    base = datetime(2025, 10, 27)
+    assert DateResolver().resolve("Oct 27", base) == _parse("Oct 27", base)
+
+
+def test_time_of_day_results_follow_the_base_time():
+    resolver = DateResolver()
+    for base in (datetime(2025, 10, 22, 9, 0), datetime(2025, 10, 22, 17, 7), datetime(2025, 10, 22, 9, 0)):
+        assert resolver.resolve("5pm", base) == _parse("5pm", base)
+    assert resolver.hits == 1
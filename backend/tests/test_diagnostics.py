@@ -0,0 +1,41 @@
+# tests/test_diagnostics.py
+import pytest
+
+
+@pytest.fixture
+def backend(sqlite_db):
+    import app as backend
+    return backend
+
+
+@pytest.fixture
+def client(backend, monkeypatch):
+    monkeypatch.setattr(backend.app, "secret_key", "test-secret")
+    return backend.app.test_client()
+
+
+def sign_in(client):
+    with client.session_transaction() as s:
+        s["credentials"] = {"token": "test-token"}
+
+
+def test_key_stats_requires_a_session(client):
+    assert client.get("/key_stats").status_code == 401
+    sign_in(client)
+    assert client.get("/key_stats").status_code == 200
+
+
+def test_key_stats_hide_the_keys(client, backend):
+    sign_in(client)
+    stats = client.get("/key_stats").json
+    shown = " ".join(str(v) for entry in stats for v in entry.values())
+    assert [entry["key"] for entry in stats] == [f"#{i + 1}" for i in range(len(backend.key_manager.api_keys))]
+    for key in backend.key_manager.api_keys:
+        assert key[-4:] not in shown
+
+
+@pytest.mark.parametrize("route", ["/cache_stats", "/model_status", "/nlp_status"])
+def test_stats_routes_require_a_session(client, route):
+    assert client.get(route).status_code == 401
+    sign_in(client)
+    assert client.get(route).status_code == 200
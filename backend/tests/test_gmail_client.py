@@ -0,0 +1,132 @@
+# tests/test_gmail_client.py
+import importlib
+import json
+import re
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from google.oauth2.credentials import Credentials  # type: ignore
+
+from src import gmail_client
+
+_GET_RE = re.compile(r"GET /gmail/v1/users/me/messages/([^?\s]+)\?([^\s]*) HTTP")
+
+
+class FakeGmail(ThreadingHTTPServer):
+    """
+    Local stand-in for the Gmail REST API: profile, messages.list and the
+    multipart batch endpoint. `flaky` ids answer 503 on their first request.
+    """
+
+    def __init__(self, messages, flaky=()):
+        super().__init__(("127.0.0.1", 0), FakeGmailHandler)
+        self.messages = messages
+        self.flaky = set(flaky)
+        self.batches = []   # message ids requested per batch call
+        self.single_gets = 0
+
+    @property
+    def root_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+
+class FakeGmailHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/gmail/v1/users/me/profile"):
+            return self._json(200, {"emailAddress": "me@example.com", "historyId": "42"})
+        if self.path.startswith("/gmail/v1/users/me/messages?"):
+            return self._json(200, {"messages": [{"id": i} for i in self.server.messages]})
+        if self.path.startswith("/gmail/v1/users/me/messages/"):
+            self.server.single_gets += 1
+        self._json(404, {"error": {"code": 404, "message": "not found"}})
+
+    def do_POST(self):
+        if self.path != "/batch":
+            return self._json(404, {"error": {"code": 404, "message": "not found"}})
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        envelope = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+        parts, ids = [], []
+        boundary = "fake_batch_boundary"
+        for part in envelope.iter_parts():
+            content_id = part["Content-ID"].strip("<>")
+            m = _GET_RE.search(part.get_payload())
+            msg_id = m.group(1)
+            ids.append(msg_id)
+            if msg_id in self.server.flaky:
+                self.server.flaky.discard(msg_id)
+                status, payload = "503 Service Unavailable", {"error": {"code": 503, "message": "busy"}}
+            elif msg_id in self.server.messages:
+                status, payload = "200 OK", dict(self.server.messages[msg_id], format=m.group(2))
+            else:
+                status, payload = "404 Not Found", {"error": {"code": 404, "message": "not found"}}
+            parts.append(f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                         f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n\r\n{json.dumps(payload)}\r\n")
+        self.server.batches.append(ids)
+        out = ("".join(parts) + f"--{boundary}--\r\n").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/mixed; boundary={boundary}")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+
+@pytest.fixture
+def fake_gmail():
+    messages = {f"m{i}": {"id": f"m{i}", "threadId": f"t{i % 3}", "snippet": f"message {i}"} for i in range(7)}
+    server = FakeGmail(messages, flaky={"m2"})
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_root_url_override_from_the_environment(fake_gmail, monkeypatch):
+    monkeypatch.setenv("GMAIL_API_ROOT_URL", fake_gmail.root_url)
+    module = importlib.reload(gmail_client)
+    try:
+        client = module.GmailClient(Credentials(token="test-token"))
+        assert [m["id"] for m in client.fetch_messages(["m1", "m0"])] == ["m1", "m0"]
+    finally:
+        monkeypatch.delenv("GMAIL_API_ROOT_URL")
+        importlib.reload(gmail_client)
+
+
+def test_batch_fetch_against_fake_server(fake_gmail, monkeypatch):
+    monkeypatch.setattr(gmail_client, "BATCH_SIZE", 3)
+    client = gmail_client.GmailClient(Credentials(token="test-token"), root_url=fake_gmail.root_url)
+
+    assert client.get_profile()["historyId"] == "42"
+    assert client.list_message_ids(label_ids=["UNREAD"]) == list(fake_gmail.messages)
+
+    ids = ["m6", "m0", "m2", "missing", "m4", "m1", "m3"]
+    fetched = client.fetch_messages(ids, format="metadata")
+    # input order, unknown id left out, the flaky one retried once
+    assert [m["id"] for m in fetched] == ["m6", "m0", "m2", "m4", "m1", "m3"]
+    assert all(m["format"].startswith("format=metadata") for m in fetched)
+    # three batch calls of at most BATCH_SIZE, one retry batch, no single GETs
+    assert sorted(len(b) for b in fake_gmail.batches) == [1, 1, 3, 3]
+    assert sorted(mid for b in fake_gmail.batches for mid in b) == sorted(ids + ["m2"])
+    assert fake_gmail.batches.count(["m2"]) == 1
+    assert fake_gmail.single_gets == 0
+
+
+def test_empty_fetch_makes_no_request(fake_gmail):
+    client = gmail_client.GmailClient(Credentials(token="test-token"), root_url=fake_gmail.root_url)
+    assert client.fetch_messages([]) == []
+    assert fake_gmail.batches == []
@@ -0,0 +1,77 @@
+# tests/test_inbox_sync.py
+import time
+
+from src.inbox_sync import commit_sync, sync_inbox
+
+
+class FakeGmail:
+    """Just enough of GmailClient for sync_inbox."""
+
+    def __init__(self, history_id, unread):
+        self.history_id = history_id
+        self.unread = unread
+
+    def get_profile(self):
+        return {"historyId": self.history_id}
+
+    def list_message_ids(self, label_ids=None, max_results=None):
+        return list(self.unread)
+
+    def list_history(self, start_history_id, history_types=None):
+        records = [{"messagesAdded": [{"message": {"id": mid, "labelIds": ["UNREAD"]}}]} for mid in self.unread]
+        return records, self.history_id
+
+
+def _job(db, job_id, user_id="u", status="running"):
+    db.insert_job({"id": job_id, "kind": "inbox_analysis", "status": status, "total": 0, "completed": 0,
+                   "failed": 0, "error": None, "created_at": time.time(), "started_at": None,
+                   "finished_at": None}, user_id, 0)
+
+
+def test_history_id_waits_for_earlier_jobs(sqlite_db):
+    db = sqlite_db
+    db.set_history_id("u", "100")
+    _job(db, "j1")
+    _job(db, "j2")
+    sync_inbox(FakeGmail("110", ["a"]), "u", "j1")
+    sync_inbox(FakeGmail("120", ["b"]), "u", "j2")
+
+    # j2 succeeds first: j1 is still running, so the stored historyId stays
+    assert commit_sync("u", "j2", "120") is None
+    # j1 fails: its message must be fetched again, so nothing moves
+    assert commit_sync("u", "j1", "110", ok=False) is None
+    assert db.get_history_id("u") == "100"
+
+    # a later sync replays from 100, takes "a" on again and succeeds
+    _job(db, "j3")
+    time.sleep(0.01)
+    ids, history_id = sync_inbox(FakeGmail("130", ["a"]), "u", "j3")
+    assert ids == ["a"]
+    assert commit_sync("u", "j3", history_id) == "130"
+    assert db.get_history_id("u") == "130"
+
+
+def test_sync_started_before_the_failure_does_not_clear_it(sqlite_db):
+    db = sqlite_db
+    db.set_history_id("u", "100")
+    _job(db, "j1")
+    _job(db, "j2")
+    sync_inbox(FakeGmail("110", ["a"]), "u", "j1")
+    sync_inbox(FakeGmail("120", ["b"]), "u", "j2")
+    time.sleep(0.01)
+    commit_sync("u", "j1", "110", ok=False)
+    # j2 began while j1 still held "a", so it did not retry it
+    assert commit_sync("u", "j2", "120") is None
+    assert db.get_history_id("u") == "100"
+
+
+def test_dead_job_counts_as_failed(sqlite_db):
+    db = sqlite_db
+    db.set_history_id("u", "100")
+    _job(db, "j1")
+    _job(db, "j2")
+    sync_inbox(FakeGmail("110", ["a"]), "u", "j1")
+    db.update_job("j1", status="failed", finished_at=time.time())   # reaped: its worker exited
+    time.sleep(0.01)
+    sync_inbox(FakeGmail("120", ["a"]), "u", "j2")
+    assert commit_sync("u", "j2", "120") == "120"
@@ -0,0 +1,110 @@
+# tests/test_ingest.py
+import json
+
+from src.ingest import ingest
+
+
+def _matches(doc, query):
+    for field, cond in query.items():
+        if field == "$or":
+            if not any(_matches(doc, q) for q in cond):
+                return False
+            continue
+        value = doc.get(field)
+        values = value if isinstance(value, list) else [value]
+        if isinstance(cond, dict) and "$in" in cond:
+            if not any(v in cond["$in"] for v in values):
+                return False
+        elif cond not in values:
+            return False
+    return True
+
+
+class MemoryCollection:
+    """The slice of a pymongo collection ingest() uses, kept in a dict."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def find(self, query=None, projection=None):
+        return [d for d in self.docs.values() if _matches(d, query or {})]
+
+    def insert_many(self, docs, ordered=True):
+        for d in docs:
+            d.setdefault("_id", len(self.docs))
+            self.docs[d["_id"]] = d
+
+    def find_one_and_update(self, query, update, projection=None, return_document=None):
+        doc = self.docs.get(query["_id"])
+        if doc is not None:
+            self._apply(doc, update)
+        return doc
+
+    def bulk_write(self, ops, ordered=True):
+        for op in ops:
+            self._apply(self.docs[op._filter["_id"]], op._doc)
+
+    def update_many(self, query, update):
+        for d in self.find(query):
+            self._apply(d, update)
+
+    @staticmethod
+    def _apply(doc, update):
+        for field, n in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + n
+        doc.update(update.get("$set", {}))
+        for field, spec in update.get("$addToSet", {}).items():
+            doc[field] = sorted(set(doc.get(field) or []) | set(spec["$each"]))
+
+
+def raw(message_id, subject, sender, to, in_reply_to=None):
+    headers = f"Message-ID: <{message_id}>\nFrom: {sender}\nTo: {to}\nSubject: {subject}\n" \
+              f"Date: Mon, 14 May 2001 16:39:00 -0700\n"
+    if in_reply_to:
+        headers += f"In-Reply-To: <{in_reply_to}>\n"
+    return {"message": headers + "\nbody of " + message_id}
+
+
+DUMP = [
+    raw("a@x", "Budget", "ann@x.com", "bob@x.com"),
+    raw("b@x", "Re: Budget", "bob@x.com", "ann@x.com", in_reply_to="a@x"),
+    raw("c@x", "Lunch", "cat@x.com", "dan@x.com"),
+    # the same message twice in one source
+    raw("c@x", "Lunch", "cat@x.com", "dan@x.com"),
+]
+
+
+def run(path, cols, batch_size=2):
+    return ingest(str(path), cols["emails"], cols["threads"], batch_size=batch_size, workers=1,
+                  messages_col=cols["messages"])
+
+
+def test_importing_the_same_dump_again_stores_nothing_new(tmp_path):
+    path = tmp_path / "dump.json"
+    path.write_text(json.dumps(DUMP))
+    cols = {name: MemoryCollection() for name in ("emails", "threads", "messages")}
+
+    assert run(path, cols) == 3
+    # a fresh run (another process) only knows what is stored
+    assert run(path, cols, batch_size=10) == 0
+
+    assert len(cols["emails"].docs) == len(cols["messages"].docs) == 3
+    counts = sorted((t["subject"], t["message_count"], t["message_seq"]) for t in cols["threads"].docs.values())
+    assert counts == [("Budget", 2, 2), ("Lunch", 1, 1)]
+    assert sorted(m["seq"] for m in cols["messages"].docs.values()) == [1, 1, 2]
+
+
+def test_a_reimport_still_adds_the_messages_that_are_new(tmp_path):
+    first, second = tmp_path / "first.json", tmp_path / "second.json"
+    first.write_text(json.dumps(DUMP[:1]))
+    second.write_text(json.dumps(DUMP[:2]))
+    cols = {name: MemoryCollection() for name in ("emails", "threads", "messages")}
+
+    assert run(first, cols) == 1
+    assert run(second, cols) == 1
+    [thread] = cols["threads"].docs.values()
+    assert (thread["message_count"], thread["message_seq"]) == (2, 2)
+    assert sorted(m["seq"] for m in cols["messages"].docs.values()) == [1, 2]
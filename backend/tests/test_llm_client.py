@@ -0,0 +1,104 @@
+# tests/test_llm_client.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src import llm_client as llm
+from src.key_manager import KeyManager
+
+
+@pytest.fixture
+def keys(monkeypatch):
+    for name in [n for n in llm.os.environ if n.startswith("OPENROUTER_API_KEY_")]:
+        monkeypatch.delenv(name)
+    monkeypatch.setenv("OPENROUTER_API_KEY_1", "key-one")
+    monkeypatch.setenv("OPENROUTER_API_KEY_2", "key-two")
+    return KeyManager()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff delays the client asked for, without actually waiting."""
+    delays = []
+    real_sleep = llm.time.sleep
+    test_thread = threading.current_thread()
+
+    def sleep(seconds):
+        # time.sleep is patched process-wide; other threads keep sleeping for real
+        if threading.current_thread() is test_thread:
+            delays.append(seconds)
+        else:
+            real_sleep(seconds)
+
+    monkeypatch.setattr(llm.time, "sleep", sleep)
+    return delays
+
+
+@pytest.fixture
+def client(fake_openrouter, keys):
+    return llm.LLMClient(base_url=fake_openrouter.base_url, max_concurrency=4, timeout=5, max_retries=3, keys=keys)
+
+
+def test_retries_server_errors_then_succeeds(client, fake_openrouter, sleeps):
+    fake_openrouter.script = [{"status": 503}, {"status": 502}, {"reply": "  done  "}]
+    assert client.chat([{"role": "user", "content": "hi"}], "test-model") == "done"
+    assert len(fake_openrouter.requests) == 3
+    assert len(sleeps) == 2
+    assert all(0 <= d <= llm.BACKOFF_MAX_SEC for d in sleeps)
+
+
+def test_retry_after_sets_the_delay(client, fake_openrouter, sleeps):
+    fake_openrouter.script = [{"status": 503, "headers": {"Retry-After": "2"}}]
+    assert client.chat([{"role": "user", "content": "hi"}], "test-model") == "ok"
+    assert sleeps == [2.0]
+
+
+def test_throttled_key_rests_while_the_other_serves(client, fake_openrouter, keys, sleeps):
+    fake_openrouter.script = [{"status": 429, "headers": {"Retry-After": "120"}}]
+    assert client.chat([{"role": "user", "content": "hi"}], "test-model") == "ok"
+    (first, _), (second, _) = fake_openrouter.requests
+    assert first != second
+    assert keys.cooldown_remaining(first) > 100
+    assert keys.cooldown_remaining(second) == 0
+    assert sleeps == [0]
+
+
+def test_client_errors_are_not_retried(client, fake_openrouter, sleeps):
+    fake_openrouter.script = [{"status": 400}]
+    with pytest.raises(llm.LLMError) as err:
+        client.chat([{"role": "user", "content": "hi"}], "test-model")
+    assert err.value.status == 400
+    assert len(fake_openrouter.requests) == 1
+    assert sleeps == []
+
+
+def test_gives_up_after_max_retries(client, fake_openrouter, sleeps):
+    fake_openrouter.script = [{"status": 500}] * 3
+    with pytest.raises(llm.LLMError):
+        client.chat([{"role": "user", "content": "hi"}], "test-model")
+    assert len(fake_openrouter.requests) == 3
+
+
+def test_retry_after_http_date():
+    when = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 30))
+    assert 25 <= llm.retry_after_seconds(when) <= 30
+    assert llm.retry_after_seconds("soon") is None
+
+
+def test_stream_chat_relays_pieces(client, fake_openrouter, sleeps):
+    fake_openrouter.script = [{"status": 503}, {"stream": ["Hel", "lo", " there"]}]
+    pieces = list(client.stream_chat([{"role": "user", "content": "hi"}], "test-model", max_tokens=10))
+    assert pieces == ["Hel", "lo", " there"]
+    payload = fake_openrouter.requests[-1][1]
+    assert payload["stream"] is True and payload["max_tokens"] == 10
+
+
+def test_chat_many_and_achat_many_keep_order(client, fake_openrouter, sleeps):
+    conversations = [[{"role": "user", "content": str(i)}] for i in range(6)]
+    fake_openrouter.script = [{"status": 400}]
+    replies = client.chat_many(conversations, "test-model")
+    assert replies.count(None) == 1 and replies.count("ok") == 5
+    assert asyncio.run(client.achat_many(conversations, "test-model")) == ["ok"] * 6
+    assert len(fake_openrouter.requests) == 12
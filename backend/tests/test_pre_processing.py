@@ -0,0 +1,30 @@
+# tests/test_pre_processing.py
+import json
+import os
+
+import pytest
+
+from src.pre_processing import clean_email_body, iter_clean_email_body
+
+# Inputs with the output of the original chain of re.sub calls (baseline
+# clean_email_body): the sample emails, hand-written edge cases and seeded
+# random mixes of quotes, markers, sign-offs and contact details.
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "data", "clean_email_body_golden.json")
+with open(GOLDEN_PATH, encoding="utf-8") as f:
+    GOLDEN = json.load(f)
+
+
+@pytest.mark.parametrize("case", GOLDEN, ids=range(len(GOLDEN)))
+def test_clean_email_body_matches_golden(case):
+    assert clean_email_body(case["input"]) == case["expected"]
+
+
+@pytest.mark.parametrize("chunk_chars", [1, 16, 256])
+def test_streaming_variant_matches_golden(chunk_chars):
+    for case in GOLDEN:
+        assert " ".join(iter_clean_email_body(case["input"], chunk_chars)) == case["expected"], case["input"]
+
+
+def test_non_string_input():
+    assert clean_email_body(None) == ""
+    assert list(iter_clean_email_body(None)) == []
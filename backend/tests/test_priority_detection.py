@@ -0,0 +1,74 @@
+# tests/test_priority_detection.py
+import random
+from collections import Counter
+
+import pytest
+
+from src import priority_detection_flask as pd
+from src.model_registry import SPACY_MODEL
+
+
+def reference_counts(lemmas, lower):
+    """The original per-set scans: lemma lookups plus one substring check per multi-word entry."""
+    counts = Counter()
+    for name, kwset in (("high", pd.HIGH_KW), ("medium", pd.MED_KW), ("low", pd.LOW_KW)):
+        counts[name] = sum(1 for lemma in lemmas if lemma in kwset)
+        counts[name] += sum(1 for p in kwset if " " in p and p in lower)
+    return counts
+
+
+def reference_has_modal(sent_lower):
+    return any(m in sent_lower for m in pd.MODAL_WORDS)
+
+
+WORDS = ("thanks thank you thank-you follow up follow-up due by action required must should need to "
+         "have to mustard please kindly urgent update fyi review the a reminder, invitation. ought").split()
+
+
+def test_keyword_counts_match_the_substring_scorer():
+    rng = random.Random(24)
+    for _ in range(5000):
+        tokens = [rng.choice(WORDS) for _ in range(rng.randint(0, 15))]
+        text = " ".join(tokens)
+        lower = text.lower()
+        assert pd._keyword_counts(tokens, lower) == reference_counts(tokens, lower), text
+        assert pd._has_modal(lower) == reference_has_modal(lower), text
+
+
+@pytest.mark.parametrize("text, expected", [
+    # "thanks" is matched as written, not as the lemma "thank"
+    ("thank thank", {}),
+    ("thanks thanks", {"low": 2}),
+    # a multi-word entry counts once however often it occurs
+    ("thank you and thank you", {"low": 1}),
+    # "due" as a word and "due by" as a phrase both count
+    ("action required: follow up, due by friday", {"high": 3, "medium": 1}),
+])
+def test_keyword_counts_examples(text, expected):
+    assert +pd._keyword_counts(text.split(), text) == Counter(expected)
+
+
+def test_modals_are_substrings_of_the_sentence():
+    assert pd._has_modal("you must reply")
+    assert pd._has_modal("mustard")   # as the original scorer did
+    assert not pd._has_modal("you may reply")
+
+
+def test_documents_match_the_substring_scorer():
+    spacy = pytest.importorskip("spacy")
+    try:
+        nlp = spacy.load(SPACY_MODEL)
+    except OSError:
+        pytest.skip("spaCy model not installed")
+    samples = [
+        "The deadline for the NLP Project is on Oct 27th,2025. Please patch up all the remaining work.",
+        "This delay is unacceptable. The client is furious, and we need to resolve it now.",
+        "Just a friendly reminder about our meeting next month. Looking forward to catching up!",
+        "Thanks, thank you and thank you again! Action required: follow up, follow-up, due by Friday.",
+        "We must review the update; you have to submit it. Mustard is not a modal.",
+    ]
+    for doc, text in zip(nlp.pipe(samples), samples):
+        lemmas = [t.lemma_.lower() for t in doc if t.lemma_]
+        assert pd._keyword_counts(lemmas, text.lower()) == reference_counts(lemmas, text.lower()), text
+        for sent in doc.sents:
+            assert pd._has_modal(sent.text.lower()) == reference_has_modal(sent.text.lower()), sent.text
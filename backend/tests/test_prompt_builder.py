@@ -0,0 +1,62 @@
+# tests/test_prompt_builder.py
+import pytest
+
+from src.pre_processing import clean_email_body
+from src.prompt_builder import OMITTED, dedupe_messages, fit_to_budget
+
+# Realistic clean_message text: what pre_processing stores (one line, ":" removed)
+ORIGINAL = clean_email_body(
+    "Subject: Q3 budget review\n\nJane,\n\nCan we move the Q3 budget review to Thursday afternoon? The finance team "
+    "needs two more days to close the numbers for the west region.\n\nJohn")
+REPLY = clean_email_body(
+    "Subject: RE: Q3 budget review\n\nNo. Thursday does not work for legal, let's keep Tuesday and review west later.\n\n"
+    "-----Original Message-----\nFrom: Smith, John\nSent: Monday, May 14, 2001 4:39 PM\n"
+    "To: Doe, Jane\nSubject: Q3 budget review\n\n"
+    "Jane,\n\nCan we move the Q3 budget review to Thursday afternoon? The finance team "
+    "needs two more days to close the numbers for the west region.\n\nJohn")
+UNRELATED = "Lunch is on the third floor today, bring your own drinks."
+# a short quote inside a long reply (well under 80% of it)
+PARTIAL = clean_email_body(
+    "Subject: RE: Q3 budget review\n\nAbout your point that the finance team needs two more days "
+    "to close the numbers for the west region: I asked Sara and she can send the west figures by "
+    "Wednesday noon, so Tuesday's review can cover everything except the accruals, which we can "
+    "take offline with the controllers the following week.")
+
+
+@pytest.fixture
+def deduped():
+    return [m["text"] for m in dedupe_messages(
+        [{"text": ORIGINAL}, {"text": REPLY}, {"text": UNRELATED}, {"text": PARTIAL}])]
+
+
+def test_cleaned_reply_is_one_line():
+    assert "\n" not in REPLY and ":" not in REPLY
+
+
+def test_first_and_unrelated_messages_unchanged(deduped):
+    assert deduped[0] == ORIGINAL
+    assert deduped[2] == UNRELATED
+
+
+def test_quoted_original_dropped_new_text_kept(deduped):
+    assert deduped[1].startswith("No. Thursday does not work for legal, let's keep Tuesday")
+    assert "close the numbers" not in deduped[1]
+
+
+def test_short_quote_dropped_rest_of_reply_kept(deduped):
+    assert "close the numbers" not in deduped[3]
+    assert deduped[3].startswith("About your point that")
+    assert "accruals" in deduped[3]
+
+
+def test_context_counts_as_seen():
+    out = dedupe_messages([{"text": REPLY}], [{"text": ORIGINAL}])
+    assert "finance team" not in out[0]["text"]
+
+
+def test_fit_to_budget():
+    messages = [{"text": ORIGINAL}, {"text": REPLY}]
+    assert fit_to_budget(messages, token_budget=10_000) == messages
+    (only,) = fit_to_budget([{"text": PARTIAL}], token_budget=20)
+    assert only["text"].endswith(OMITTED)
+    assert len(only["text"]) <= 20 * 4 + len(OMITTED) + 1
@@ -0,0 +1,125 @@
+# tests/test_streaming.py
+import base64
+import json
+
+import pytest
+
+from src import smart_reply
+from src.key_manager import KeyManager
+from src.llm_client import LLMClient
+
+
+class FakeGmail:
+    """GmailClient stand-in for the routes: a fixed unread inbox."""
+
+    def __init__(self, credentials=None):
+        pass
+
+    messages = {}
+
+    def get_profile(self):
+        return {"emailAddress": "me@example.com", "historyId": "500"}
+
+    def list_message_ids(self, label_ids=None, max_results=5):
+        return list(self.messages)
+
+    def fetch_messages(self, ids, format="full", metadata_headers=None):
+        return [self.messages[i] for i in ids if i in self.messages]
+
+
+def gmail_message(msg_id, subject, body):
+    return {
+        "id": msg_id, "threadId": "t-" + msg_id, "snippet": body,
+        "payload": {"mimeType": "text/plain", "headers": [{"name": "Subject", "value": subject},
+                                                          {"name": "From", "value": "Ann <ann@example.com>"}],
+                    "body": {"data": base64.urlsafe_b64encode(body.encode()).decode()}}
+    }
+
+
+def sse_events(response):
+    """(event, data) pairs of a text/event-stream body, keep-alive comments skipped."""
+    events = []
+    for block in b"".join(response.response).decode().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def backend(sqlite_db, monkeypatch):
+    import app as backend
+    monkeypatch.setattr(backend, "GmailClient", FakeGmail)
+    monkeypatch.setattr(backend, "Credentials", lambda **kwargs: None)
+    monkeypatch.setattr(backend.app, "secret_key", "test-secret")
+    return backend
+
+
+@pytest.fixture
+def signed_in(backend):
+    client = backend.app.test_client()
+    with client.session_transaction() as s:
+        s["credentials"] = {"token": "test-token"}
+        s["user_id"] = "me@example.com"
+    return client
+
+
+@pytest.fixture
+def reply_llm(fake_openrouter, monkeypatch):
+    client = LLMClient(base_url=fake_openrouter.base_url, max_retries=1, keys=KeyManager())
+    monkeypatch.setattr(smart_reply, "llm_client", client)
+    return fake_openrouter
+
+
+def test_generate_reply_streams_tokens(backend, signed_in, reply_llm, sqlite_db):
+    sqlite_db.save_emails("me@example.com", [{"id": "m1", "body": "Can we meet Friday?"}])
+    reply_llm.script = [{"stream": ["\n Sure", ", Friday", " works."]}]
+    r = signed_in.post("/generate_reply?stream=1", json={"message_id": "m1"}, buffered=False)
+    assert r.mimetype == "text/plain"
+    assert list(r.response) == [b"Sure", b", Friday", b" works."]
+    assert reply_llm.requests[0][1]["stream"] is True
+
+
+def test_generate_reply_stream_falls_back(backend, signed_in, reply_llm, sqlite_db):
+    sqlite_db.save_emails("me@example.com", [{"id": "m1", "body": "Can we meet Friday?"}])
+    reply_llm.script = [{"status": 503}]
+    r = signed_in.post("/generate_reply", json={"message_id": "m1", "stream": True}, buffered=False)
+    assert b"".join(r.response).decode() == smart_reply.FALLBACK_REPLY
+
+
+def test_fetch_emails_stream_events(backend, signed_in, sqlite_db, monkeypatch):
+    sqlite_db.save_emails("me@example.com", [{"id": "old", "subject": "Cached", "body": "seen before",
+                                              "summary": "s", "priority": "Low"}])
+    FakeGmail.messages = {
+        "old": gmail_message("old", "Cached", "seen before"),
+        "a": gmail_message("a", "Invoice", "Please pay the invoice today."),
+        "b": gmail_message("b", "Broken", "this one fails"),
+    }
+
+    def analyze(bodies, rate_limiter=None):
+        if any("fails" in b for b in bodies):
+            raise RuntimeError("model unavailable")
+        return [{"summary": "pay it", "priority": "High", "entities": []} for _ in bodies]
+
+    monkeypatch.setattr(backend, "analyze_emails", analyze)
+    monkeypatch.setattr(backend, "ANALYSIS_CHUNK", 1)
+    monkeypatch.setattr(backend, "STREAM_POLL_SEC", 0.05)
+
+    events = sse_events(signed_in.get("/fetch_emails/stream", buffered=False))
+    names = [name for name, _ in events]
+
+    # cached email first, then the placeholders, then the initial order
+    first = [(name, data["id"], data["priority"]) for name, data in events[:3]]
+    assert first[0] == ("email", "old", "Low")
+    assert sorted(first[1:]) == [("email", "a", "Pending"), ("email", "b", "Pending")]
+    assert events[3][0] == "order" and events[3][1][0] == "old"
+
+    analyzed = [data for name, data in events if name == "email" and data.get("status") == "done"]
+    assert [(e["id"], e["priority"], e["summary"]) for e in analyzed] == [("a", "High", "pay it")]
+    assert [data["ids"] for name, data in events if name == "failed"] == [["b"]]
+    assert ("order", ["a", "old", "b"]) in events
+    assert names[-1] == "done"
+    done = events[-1][1]
+    assert done["count"] == 3
+    assert [j["status"] for j in done["jobs"]] == ["done"]
+    assert [j["failed"] for j in done["jobs"]] == [1]
@@ -0,0 +1,67 @@
+# tests/test_thread_scheduler.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from src import thread_scheduler
+from src.thread_scheduler import NOT_READY, ThreadScheduler
+
+
+class ThreadsCollection:
+    """Claims hand out the stored doc; updates are only recorded."""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.updates = []
+
+    def find_one_and_update(self, query, update):
+        return dict(self.doc)
+
+    def update_one(self, query, update):
+        self.updates.append(update)
+
+
+def run_one(result, failures=None):
+    doc = {"_id": "T1", "version": 2}
+    if failures:
+        doc["failures"] = failures
+    threads = ThreadsCollection(doc)
+
+    def refresh(thread):
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    scheduler = ThreadScheduler(threads, refresh)
+    ok, _, summary = scheduler._run_one("T1")
+    return scheduler, threads.updates, ok, summary
+
+
+def test_a_thread_that_is_not_ready_waits_briefly_without_a_failure():
+    before = datetime.now()
+    scheduler, updates, ok, summary = run_one((NOT_READY, "partial"), failures=3)
+    assert not ok and summary == "partial"
+    [update] = updates
+    assert "failures" not in update["$set"]
+    assert update["$unset"] == {"claimed_until": ""}
+    wait = update["$set"]["retry_at"] - before
+    assert timedelta(seconds=thread_scheduler.SCHEDULER_WAIT_SEC) <= wait < timedelta(
+        seconds=thread_scheduler.SCHEDULER_WAIT_SEC + 5)
+    assert (scheduler.waiting, scheduler.failed, scheduler.processed) == (1, 0, 0)
+
+
+@pytest.mark.parametrize("result", [(False, None), RuntimeError("model down")])
+def test_a_failed_refresh_backs_off(result):
+    before = datetime.now()
+    scheduler, [update], ok, _ = run_one(result, failures=3)
+    assert not ok
+    assert update["$set"]["failures"] == 4
+    assert update["$set"]["retry_at"] - before >= thread_scheduler.retry_delay(4)
+    assert (scheduler.waiting, scheduler.failed) == (0, 1)
+
+
+def test_a_done_refresh_marks_the_thread_clean():
+    scheduler, updates, ok, summary = run_one((True, "summary"))
+    assert ok and summary == "summary"
+    assert updates[0]["$set"] == {"dirty": False, "processed_version": 2}
+    assert scheduler.processed == 1
@@ -0,0 +1,137 @@
+# tests/test_threading_engine.py
+import pytest
+
+from src import thread_manager
+from src.thread_index import ThreadIndex
+from src.threading_engine import ThreadingEngine, allocate_seq, load_related
+
+
+class FakeCollection:
+    """Just enough of a pymongo collection for add_to_thread(); writes go to a shared log."""
+
+    def __init__(self, name, log, docs=()):
+        self.name = name
+        self.log = log
+        self.docs = {d["_id"]: d for d in docs}
+
+    def find(self, query=None, projection=None):
+        return list(self.docs.values())
+
+    def find_one(self, query=None, projection=None):
+        return None
+
+    def insert_one(self, doc):
+        self.log.append((self.name, "insert", dict(doc)))
+        self.docs[doc.get("_id", len(self.docs))] = doc
+
+    def update_one(self, query, update):
+        self.log.append((self.name, "update", update))
+
+    def find_one_and_update(self, query, update, projection=None, return_document=None):
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            return None
+        for field, n in update["$inc"].items():
+            doc[field] = doc.get(field, 0) + n
+        return doc
+
+
+def stored(message_id, thread_id, references=()):
+    return {"_id": message_id, "message_id": message_id, "thread_id": thread_id, "references": list(references)}
+
+
+def new_engine():
+    return ThreadingEngine(ThreadIndex(path=None))
+
+
+def test_loading_a_reply_filed_under_another_thread_merges_the_threads():
+    engine = new_engine()
+    # the reply was stored (thread T2) before its parent (thread T1)
+    count, merges = engine.load([stored("<b>", "T2", ["<a>"]), stored("<a>", "T1")])
+    assert count == 2
+    assert merges == [("T1", "T2")]
+    assert engine.thread_of("<a>") == engine.thread_of("<b>") == "T2"
+
+
+def test_loading_a_message_that_links_two_stored_trees_merges_them():
+    engine = new_engine()
+    count, merges = engine.load([stored("<c>", "T2", ["<b>"]), stored("<a>", "T1"), stored("<b>", "T1", ["<a>"])])
+    assert merges == [("T2", "T1")]
+    assert engine.canonical("T2") == "T1"
+
+
+def test_loading_one_stored_thread_merges_nothing():
+    engine = new_engine()
+    _, merges = engine.load([stored("<b>", "T1", ["<a>"]), stored("<a>", "T1"), stored("<c>", "T1", ["<a>", "<b>"])])
+    assert merges == []
+
+
+def test_load_related_returns_the_merges_of_what_it_loads():
+    engine = new_engine()
+    engine.add("<a>", thread_id="T1")
+    messages = FakeCollection("messages", [], [stored("<b>", "T2", ["<a>"]), stored("<c>", "T2", ["<b>"])])
+    count, merges = load_related(engine, messages, [{"message_id": "<a>"}])
+    assert count == 2
+    assert merges == [("T2", "T1")]
+
+
+def test_allocate_seq_refuses_a_thread_that_is_not_stored():
+    with pytest.raises(LookupError):
+        allocate_seq(FakeCollection("threads", []), "gone")
+    threads = FakeCollection("threads", [], [{"_id": "T1", "message_seq": 3}])
+    assert allocate_seq(threads, "T1", 2) == 4
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    log, merged = [], []
+    index = ThreadIndex(path=None)
+    monkeypatch.setattr(thread_manager, "engine", ThreadingEngine(index))
+    monkeypatch.setattr(thread_manager, "thread_index", index)
+    monkeypatch.setattr(thread_manager, "threads_col", FakeCollection("threads", log))
+    monkeypatch.setattr(thread_manager, "messages_col", FakeCollection("messages", log))
+    monkeypatch.setattr(thread_manager, "merge_threads",
+                        lambda threads, messages, merged_id, surviving_id, *a, **k: merged.append((merged_id, surviving_id)))
+    return thread_manager, log, merged
+
+
+def email(message_id, subject="Budget", in_reply_to=None):
+    return {"message_id": message_id, "in_reply_to": in_reply_to, "references": [in_reply_to] if in_reply_to else [],
+            "subject": subject, "normalized_subject": subject.lower(),
+            "from": {"email": "a@example.com"}, "to": [{"email": "b@example.com"}], "cc": []}
+
+
+def test_a_new_thread_is_stored_with_its_counter_before_its_first_message(manager):
+    tm, log, _ = manager
+    tid = tm.add_to_thread(email("<a>"), "e1")
+    assert [(col, op) for col, op, _ in log] == [("threads", "insert"), ("messages", "insert"), ("threads", "update")]
+    thread, message, update = (entry[2] for entry in log)
+    assert thread["_id"] == tid and thread["message_seq"] == 1 and thread["dirty"] is False
+    assert message["seq"] == 1
+    assert update["$set"]["dirty"] is True and update["$inc"] == {"version": 1}
+
+
+def test_a_reply_is_numbered_from_the_stored_counter(manager):
+    tm, log, _ = manager
+    tid = tm.add_to_thread(email("<a>"), "e1")
+    # another writer added a message in between
+    tm.threads_col.docs[tid]["message_seq"] = 2
+    assert tm.add_to_thread(email("<b>", "Re: Budget", in_reply_to="<a>"), "e2") == tid
+    assert [e[2]["seq"] for e in log if e[:2] == ("messages", "insert")] == [1, 3]
+
+
+def test_add_to_thread_folds_stored_threads_its_lookup_links(manager):
+    tm, _, merged = manager
+    tm.messages_col.docs = {d["_id"]: d for d in [stored("<b>", "T2", ["<a>"]), stored("<a>", "T1")]}
+    tm.threads_col.docs = {"T2": {"_id": "T2", "message_seq": 1}}
+    assert tm.add_to_thread(email("<c>", in_reply_to="<b>"), "e3") == "T2"
+    assert merged == [("T1", "T2")]
+
+
+def test_init_threading_folds_linked_stored_threads(manager, monkeypatch):
+    tm, _, merged = manager
+    for name in ("init_thread_index", "ensure_message_indexes", "migrate_embedded_messages", "ensure_message_seq"):
+        monkeypatch.setattr(tm, name, lambda *a: 0)
+    messages = FakeCollection("messages", [], [stored("<b>", "T2", ["<a>"]), stored("<a>", "T1")])
+    tm.init_threading(FakeCollection("threads", []), messages)
+    assert merged == [("T1", "T2")]
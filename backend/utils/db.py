@@ -1,71 +1,453 @@
 # src/db.py
 import sqlite3
+import json
 import os
+import threading
+import time
+from contextlib import contextmanager
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "emails_cache.db")
 
+# sqlite3 keeps compiled statements per connection, keyed by SQL text, so the
+# statements below are prepared once per thread and reused afterwards.
+STATEMENT_CACHE_SIZE = 128
+BUSY_TIMEOUT_SEC = 30
+
+SAVE_EMAIL_SQL = """
+    INSERT OR REPLACE INTO emails (user_id, id, thread_id, subject, sender, body, summary, priority, entities, is_unread)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+"""
+EMAIL_COLUMNS = "id, thread_id, subject, sender, body, summary, priority, entities"
+# json_each keeps the IN-list a single bound parameter, so the statement stays cacheable
+CACHED_IDS_SQL = "SELECT id FROM emails WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))"
+JOB_COLUMNS = "id, kind, status, total, completed, failed, error, created_at, started_at, finished_at"
+ACTIVE_JOB_STATUSES = "('queued', 'running')"
+
+_local = threading.local()
+
+
+def get_connection():
+    """
+    Return this thread's connection, opening it on first use.
+    Connections are never shared between threads or across a fork.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid() and _local.path == DB_PATH:
+        return conn
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_SEC, cached_statements=STATEMENT_CACHE_SIZE)
+    # WAL lets readers in other workers proceed while one writer commits
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _local.conn = conn
+    _local.pid = os.getpid()
+    _local.path = DB_PATH
+    return conn
+
+
+def close_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+
+@contextmanager
+def transaction():
+    """Commit on success, roll back on error."""
+    conn = get_connection()
+    with conn:
+        yield conn
+
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS emails (
-            user_id TEXT,
-            id TEXT,
-            thread_id TEXT,
-            subject TEXT,
-            sender TEXT,
-            body TEXT,
-            summary TEXT,
-            priority TEXT,
-            PRIMARY KEY (user_id, id)
-        )
-    """)
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS emails (
+                user_id TEXT,
+                id TEXT,
+                thread_id TEXT,
+                subject TEXT,
+                sender TEXT,
+                body TEXT,
+                summary TEXT,
+                priority TEXT,
+                entities TEXT,
+                is_unread INTEGER DEFAULT 1,
+                PRIMARY KEY (user_id, id)
+            )
+        """)
+        # older caches were created before these columns existed
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(emails)")}
+        if "entities" not in columns:
+            conn.execute("ALTER TABLE emails ADD COLUMN entities TEXT")
+        if "is_unread" not in columns:
+            conn.execute("ALTER TABLE emails ADD COLUMN is_unread INTEGER DEFAULT 1")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_emails_user_thread ON emails (user_id, thread_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_emails_user_priority ON emails (user_id, priority)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                user_id TEXT PRIMARY KEY,
+                history_id TEXT
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                key TEXT PRIMARY KEY,
+                result TEXT,
+                created_at REAL
+            )
+        """)
+        # background jobs, shared by all web workers (see src/job_queue.py)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT,
+                kind TEXT,
+                status TEXT,
+                total INTEGER DEFAULT 0,
+                completed INTEGER DEFAULT 0,
+                failed INTEGER DEFAULT 0,
+                error TEXT,
+                pid INTEGER,
+                created_at REAL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs (user_id, status)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT,
+                event TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id, seq)")
+        # one row per inbox sync (keyed by its analysis job) until the stored
+        # historyId has moved past it, see src/inbox_sync.commit_sync
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_checkpoints (
+                id TEXT PRIMARY KEY,
+                user_id TEXT,
+                history_id TEXT,
+                status TEXT,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sync_checkpoints_user ON sync_checkpoints (user_id)")
+        # messages an analysis job has taken on; one job per message at a time
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS pending_analysis (
+                user_id TEXT,
+                id TEXT,
+                job_id TEXT,
+                email TEXT,
+                PRIMARY KEY (user_id, id)
+            )
+        """)
 
-def save_email(user_id, email_data):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT OR REPLACE INTO emails (user_id, id, thread_id, subject, sender, body, summary, priority)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
+
+def _email_row(user_id, email_data):
+    return (
         user_id,
         email_data["id"],
-        email_data.get("thread_id"),
+        email_data.get("threadId") or email_data.get("thread_id"),
         email_data.get("subject"),
         email_data.get("from"),
         email_data.get("body", ""),
         email_data.get("summary", ""),
         email_data.get("priority", "Medium"),
-    ))
-    conn.commit()
-    conn.close()
+        json.dumps(email_data.get("entities") or []),
+    )
+
+
+def _email_dict(r):
+    return {
+        "id": r[0],
+        "threadId": r[1],
+        "subject": r[2],
+        "from": r[3],
+        "body": r[4],
+        "summary": r[5],
+        "priority": r[6],
+        "entities": json.loads(r[7]) if r[7] else []
+    }
+
+
+def save_email(user_id, email_data):
+    save_emails(user_id, [email_data])
+
+
+def save_emails(user_id, emails):
+    """Write many analyzed emails in a single transaction."""
+    rows = [_email_row(user_id, e) for e in emails]
+    if not rows:
+        return
+    with transaction() as conn:
+        conn.executemany(SAVE_EMAIL_SQL, rows)
+
 
 def get_email_body(user_id, message_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT body FROM emails WHERE user_id = ? AND id = ?", (user_id, message_id))
-    result = cursor.fetchone()
-    conn.close()
+    result = get_connection().execute(
+        "SELECT body FROM emails WHERE user_id = ? AND id = ?", (user_id, message_id)).fetchone()
     return result[0] if result else None
 
-def get_emails_from_db(user_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, thread_id, subject, sender, body, summary, priority FROM emails WHERE user_id = ?", (user_id,))
-    rows = cursor.fetchall()
-    conn.close()
-    emails = []
-    for r in rows:
-        emails.append({
-            "id": r[0],
-            "threadId": r[1],
-            "subject": r[2],
-            "from": r[3],
-            "body": r[4],
-            "summary": r[5],
-            "priority": r[6]
-        })
-    return emails
+
+def get_emails_from_db(user_id, unread_only=False):
+    if unread_only:
+        rows = get_connection().execute(
+            f"SELECT {EMAIL_COLUMNS} FROM emails WHERE user_id = ? AND is_unread = 1", (user_id,)).fetchall()
+    else:
+        rows = get_connection().execute(
+            f"SELECT {EMAIL_COLUMNS} FROM emails WHERE user_id = ?", (user_id,)).fetchall()
+    return [_email_dict(r) for r in rows]
+
+
+def get_thread_emails(user_id, thread_id):
+    rows = get_connection().execute(
+        f"SELECT {EMAIL_COLUMNS} FROM emails WHERE user_id = ? AND thread_id = ?", (user_id, thread_id)).fetchall()
+    return [_email_dict(r) for r in rows]
+
+
+def get_emails_by_priority(user_id, priority):
+    rows = get_connection().execute(
+        f"SELECT {EMAIL_COLUMNS} FROM emails WHERE user_id = ? AND priority = ?", (user_id, priority)).fetchall()
+    return [_email_dict(r) for r in rows]
+
+
+def get_cached_ids(user_id, message_ids):
+    """Return the subset of message_ids that already have an analyzed row."""
+    message_ids = list(message_ids)
+    if not message_ids:
+        return set()
+    rows = get_connection().execute(CACHED_IDS_SQL, (user_id, json.dumps(message_ids))).fetchall()
+    return {r[0] for r in rows}
+
+
+def set_unread(user_id, message_ids, is_unread):
+    message_ids = list(message_ids)
+    if not message_ids:
+        return
+    with transaction() as conn:
+        conn.executemany("UPDATE emails SET is_unread = ? WHERE user_id = ? AND id = ?",
+                         [(1 if is_unread else 0, user_id, mid) for mid in message_ids])
+
+
+def replace_unread_set(user_id, message_ids):
+    """Mark exactly message_ids as unread for this user (used by a full resync)."""
+    with transaction() as conn:
+        conn.execute("UPDATE emails SET is_unread = 0 WHERE user_id = ?", (user_id,))
+        conn.executemany("UPDATE emails SET is_unread = 1 WHERE user_id = ? AND id = ?",
+                         [(user_id, mid) for mid in message_ids])
+
+
+def delete_emails(user_id, message_ids):
+    message_ids = list(message_ids)
+    if not message_ids:
+        return
+    with transaction() as conn:
+        conn.executemany("DELETE FROM emails WHERE user_id = ? AND id = ?",
+                         [(user_id, mid) for mid in message_ids])
+
+
+def get_history_id(user_id):
+    result = get_connection().execute(
+        "SELECT history_id FROM sync_state WHERE user_id = ?", (user_id,)).fetchone()
+    return result[0] if result else None
+
+
+def set_history_id(user_id, history_id):
+    with transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO sync_state (user_id, history_id) VALUES (?, ?)",
+                     (user_id, str(history_id)))
+
+
+def begin_sync_checkpoint(user_id, sync_id):
+    """Record a sync in flight; call it before the stored historyId is read."""
+    with transaction() as conn:
+        conn.execute("INSERT INTO sync_checkpoints (id, user_id, status, started_at) VALUES (?, ?, 'pending', ?)",
+                     (sync_id, user_id, time.time()))
+
+
+def finish_sync_checkpoint(sync_id, history_id, ok):
+    with transaction() as conn:
+        conn.execute("UPDATE sync_checkpoints SET history_id = ?, status = ?, finished_at = ? WHERE id = ?",
+                     (str(history_id) if history_id else None, "done" if ok else "failed", time.time(), sync_id))
+
+
+def delete_sync_checkpoint(sync_id):
+    with transaction() as conn:
+        conn.execute("DELETE FROM sync_checkpoints WHERE id = ?", (sync_id,))
+
+
+def advance_history_id(user_id):
+    """
+    Move the stored historyId to the newest finished sync, but only once no
+    sync of the user is still in flight or failed. A failed sync stops
+    blocking when a later one that started after it failed has succeeded:
+    that one replayed the same history and took its messages on again.
+    Returns the historyId stored, or None when it could not move.
+    """
+    with transaction() as conn:
+        # syncs whose job died with its worker count as failed
+        conn.execute(f"UPDATE sync_checkpoints SET status = 'failed', "
+                     f"finished_at = COALESCE((SELECT finished_at FROM jobs WHERE jobs.id = sync_checkpoints.id), ?) "
+                     f"WHERE user_id = ? AND status = 'pending' AND id NOT IN "
+                     f"(SELECT id FROM jobs WHERE status IN {ACTIVE_JOB_STATUSES})", (time.time(), user_id))
+        rows = conn.execute("SELECT id, history_id, status, started_at, finished_at FROM sync_checkpoints "
+                            "WHERE user_id = ?", (user_id,)).fetchall()
+        if not rows or any(status == "pending" for _, _, status, _, _ in rows):
+            return None
+        done = [r for r in rows if r[2] == "done"]
+        last_start = max((r[3] for r in done), default=None)
+        superseded = [r[0] for r in rows if r[2] == "failed" and last_start is not None and r[4] < last_start]
+        conn.executemany("DELETE FROM sync_checkpoints WHERE id = ?", [(i,) for i in superseded])
+        if len(superseded) < len(rows) - len(done):
+            return None   # a failure nobody has retried yet
+        conn.executemany("DELETE FROM sync_checkpoints WHERE id = ?", [(r[0],) for r in done])
+        stored = conn.execute("SELECT history_id FROM sync_state WHERE user_id = ?", (user_id,)).fetchone()
+        candidates = [int(r[1]) for r in done if r[1]] + ([int(stored[0])] if stored and stored[0] else [])
+        if not candidates:
+            return None
+        history_id = str(max(candidates))
+        conn.execute("INSERT OR REPLACE INTO sync_state (user_id, history_id) VALUES (?, ?)", (user_id, history_id))
+        return history_id
+
+
+def get_cached_analysis(key, min_created_at=0):
+    """Return the cached analysis for `key` if it is newer than `min_created_at`."""
+    result = get_connection().execute(
+        "SELECT result FROM analysis_cache WHERE key = ? AND created_at >= ?", (key, min_created_at)).fetchone()
+    return json.loads(result[0]) if result else None
+
+
+def save_cached_analysis(key, result, created_at):
+    with transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO analysis_cache (key, result, created_at) VALUES (?, ?, ?)",
+                     (key, json.dumps(result), created_at))
+
+
+def prune_cached_analysis(older_than) -> int:
+    """Delete entries created before `older_than`; returns how many were removed."""
+    with transaction() as conn:
+        return conn.execute("DELETE FROM analysis_cache WHERE created_at < ?", (older_than,)).rowcount
+
+
+# ---------- Background jobs ----------
+def _job_dict(r):
+    return dict(zip(["id", "kind", "status", "total", "completed", "failed", "error",
+                     "created_at", "started_at", "finished_at"], r))
+
+
+def insert_job(job, user_id, pid):
+    with transaction() as conn:
+        conn.execute(f"INSERT INTO jobs ({JOB_COLUMNS}, user_id, pid) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (job["id"], job["kind"], job["status"], job["total"], job["completed"], job["failed"],
+                      job["error"], job["created_at"], job["started_at"], job["finished_at"], user_id, pid))
+
+
+def update_job(job_id, **fields):
+    """Set job columns (status, total, error, started_at, finished_at)."""
+    names = [n for n in ("status", "total", "error", "started_at", "finished_at") if n in fields]
+    if not names:
+        return
+    with transaction() as conn:
+        conn.execute(f"UPDATE jobs SET {', '.join(n + ' = ?' for n in names)} WHERE id = ?",
+                     [fields[n] for n in names] + [job_id])
+
+
+def advance_job(job_id, completed=0, failed=0):
+    with transaction() as conn:
+        conn.execute("UPDATE jobs SET completed = completed + ?, failed = failed + ? WHERE id = ?",
+                     (completed, failed, job_id))
+
+
+def delete_job(job_id):
+    with transaction() as conn:
+        conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+        conn.execute("DELETE FROM pending_analysis WHERE job_id = ?", (job_id,))
+
+
+def get_job(job_id, user_id=None):
+    sql, args = f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", [job_id]
+    if user_id is not None:
+        sql, args = sql + " AND user_id = ?", args + [user_id]
+    row = get_connection().execute(sql, args).fetchone()
+    return _job_dict(row) if row else None
+
+
+def get_user_jobs(user_id, active_only=False):
+    sql = f"SELECT {JOB_COLUMNS} FROM jobs WHERE user_id = ?"
+    if active_only:
+        sql += f" AND status IN {ACTIVE_JOB_STATUSES}"
+    return [_job_dict(r) for r in get_connection().execute(sql, (user_id,)).fetchall()]
+
+
+def get_active_job_pids():
+    """(job id, pid of the worker running it) for every queued or running job."""
+    return get_connection().execute(f"SELECT id, pid FROM jobs WHERE status IN {ACTIVE_JOB_STATUSES}").fetchall()
+
+
+def prune_jobs(finished_before):
+    """Delete jobs that finished before `finished_before`, with their events."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs WHERE finished_at < ?)",
+                     (finished_before,))
+        conn.execute("DELETE FROM jobs WHERE finished_at < ?", (finished_before,))
+
+
+def add_job_event(job_id, event):
+    with transaction() as conn:
+        conn.execute("INSERT INTO job_events (job_id, event) VALUES (?, ?)", (job_id, json.dumps(event, default=str)))
+
+
+def get_job_events(job_id, offset=0):
+    """Events of a job in publish order, skipping the first `offset`."""
+    rows = get_connection().execute(
+        "SELECT event FROM job_events WHERE job_id = ? ORDER BY seq LIMIT -1 OFFSET ?", (job_id, offset)).fetchall()
+    return [json.loads(r[0]) for r in rows]
+
+
+def claim_pending_analysis(user_id, job_id, message_ids):
+    """
+    Record that `job_id` analyzes these messages. Returns the ids it got:
+    those no active job (in any worker) has claimed already.
+    """
+    claimed = []
+    with transaction() as conn:
+        # claims of jobs that finished or died no longer count
+        conn.execute(f"DELETE FROM pending_analysis WHERE user_id = ? AND job_id NOT IN "
+                     f"(SELECT id FROM jobs WHERE status IN {ACTIVE_JOB_STATUSES})", (user_id,))
+        for mid in message_ids:
+            if conn.execute("INSERT OR IGNORE INTO pending_analysis (user_id, id, job_id) VALUES (?, ?, ?)",
+                            (user_id, mid, job_id)).rowcount:
+                claimed.append(mid)
+    return claimed
+
+
+def set_pending_emails(user_id, emails):
+    """Store the fetched emails of claimed messages (shown as placeholders meanwhile)."""
+    with transaction() as conn:
+        conn.executemany("UPDATE pending_analysis SET email = ? WHERE user_id = ? AND id = ?",
+                         [(json.dumps(e), user_id, e["id"]) for e in emails])
+
+
+def get_pending_analysis(user_id):
+    """(job id, message id, email or None while it is being fetched) per message in flight."""
+    rows = get_connection().execute(
+        f"SELECT p.job_id, p.id, p.email FROM pending_analysis p JOIN jobs j ON j.id = p.job_id "
+        f"WHERE p.user_id = ? AND j.status IN {ACTIVE_JOB_STATUSES}", (user_id,)).fetchall()
+    return [(job_id, mid, json.loads(email) if email else None) for job_id, mid, email in rows]
+
+
+def release_pending_analysis(user_id, message_ids=None, job_id=None):
+    """Drop claims: the given messages, or everything `job_id` still holds."""
+    with transaction() as conn:
+        if message_ids is not None:
+            conn.executemany("DELETE FROM pending_analysis WHERE user_id = ? AND id = ?",
+                             [(user_id, mid) for mid in message_ids])
+        if job_id is not None:
+            conn.execute("DELETE FROM pending_analysis WHERE user_id = ? AND job_id = ?", (user_id, job_id))
@@ -0,0 +1,6 @@
+# wsgi.py
+# gunicorn entry point: gunicorn -c gunicorn.conf.py
+# With preload_app this runs once in the master, before the workers fork.
+from app import create_app
+
+app = create_app(prefork=True)